@@ -0,0 +1,83 @@
+# bench_grafo.py
+"""
+Benchmark da construção do grafo de conflitos.
+
+Compara a varredura par-a-par (O(n²)) com a construção por índices invertidos
+de grafo.construir_grafo. Os cenários mantêm fixo o nº de conflitos por
+disciplina (semestres e professores crescem junto com n), então o nº de
+arestas cresce linearmente: o tempo da versão indexada deve acompanhar as
+arestas, enquanto o da varredura cresce com n².
+
+Uso:
+    python bench_grafo.py            # tamanhos padrão
+    python bench_grafo.py 500 2000   # tamanhos escolhidos
+"""
+import sys
+import time
+import networkx as nx
+
+from grafo import construir_grafo, _tokens_prof, _norm_semestre
+
+
+def _construir_grafo_pares(disciplinas, conflito_por_prof=True, conflito_por_semestre=True):
+    """Referência: comparação de todos os pares (implementação anterior)."""
+    G = nx.Graph()
+    G.add_nodes_from(d["nome"] for d in disciplinas)
+    for i in range(len(disciplinas)):
+        for j in range(i + 1, len(disciplinas)):
+            d1, d2 = disciplinas[i], disciplinas[j]
+            add_edge = False
+            if conflito_por_prof:
+                profs1 = _tokens_prof(d1.get("prof", ""))
+                profs2 = _tokens_prof(d2.get("prof", ""))
+                if profs1 and profs2 and (profs1 & profs2):
+                    add_edge = True
+            if not add_edge and conflito_por_semestre:
+                s1 = _norm_semestre(d1.get("semestre", ""))
+                s2 = _norm_semestre(d2.get("semestre", ""))
+                if s1 and s2 and s1 == s2:
+                    add_edge = True
+            if add_edge:
+                G.add_edge(d1["nome"], d2["nome"])
+    return G
+
+
+def gerar_disciplinas(n, por_semestre=8, aulas_por_prof=3):
+    """n disciplinas; ~por_semestre por semestre e ~aulas_por_prof por professor."""
+    out = []
+    for i in range(n):
+        out.append({
+            "nome": f"D{i:05d}",
+            "prof": f"P{i // aulas_por_prof}|P{(i * 7) // aulas_por_prof % max(1, n // aulas_por_prof)}",
+            "semestre": str(i // por_semestre),
+        })
+    return out
+
+
+def _tempo(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return time.perf_counter() - t0, res
+
+
+def main(tamanhos):
+    print(f"{'n':>7} {'arestas':>9} {'indexado (s)':>13} {'pares (s)':>11} {'idx/aresta (us)':>16}")
+    for n in tamanhos:
+        discs = gerar_disciplinas(n)
+        t_idx, G = _tempo(construir_grafo, discs)
+
+        # a referência O(n²) fica inviável em n grande; limita para não travar
+        if n <= 2000:
+            t_ref, G_ref = _tempo(_construir_grafo_pares, discs)
+            assert nx.utils.edges_equal(G.edges(), G_ref.edges()), "grafos diferentes!"
+            ref_txt = f"{t_ref:11.3f}"
+        else:
+            ref_txt = f"{'-':>11}"
+
+        m = max(1, G.number_of_edges())
+        print(f"{n:7d} {G.number_of_edges():9d} {t_idx:13.4f} {ref_txt} {1e6 * t_idx / m:16.2f}")
+
+
+if __name__ == "__main__":
+    tamanhos = [int(x) for x in sys.argv[1:]] or [250, 500, 1000, 2000, 16000, 64000]
+    main(tamanhos)
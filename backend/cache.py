@@ -0,0 +1,182 @@
+# cache.py
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+
+from database import SessionLocal
+from models import CacheResultado
+from logs import obter_logger
+
+log = obter_logger("cache")
+
+
+class CacheResultados:
+    """
+    Cache de resultados por chave de conteúdo (hash da entrada normalizada).
+      - LRU limitado em memória;
+      - camada opcional no banco (tabela cache_resultados), que sobrevive a
+        reinícios do servidor; podada a cada gravação: sai o que não é lido
+        há mais de max_idade_s e, acima de max_itens_disco, os menos
+        recentemente lidos (0 desliga cada limite);
+      - single-flight: pedidos idênticos simultâneos esperam o mesmo cálculo.
+    Erros não são guardados.
+    """
+
+    def __init__(self, max_itens=128, persistir=True, max_itens_disco=10000,
+                 max_idade_s=30 * 24 * 3600):
+        self.max_itens = max_itens
+        self.persistir = persistir
+        self.max_itens_disco = max_itens_disco
+        self.max_idade_s = max_idade_s
+        self._itens = OrderedDict()
+        self._em_voo = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.removidos_disco = 0
+
+    def _memoria(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                return self._itens[chave]
+        return None
+
+    def _guardar_memoria(self, chave, resultado):
+        with self._lock:
+            self._itens[chave] = resultado
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def _disco(self, chave):
+        if not self.persistir:
+            return None
+        db = SessionLocal()
+        try:
+            item = db.query(CacheResultado).filter(CacheResultado.chave == chave).first()
+            if item is None:
+                return None
+            # só hits do banco tocam acessado_em (os da memória não chegam aqui)
+            item.acessado_em = datetime.now(timezone.utc)
+            resultado = item.resultado_json
+            db.commit()
+            return resultado
+        except Exception as e:
+            log.error("Erro ao ler cache no banco: %s", e)
+            return None
+        finally:
+            db.close()
+
+    def _guardar_disco(self, chave, resultado):
+        if not self.persistir:
+            return
+        db = SessionLocal()
+        try:
+            agora = datetime.now(timezone.utc)
+            db.merge(CacheResultado(chave=chave, resultado_json=resultado, acessado_em=agora))
+            db.flush()
+            removidos = self._podar_disco(db, agora)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            log.error("Erro ao salvar cache no banco: %s", e)
+        else:
+            if removidos:
+                with self._lock:
+                    self.removidos_disco += removidos
+        finally:
+            db.close()
+
+    def _podar_disco(self, db, agora):
+        """Remove o que passou dos limites do banco; devolve quantas linhas saíram."""
+        # linhas de antes da coluna acessado_em contam pelo criado_em
+        acesso = func.coalesce(CacheResultado.acessado_em, CacheResultado.criado_em)
+        removidos = 0
+        if self.max_idade_s:
+            limite = agora - timedelta(seconds=self.max_idade_s)
+            removidos += db.execute(
+                delete(CacheResultado).where(acesso < limite)
+            ).rowcount or 0
+        if self.max_itens_disco:
+            excesso = db.scalar(select(func.count()).select_from(CacheResultado)) - self.max_itens_disco
+            if excesso > 0:
+                antigas = select(CacheResultado.chave).order_by(acesso.asc()).limit(excesso)
+                removidos += db.execute(
+                    delete(CacheResultado).where(CacheResultado.chave.in_(antigas.scalar_subquery()))
+                ).rowcount or 0
+        return removidos
+
+    def obter_ou_calcular(self, chave, calcular):
+        """
+        Retorna (resultado, origem), origem em
+        "memoria" | "disco" | "coalescido" | "calculado".
+        """
+        resultado = self._memoria(chave)
+        if resultado is not None:
+            with self._lock:
+                self.hits += 1
+            return copy.deepcopy(resultado), "memoria"
+
+        with self._lock:
+            voo = self._em_voo.get(chave)
+            dono = voo is None
+            if dono:
+                voo = Future()
+                self._em_voo[chave] = voo
+
+        if not dono:
+            resultado = voo.result()  # repropaga a exceção do cálculo original
+            with self._lock:
+                self.hits += 1
+            return copy.deepcopy(resultado), "coalescido"
+
+        try:
+            resultado = self._disco(chave)
+            origem = "disco"
+            if resultado is None:
+                origem = "calculado"
+                resultado = calcular()
+                self._guardar_disco(chave, resultado)
+            self._guardar_memoria(chave, resultado)
+            with self._lock:
+                if origem == "disco":
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            voo.set_result(resultado)
+            return copy.deepcopy(resultado), origem
+        except BaseException as e:
+            voo.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+        if self.persistir:
+            db = SessionLocal()
+            try:
+                db.query(CacheResultado).delete()
+                db.commit()
+            finally:
+                db.close()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "itens_memoria": len(self._itens),
+                "max_itens": self.max_itens,
+                "persistir": self.persistir,
+                "max_itens_disco": self.max_itens_disco,
+                "max_idade_s": self.max_idade_s,
+                "removidos_disco": self.removidos_disco,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
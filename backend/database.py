@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./geracoes.db")
@@ -11,6 +11,39 @@ engine = create_engine(
     ),
 )
 
+if DATABASE_URL.startswith("sqlite"):
+
+    @event.listens_for(engine, "connect")
+    def _pragmas_sqlite(conexao, _registro):
+        # WAL: leitores não bloqueiam o gravador (e vice-versa); busy_timeout
+        # faz os workers de jobs esperarem o lock em vez de falhar.
+        cur = conexao.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def adicionar_colunas_novas():
+    """
+    create_all não altera tabelas que já existem: acrescenta (ALTER TABLE ADD
+    COLUMN) as colunas dos modelos que faltam no banco e cria os índices que
+    faltam.
+    """
+    insp = inspect(engine)
+    with engine.begin() as con:
+        for tabela in Base.metadata.sorted_tables:
+            if not insp.has_table(tabela.name):
+                continue
+            existentes = {c["name"] for c in insp.get_columns(tabela.name)}
+            novas = [c for c in tabela.columns if c.name not in existentes]
+            for col in novas:
+                tipo = col.type.compile(dialect=engine.dialect)
+                con.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {col.name} {tipo}"))
+            for indice in tabela.indexes:
+                indice.create(con, checkfirst=True)
@@ -0,0 +1,180 @@
+# datasets.py
+import hashlib
+import os
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from logs import obter_logger
+
+log = obter_logger("datasets")
+
+_MAGICO = b"GRDS1\n"
+
+
+def assinatura_arquivos(caminhos):
+    """((nome, mtime_ns, tamanho), ...) de cada arquivo, na ordem dada."""
+    out = []
+    for p in caminhos:
+        st = p.stat()
+        out.append((p.name, st.st_mtime_ns, st.st_size))
+    return tuple(out)
+
+
+def chave_disciplinas(disciplinas):
+    """
+    Hash do que define o grafo de conflitos: (nome, prof, semestre,
+    aulas_por_semana) de cada disciplina, na ordem (a ordem dá os índices).
+    """
+    h = hashlib.sha256()
+    for d in disciplinas:
+        aps = max(1, int(d.get("aulas_por_semana", 1) or 1))
+        linha = f"{d['nome']}\x1f{d.get('prof', '')}\x1f{d.get('semestre', '')}\x1f{aps}\x1e"
+        h.update(linha.encode("utf-8"))
+    return h.hexdigest()
+
+
+class CacheDatasets:
+    """
+    Datasets de dados/ já lidos, com os grafos de conflitos compilados.
+      - chave = assinatura (nome, mtime_ns, tamanho) dos {nome}_*.csv: mudou,
+        surgiu ou sumiu um arquivo, só aquele dataset é relido;
+      - LRU limitado em memória;
+      - cópia binária (pickle + zlib) em diretorio/{nome}.bin, que sobrevive
+        a reinícios e só vale se a assinatura bater;
+      - grafos (GrafoCompacto) por (conflito_por_prof, conflito_por_semestre),
+        guardados com o dataset cujas disciplinas têm aquela chave_disciplinas.
+    Os dados devolvidos são compartilhados: não modifique.
+    """
+
+    def __init__(self, diretorio, max_itens=16):
+        self.diretorio = Path(diretorio)
+        self.max_itens = max_itens
+        self._itens = OrderedDict()   # nome -> entrada
+        self._por_chave = {}          # chave_disciplinas -> nome
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.grafos_reaproveitados = 0
+
+    def _arquivo(self, nome):
+        return self.diretorio / f"{nome}.bin"
+
+    def _ler_disco(self, nome, assinatura):
+        caminho = self._arquivo(nome)
+        try:
+            with caminho.open("rb") as f:
+                if f.read(len(_MAGICO)) != _MAGICO:
+                    return None
+                entrada = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.error("Erro ao ler cache do dataset '%s': %s", nome, e)
+            return None
+        return entrada if entrada.get("assinatura") == assinatura else None
+
+    def _gravar_disco(self, nome, entrada):
+        caminho = self._arquivo(nome)
+        tmp = caminho.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            with tmp.open("wb") as f:
+                f.write(_MAGICO)
+                f.write(zlib.compress(pickle.dumps(entrada, protocol=pickle.HIGHEST_PROTOCOL)))
+            os.replace(tmp, caminho)
+        except Exception as e:
+            log.error("Erro ao salvar cache do dataset '%s': %s", nome, e)
+            tmp.unlink(missing_ok=True)
+
+    def _guardar_memoria(self, nome, entrada):
+        with self._lock:
+            antiga = self._itens.pop(nome, None)
+            if antiga is not None and self._por_chave.get(antiga["chave"]) == nome:
+                del self._por_chave[antiga["chave"]]
+            self._itens[nome] = entrada
+            self._por_chave[entrada["chave"]] = nome
+            while len(self._itens) > self.max_itens:
+                nome_saiu, saiu = self._itens.popitem(last=False)
+                if self._por_chave.get(saiu["chave"]) == nome_saiu:
+                    del self._por_chave[saiu["chave"]]
+
+    def obter(self, nome, caminhos, carregar):
+        """
+        Dados do dataset (o dict devolvido por carregar(), que precisa ter
+        "disciplinas") para os arquivos em caminhos.
+        Retorna (dados, origem), origem em "memoria" | "disco" | "lido".
+        """
+        assinatura = assinatura_arquivos(caminhos)
+        with self._lock:
+            entrada = self._itens.get(nome)
+            if entrada is not None and entrada["assinatura"] == assinatura:
+                self._itens.move_to_end(nome)
+                self.hits += 1
+                return entrada["dados"], "memoria"
+
+        entrada = self._ler_disco(nome, assinatura)
+        origem = "disco"
+        if entrada is None:
+            origem = "lido"
+            dados = carregar()
+            entrada = {
+                "assinatura": assinatura,
+                "chave": chave_disciplinas(dados["disciplinas"]),
+                "dados": dados,
+                "grafos": {},
+            }
+            self._gravar_disco(nome, entrada)
+        self._guardar_memoria(nome, entrada)
+        with self._lock:
+            if origem == "disco":
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entrada["dados"], origem
+
+    def grafo(self, chave, flags, montar):
+        """
+        Grafo de conflitos das disciplinas de chave (chave_disciplinas) com
+        flags = (conflito_por_prof, conflito_por_semestre). Se a chave é a de
+        um dataset em memória, o grafo compilado é reaproveitado (ou montado
+        uma vez e guardado com o dataset, também no .bin); senão montar()
+        roda a cada chamada.
+        Retorna (grafo, origem), origem em "cache" | "compilado" | "montado".
+        """
+        flags = tuple(bool(f) for f in flags)
+        with self._lock:
+            nome = self._por_chave.get(chave)
+            entrada = self._itens.get(nome) if nome is not None else None
+            if entrada is not None and flags in entrada["grafos"]:
+                self.grafos_reaproveitados += 1
+                return entrada["grafos"][flags], "cache"
+
+        grafo = montar()
+        if entrada is None:
+            return grafo, "montado"
+        with self._lock:
+            entrada["grafos"][flags] = grafo
+            copia = {**entrada, "grafos": dict(entrada["grafos"])}
+        self._gravar_disco(nome, copia)
+        return grafo, "compilado"
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._por_chave.clear()
+        for p in self.diretorio.glob("*.bin"):
+            p.unlink(missing_ok=True)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "datasets_memoria": sorted(self._itens),
+                "chaves": {nome: e["chave"] for nome, e in self._itens.items()},
+                "max_itens": self.max_itens,
+                "hits": self.hits,
+                "misses": self.misses,
+                "grafos_reaproveitados": self.grafos_reaproveitados,
+            }
@@ -0,0 +1,568 @@
+# exportacao.py
+"""
+Exportação visual da grade (CSV e XLSX "Oferta Regular").
+
+A grade semestre × período × dia é montada uma vez (montar_grade_visual) e
+os dois arquivos são escritos em streaming a partir dela: o CSV linha a
+linha, o XLSX com openpyxl em modo write_only e estilos nomeados
+compartilhados (nada de estilo por célula nem row_dimensions por linha).
+exportar() escreve o CSV numa thread do pool enquanto o XLSX é escrito na
+thread chamadora. CacheExportacoes guarda os arquivos gerados por conteúdo.
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
+from openpyxl.styles.fonts import DEFAULT_FONT
+
+from logs import obter_logger
+
+log = obter_logger("exportacao")
+
+TITULO = "Oferta Regular — 2026 / 1"
+TITULO_SEM_SEMESTRE = "Disciplinas sem semestre informado"
+
+DIAS_ORDEM = ["seg", "ter", "qua", "qui", "sex", "sab", "dom"]
+
+_DIA_MAP = {
+    "Seg": "seg",
+    "Ter": "ter",
+    "Qua": "qua",
+    "Qui": "qui",
+    "Sex": "sex",
+    "Sab": "sab",
+    "Dom": "dom",
+}
+
+_LARGURAS = {"A": 12, "B": 12, "C": 32, "D": 32, "E": 32, "F": 32, "G": 32}
+_ALTURA_LINHA = 34
+
+_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXPORTACAO_TRABALHADORES", "2")),
+    thread_name_prefix="exportacao",
+)
+
+
+def _periodo_do_indice(indice_no_dia: int) -> str:
+    return str(indice_no_dia + 1)
+
+
+def _esc_csv(v):
+    s = str(v or "")
+    if '"' in s:
+        s = s.replace('"', '""')
+    if "," in s or "\n" in s or '"' in s:
+        return f'"{s}"'
+    return s
+
+
+def montar_grade_visual(
+    alocacao: dict, horarios: dict, nome_exibicao: dict, semestre_por_disc: dict
+):
+    """
+    Grade pronta para os escritores:
+      {"dias": dias úteis,
+       "semestres": [(semestre, [(período, [texto por dia])])],
+       "sem_semestre": [(período, [texto por dia])] (vazia se não houver)}
+    Texto da célula = nomes de exibição separados por quebra de linha.
+    """
+    grade = {}
+    sem_semestre = {}
+
+    total_blocos = len(horarios)
+    blocos_por_dia = 4
+    if total_blocos % 5 == 0 and total_blocos > 0:
+        blocos_por_dia = total_blocos // 5
+
+    for disc, bloco_raw in alocacao.items():
+        bloco = int(bloco_raw)
+        label = horarios.get(bloco, "")
+        partes = str(label).split(" ")
+        dia_txt = partes[0] if partes else ""
+        dia = _DIA_MAP.get(dia_txt)
+        if not dia:
+            continue
+
+        periodo = _periodo_do_indice(bloco % blocos_por_dia)
+
+        nome_base = re.sub(r"\s*\[\d+/\d+\]", "", disc)
+        nome = nome_exibicao.get(disc, nome_base)
+
+        semestre = str(semestre_por_disc.get(nome_base, "")).strip()
+
+        destino = grade.setdefault(semestre, {}) if semestre else sem_semestre
+        destino.setdefault(periodo, {}).setdefault(dia, []).append(nome)
+
+    dias_uteis = DIAS_ORDEM[:5]
+    periodos = [str(i + 1) for i in range(blocos_por_dia)]
+
+    def linhas(por_periodo):
+        return [
+            (p, ["\n".join(por_periodo.get(p, {}).get(dia, [])) for dia in dias_uteis])
+            for p in periodos
+        ]
+
+    return {
+        "dias": dias_uteis,
+        "semestres": [(sem, linhas(grade[sem])) for sem in sorted(grade.keys(), key=str)],
+        "sem_semestre": linhas(sem_semestre) if sem_semestre else [],
+    }
+
+
+# --------------------------
+# CSV
+# --------------------------
+
+
+def _linhas_csv(visual):
+    dias = visual["dias"]
+    yield _esc_csv(TITULO)
+    yield ",".join(_esc_csv(x) for x in ["Semestre", "Período", *dias])
+    for sem, linhas in visual["semestres"]:
+        for p, celulas in linhas:
+            yield ",".join(_esc_csv(x) for x in [sem, p, *celulas])
+
+    if visual["sem_semestre"]:
+        yield ""
+        yield _esc_csv(TITULO_SEM_SEMESTRE)
+        yield ",".join(_esc_csv(x) for x in ["Período", *dias])
+        for p, celulas in visual["sem_semestre"]:
+            yield ",".join(_esc_csv(x) for x in [p, *celulas])
+
+
+def escrever_csv(caminho, visual):
+    # mesmo formato de antes: utf-8 com BOM, linhas separadas por \n, sem \n final
+    with open(caminho, "w", encoding="utf-8-sig") as f:
+        for i, linha in enumerate(_linhas_csv(visual)):
+            f.write(linha if i == 0 else "\n" + linha)
+
+
+# --------------------------
+# XLSX
+# --------------------------
+
+
+def _estilos():
+    fina = Side(style="thin")
+    borda = Border(left=fina, right=fina, top=fina, bottom=fina)
+    centro = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    topo_esq = Alignment(horizontal="left", vertical="top", wrap_text=True)
+    return [
+        NamedStyle(name="grade_titulo", font=Font(bold=True, size=14), alignment=centro),
+        NamedStyle(name="grade_cabecalho", font=Font(bold=True), alignment=centro, border=borda),
+        NamedStyle(name="grade_semestre", font=Font(bold=True), alignment=centro, border=borda),
+        NamedStyle(name="grade_rotulo", font=DEFAULT_FONT, alignment=centro, border=borda),
+        NamedStyle(name="grade_celula", font=DEFAULT_FONT, alignment=topo_esq, border=borda),
+    ]
+
+
+def escrever_xlsx(destino, visual):
+    """destino: caminho ou arquivo binário aberto."""
+    wb = Workbook(write_only=True)
+    for estilo in _estilos():
+        wb.add_named_style(estilo)
+    ws = wb.create_sheet("Grade")
+
+    # largura/altura antes das linhas (exigência do write_only)
+    for col, largura in _LARGURAS.items():
+        ws.column_dimensions[col].width = largura
+    ws.sheet_format.defaultRowHeight = _ALTURA_LINHA
+    ws.sheet_format.customHeight = True
+
+    def celula(valor, estilo):
+        c = WriteOnlyCell(ws, value=valor)
+        c.style = estilo
+        return c
+
+    dias = visual["dias"]
+
+    # título principal
+    ws.append([celula(TITULO, "grade_titulo")])
+    ws.merged_cells.add("A1:G1")
+
+    # cabeçalho tabela principal
+    ws.append([celula(h, "grade_cabecalho") for h in ["Semestre", "Período", *dias]])
+    linha = 3
+
+    for sem, linhas in visual["semestres"]:
+        inicio = linha
+        # semestre só na 1ª linha (as demais entram no merge); negrito se houver merge
+        estilo_sem = "grade_semestre" if len(linhas) > 1 else "grade_rotulo"
+        for i, (p, celulas) in enumerate(linhas):
+            ws.append(
+                [
+                    celula(sem, estilo_sem) if i == 0 else celula(None, "grade_rotulo"),
+                    celula(p, "grade_rotulo"),
+                    *(celula(t, "grade_celula") for t in celulas),
+                ]
+            )
+            linha += 1
+        if linha - 1 > inicio:
+            ws.merged_cells.add(f"A{inicio}:A{linha - 1}")
+
+    # seção sem semestre informado
+    if visual["sem_semestre"]:
+        ws.append([])
+        ws.append([])
+        linha += 2
+        ws.append([celula(TITULO_SEM_SEMESTRE, "grade_titulo")])
+        ws.merged_cells.add(f"A{linha}:F{linha}")
+
+        ws.append([celula(h, "grade_cabecalho") for h in ["Período", *dias]])
+        for p, celulas in visual["sem_semestre"]:
+            ws.append([celula(p, "grade_rotulo"), *(celula(t, "grade_celula") for t in celulas)])
+
+    wb.save(destino)
+
+
+def exportar(caminho_csv, caminho_xlsx, visual):
+    """CSV numa thread do pool, XLSX nesta; retorna quando os dois existem."""
+    csv_futuro = _POOL.submit(escrever_csv, caminho_csv, visual)
+    try:
+        escrever_xlsx(caminho_xlsx, visual)
+    finally:
+        csv_futuro.result()
+
+
+# --------------------------
+# Cache de exportações (out/)
+# --------------------------
+
+
+def chave_exportacao(alocacao, horarios, nome_exibicao, semestre_por_disc):
+    """sha256 de (alocacao, horarios, nome_exibicao, semestre_por_disc) canônicos."""
+    corpo = json.dumps(
+        [alocacao, {str(k): v for k, v in horarios.items()}, nome_exibicao, semestre_por_disc],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(corpo.encode("utf-8")).hexdigest()
+
+
+class CacheExportacoes:
+    """
+    Exportações em diretorio endereçadas por conteúdo (chave_exportacao):
+      - a mesma grade exportada de novo devolve os arquivos já gerados
+        ({prefixo}_{chave[:16]}.csv/.xlsx, com o prefixo da 1ª exportação);
+      - pedidos idênticos simultâneos geram uma vez só (single-flight);
+      - LRU por último acesso (exportar ou baixar), removendo o mais antigo
+        quando o total passa de max_bytes e tudo sem acesso há max_idade_s;
+      - índice em diretorio/.exportacoes.json. csv/xlsx escritos por fora
+        (a CLI grava alocacaohorario_* no mesmo out/, ou os que já estavam
+        lá antes do índice) entram como legado na primeira carga ou no
+        próximo listar(), com o acesso contando a partir da adoção: nada
+        é despejado na carga que os adota. Exportar e despejar gravam o
+        índice; acessos (hit, download) só mudam a memória, que vai para o
+        disco no próximo exportar, no máximo a cada intervalo_salvar_s ou em
+        salvar() (shutdown/atexit).
+    """
+
+    def __init__(self, diretorio, max_bytes=256 * 1024 * 1024, max_idade_s=30 * 86400,
+                 intervalo_salvar_s=300):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.max_idade_s = max_idade_s
+        self.intervalo_salvar_s = intervalo_salvar_s
+        self._arquivo_indice = diretorio / ".exportacoes.json"
+        self._itens = OrderedDict()  # chave -> entrada, do acesso mais antigo ao mais recente
+        self._por_arquivo = {}       # nome do arquivo -> chave
+        self._em_voo = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.removidos = 0
+        self._sujo = False  # acessos ainda não gravados no índice
+        self._salvo_em = time.monotonic()
+        self._carregar()
+        atexit.register(self.salvar)
+
+    # ---------- índice ----------
+
+    def _carregar(self):
+        # só grava de volta se mudou: os workers de jobs também importam o
+        # servidor e não devem sobrescrever o índice com uma cópia velha
+        mudou = False
+        try:
+            with self._arquivo_indice.open("r", encoding="utf-8") as f:
+                itens = json.load(f)
+        except FileNotFoundError:
+            itens, mudou = self._adotar_legado(), True
+        except Exception as e:
+            log.error("Erro ao ler índice de exportações: %s", e)
+            itens, mudou = self._adotar_legado(), True
+        for chave, entrada in sorted(itens.items(), key=lambda kv: kv[1]["acessado_em"]):
+            self._guardar(chave, entrada)
+        removidos = self.removidos
+        if not mudou:  # recém-adotados não saem sem aviso na mesma carga
+            self._despejar()
+        if mudou or self.removidos != removidos:
+            self._salvar()
+
+    def _adotar_legado(self):
+        """csv/xlsx de diretorio fora do índice, como entradas "legado:"."""
+        itens, agora = {}, time.time()
+        for p in self.diretorio.glob("*"):
+            if p.suffix in (".csv", ".xlsx") and p.name not in self._por_arquivo and p.is_file():
+                st = p.stat()
+                itens[f"legado:{p.name}"] = {
+                    "arquivos": {p.suffix[1:]: p.name},
+                    "bytes": st.st_size,
+                    "criado_em": st.st_mtime,
+                    "acessado_em": agora,
+                }
+        return itens
+
+    def _salvar(self):
+        tmp = self._arquivo_indice.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(self._itens, f, ensure_ascii=False)
+            os.replace(tmp, self._arquivo_indice)
+        except Exception as e:
+            log.error("Erro ao salvar índice de exportações: %s", e)
+            tmp.unlink(missing_ok=True)
+        else:
+            self._sujo = False
+            self._salvo_em = time.monotonic()
+
+    def salvar(self):
+        """Grava o índice se há acessos pendentes."""
+        with self._lock:
+            if self._sujo:
+                self._salvar()
+
+    def _acessar(self, chave):
+        self._itens[chave]["acessado_em"] = time.time()
+        self._itens.move_to_end(chave)
+        self._sujo = True
+        if time.monotonic() - self._salvo_em >= self.intervalo_salvar_s:
+            self._salvar()
+
+    def _guardar(self, chave, entrada):
+        self._itens[chave] = entrada
+        self._itens.move_to_end(chave)
+        for nome in entrada["arquivos"].values():
+            self._por_arquivo[nome] = chave
+
+    def _remover(self, chave):
+        entrada = self._itens.pop(chave)
+        if chave.startswith("legado:"):
+            log.warning("Exportação %s removida de out/ (sem acesso ou acima do limite).",
+                        ", ".join(entrada["arquivos"].values()))
+        for nome in entrada["arquivos"].values():
+            self._por_arquivo.pop(nome, None)
+            (self.diretorio / nome).unlink(missing_ok=True)
+        self.removidos += 1
+
+    def _despejar(self):
+        limite = time.time() - self.max_idade_s
+        total = sum(e["bytes"] for e in self._itens.values())
+        for chave in list(self._itens)[:-1]:  # a mais recente (recém-gerada) fica
+            entrada = self._itens[chave]
+            if entrada["acessado_em"] >= limite and total <= self.max_bytes:
+                break  # o resto é mais recente
+            total -= entrada["bytes"]
+            self._remover(chave)
+
+    # ---------- uso ----------
+
+    def _existe(self, entrada):
+        return all((self.diretorio / n).is_file() for n in entrada["arquivos"].values())
+
+    def obter_ou_exportar(self, chave, prefixo, gerar):
+        """
+        Arquivos ({"csv": nome, "xlsx": nome}) da exportação de chave; se não
+        existem, gerar(caminho_csv, caminho_xlsx) os escreve.
+        Retorna (arquivos, origem), origem em "cache" | "coalescido" | "gerado".
+        """
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None and self._existe(entrada):
+                self._acessar(chave)
+                self.hits += 1
+                return dict(entrada["arquivos"]), "cache"
+            voo = self._em_voo.get(chave)
+            dono = voo is None
+            if dono:
+                voo = Future()
+                self._em_voo[chave] = voo
+
+        if not dono:
+            arquivos = voo.result()
+            with self._lock:
+                self.hits += 1
+            return dict(arquivos), "coalescido"
+
+        try:
+            base = f"{prefixo}_{chave[:16]}"
+            arquivos = {"csv": f"{base}.csv", "xlsx": f"{base}.xlsx"}
+            tmp = {k: self.diretorio / f".{n}.{threading.get_ident()}.tmp" for k, n in arquivos.items()}
+            try:
+                gerar(tmp["csv"], tmp["xlsx"])
+                for k, nome in arquivos.items():
+                    os.replace(tmp[k], self.diretorio / nome)
+            finally:
+                for p in tmp.values():
+                    p.unlink(missing_ok=True)
+
+            agora = time.time()
+            with self._lock:
+                if chave in self._itens:  # arquivos tinham sumido do disco
+                    self._itens.pop(chave)
+                self._guardar(
+                    chave,
+                    {
+                        "arquivos": arquivos,
+                        "bytes": sum((self.diretorio / n).stat().st_size for n in arquivos.values()),
+                        "criado_em": agora,
+                        "acessado_em": agora,
+                    },
+                )
+                self.misses += 1
+                self._despejar()
+                self._salvar()
+            voo.set_result(arquivos)
+            return dict(arquivos), "gerado"
+        except BaseException as e:
+            voo.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+
+    def tocar(self, nome):
+        """Marca o acesso (download) ao arquivo nome, se ele está no índice."""
+        with self._lock:
+            chave = self._por_arquivo.get(nome)
+            if chave is None:
+                return
+            self._acessar(chave)
+
+    def listar(self):
+        """Arquivos do índice, adotando antes os que apareceram por fora."""
+        with self._lock:
+            novos = self._adotar_legado()
+            for chave, entrada in novos.items():
+                self._guardar(chave, entrada)
+            if novos:
+                self._salvar()
+            return sorted(self._por_arquivo)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "exportacoes": len(self._itens),
+                "arquivos": len(self._por_arquivo),
+                "bytes": sum(e["bytes"] for e in self._itens.values()),
+                "max_bytes": self.max_bytes,
+                "max_idade_s": self.max_idade_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "removidos": self.removidos,
+            }
+
+
+_NOME_XLSX_GERACAO = re.compile(r"\d+-[0-9a-f]+\.xlsx")
+
+
+class CacheXlsxGeracoes:
+    """
+    XLSX de cada GeracaoGrade, renderizado no primeiro pedido e guardado em
+    diretorio/{id}-{versao}.xlsx, versao = hash do conteúdo da geração: o id
+    sozinho não basta, porque o SQLite reaproveita ids depois de apagar as
+    últimas linhas ou recriar o banco, e out/ sobrevive a isso. Guarda no
+    máximo max_itens arquivos, removendo o de acesso mais antigo; pedidos
+    simultâneos do mesmo arquivo renderizam uma vez só.
+    """
+
+    def __init__(self, diretorio, max_itens=512):
+        self.diretorio = diretorio
+        self.max_itens = max_itens
+        self._ordem = OrderedDict()  # nome -> None, do acesso mais antigo ao mais recente
+        self._em_voo = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        diretorio.mkdir(parents=True, exist_ok=True)
+        arquivos = []
+        for p in diretorio.glob("*.xlsx"):
+            if not _NOME_XLSX_GERACAO.fullmatch(p.name):
+                p.unlink(missing_ok=True)  # {id}.xlsx antigo, sem versão: não dá para confiar
+                continue
+            try:
+                arquivos.append((p.stat().st_mtime, p.name))
+            except OSError:
+                continue
+        for _, nome in sorted(arquivos):
+            self._ordem[nome] = None
+
+    @staticmethod
+    def _nome(geracao_id, versao):
+        return f"{geracao_id}-{versao}.xlsx"
+
+    def obter(self, geracao_id, versao, renderizar):
+        """
+        Caminho do XLSX da geração na versão dada; se ainda não existe,
+        renderizar(caminho) o escreve (exceções de renderizar são repassadas
+        e nada é guardado).
+        """
+        nome = self._nome(geracao_id, versao)
+        caminho = self.diretorio / nome
+        with self._lock:
+            if nome in self._ordem and caminho.is_file():
+                self._ordem.move_to_end(nome)
+                self.hits += 1
+                return caminho
+            voo = self._em_voo.get(nome)
+            dono = voo is None
+            if dono:
+                voo = Future()
+                self._em_voo[nome] = voo
+
+        if not dono:
+            voo.result()
+            with self._lock:
+                self.hits += 1
+            return caminho
+
+        try:
+            tmp = self.diretorio / f".{nome}.{threading.get_ident()}.tmp"
+            try:
+                renderizar(tmp)
+                os.replace(tmp, caminho)
+            finally:
+                tmp.unlink(missing_ok=True)
+            with self._lock:
+                self._ordem[nome] = None
+                self._ordem.move_to_end(nome)
+                self.misses += 1
+                while len(self._ordem) > self.max_itens:
+                    saiu, _ = self._ordem.popitem(last=False)
+                    (self.diretorio / saiu).unlink(missing_ok=True)
+            voo.set_result(caminho)
+            return caminho
+        except BaseException as e:
+            voo.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(nome, None)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "itens": len(self._ordem),
+                "max_itens": self.max_itens,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -1,8 +1,18 @@
 # grafo.py
+import os
 import re
-import math
+import bisect
+import heapq
+import random
+import time
 import networkx as nx
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from logs import obter_logger
+
+log = obter_logger("grafo")
 
 # ========= Helpers de grupos (Union-Find / DSU) =========
 
@@ -37,7 +47,7 @@ def construir_grupos(nos, pares):
         if a in dsu.pai and b in dsu.pai:
             dsu.union(a, b)
         else:
-            print(f"[AVISO] Par ignorado (nó não existe no grafo): ({a}, {b})")
+            log.warning("Par ignorado (nó não existe no grafo): (%s, %s)", a, b)
 
     tmp = defaultdict(set)
     for n in nos:
@@ -51,6 +61,168 @@ def construir_grupos(nos, pares):
     return grupos, grupo_por_no
 
 
+# ========= Grafo compacto (CSR) =========
+
+class GrafoCompacto:
+    """
+    Grafo de conflitos em formato compacto: nós mapeados para 0..n-1 e
+    adjacência em CSR (indptr/indices em array). É o formato nativo do motor
+    de coloração; use de_networkx/para_networkx para converter.
+    """
+    __slots__ = ("nomes", "indice", "indptr", "indices", "graus", "_num_arestas")
+
+    def __init__(self, nomes, pares):
+        """
+        nomes: lista de nomes (índice -> nome), sem repetição.
+        pares: arestas (i, j) por índice, sem repetição (i == j é laço).
+        """
+        n = len(nomes)
+        self.nomes = list(nomes)
+        self.indice = {nome: i for i, nome in enumerate(self.nomes)}
+
+        pares = list(pares)
+        tam = [0] * n
+        graus = [0] * n
+        for i, j in pares:
+            tam[i] += 1
+            graus[i] += 1
+            graus[j] += 1
+            if i != j:
+                tam[j] += 1
+
+        indptr = array("q", [0]) * (n + 1)
+        for i in range(n):
+            indptr[i + 1] = indptr[i] + tam[i]
+
+        indices = array("i", [0]) * indptr[n]
+        pos = list(indptr[:n])
+        for i, j in pares:
+            indices[pos[i]] = j
+            pos[i] += 1
+            if i != j:
+                indices[pos[j]] = i
+                pos[j] += 1
+
+        self.indptr = indptr
+        self.indices = indices
+        self.graus = array("i", graus)
+        self._num_arestas = len(pares)
+
+    @classmethod
+    def de_networkx(cls, G):
+        nomes = list(G.nodes())
+        indice = {nome: i for i, nome in enumerate(nomes)}
+        return cls(nomes, ((indice[a], indice[b]) for a, b in G.edges()))
+
+    def para_networkx(self):
+        G = nx.Graph()
+        G.add_nodes_from(self.nomes)
+        nomes, indptr, indices = self.nomes, self.indptr, self.indices
+        for i in range(len(nomes)):
+            for k in range(indptr[i], indptr[i + 1]):
+                j = indices[k]
+                if j >= i:
+                    G.add_edge(nomes[i], nomes[j])
+        return G
+
+    def com_arestas(self, pares):
+        """
+        Cópia com as arestas extras (pares de nomes; nomes fora do grafo e
+        arestas já existentes são ignorados). Para um grafo de
+        construir_grafo(compacto=True), a adjacência sai na mesma ordem de
+        construir_grafo() + G.add_edge(...) convertido por de_networkx, então
+        o motor se comporta igual nos dois caminhos. Sem extras devolve self.
+        """
+        indice, indptr, indices = self.indice, self.indptr, self.indices
+        extras, conjuntos, novas = defaultdict(list), {}, 0
+        graus = array("i", self.graus)
+
+        def vizinhos(i):
+            if i not in conjuntos:
+                conjuntos[i] = set(indices[indptr[i]:indptr[i + 1]])
+            return conjuntos[i]
+
+        for a, b in pares:
+            i, j = indice.get(a), indice.get(b)
+            if i is None or j is None or j in vizinhos(i):
+                continue
+            extras[i].append(j)
+            vizinhos(i).add(j)
+            if i != j:
+                extras[j].append(i)
+                vizinhos(j).add(i)
+            graus[i] += 1
+            graus[j] += 1
+            novas += 1
+        if not novas:
+            return self
+
+        # por nó: vizinhos menores em ordem crescente, depois os maiores
+        # originais e, por fim, os maiores extras na ordem de inserção
+        novo_indptr, novo_indices = array("q", [0]), array("i")
+        for u in range(len(self.nomes)):
+            viz = indices[indptr[u]:indptr[u + 1]]
+            ext = extras.get(u)
+            if ext:
+                viz = (sorted([v for v in viz if v < u] + [v for v in ext if v < u])
+                       + [v for v in viz if v >= u] + [v for v in ext if v >= u])
+            novo_indices.extend(viz)
+            novo_indptr.append(len(novo_indices))
+
+        novo = GrafoCompacto.__new__(GrafoCompacto)
+        novo.nomes = self.nomes
+        novo.indice = self.indice
+        novo.indptr = novo_indptr
+        novo.indices = novo_indices
+        novo.graus = graus
+        novo._num_arestas = self._num_arestas + novas
+        return novo
+
+    def subgrafo(self, nos):
+        """Subgrafo induzido pelos índices em nos, renumerados na ordem dada."""
+        local = {m: i for i, m in enumerate(nos)}
+        indptr, indices = self.indptr, self.indices
+        novo_indptr, novo_indices = array("q", [0]), array("i")
+        for m in nos:
+            novo_indices.extend(local[v] for v in indices[indptr[m]:indptr[m + 1]] if v in local)
+            novo_indptr.append(len(novo_indices))
+
+        sub = GrafoCompacto.__new__(GrafoCompacto)
+        sub.nomes = [self.nomes[m] for m in nos]
+        sub.indice = {nome: i for i, nome in enumerate(sub.nomes)}
+        sub.indptr = novo_indptr
+        sub.indices = novo_indices
+        sub.graus = array("i", (novo_indptr[i + 1] - novo_indptr[i] for i in range(len(nos))))
+        sub._num_arestas = len(novo_indices) // 2
+        return sub
+
+    def vizinhos(self, i):
+        """Vizinhos do nó i (por índice)."""
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def grau(self, i):
+        return self.graus[i]
+
+    def nodes(self):
+        """Nomes dos nós, na ordem dos índices (como nx.Graph.nodes())."""
+        return self.nomes
+
+    def number_of_nodes(self):
+        return len(self.nomes)
+
+    def number_of_edges(self):
+        return self._num_arestas
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def __contains__(self, nome):
+        return nome in self.indice
+
+    def __iter__(self):
+        return iter(self.nomes)
+
+
 # ========= Construção do grafo =========
 
 def _tokens_prof(s):
@@ -61,87 +233,314 @@ def _norm_semestre(s):
     """Normaliza semestre para comparação (ex.: '1', '2025/1', '2025-2')."""
     return str(s).strip().lower()
 
-def construir_grafo(disciplinas, conflito_por_prof=True, conflito_por_semestre=True):
+def _baldes_conflito(disciplinas, conflito_por_prof=True, conflito_por_semestre=True):
+    """
+    Índices invertidos professor -> [i] e semestre -> [i]. Cada balde é uma
+    clique do grafo de conflitos; vem como ((origem, chave), [i]), com
+    origem "professor" ou "semestre".
+    """
+    baldes = []
+
+    if conflito_por_prof:
+        por_prof = defaultdict(list)
+        for i, d in enumerate(disciplinas):
+            for p in _tokens_prof(d.get("prof", "")):
+                por_prof[p].append(i)
+        baldes.extend((("professor", p), idxs) for p, idxs in por_prof.items())
+
+    if conflito_por_semestre:
+        por_semestre = defaultdict(list)
+        for i, d in enumerate(disciplinas):
+            s = _norm_semestre(d.get("semestre", ""))
+            if s:
+                por_semestre[s].append(i)
+        baldes.extend((("semestre", s), idxs) for s, idxs in por_semestre.items())
+
+    return baldes
+
+
+def _pares_em_conflito(disciplinas, conflito_por_prof=True, conflito_por_semestre=True):
+    """
+    Pares de índices (i, j), i < j, de disciplinas em conflito.
+    Tokeniza cada disciplina uma única vez e monta índices invertidos
+    professor -> [i] e semestre -> [i]; os pares saem só de dentro de cada
+    balde, então o custo acompanha o nº de pares em conflito e não n².
+    """
+    baldes = _baldes_conflito(disciplinas, conflito_por_prof, conflito_por_semestre)
+
+    pares = set()
+    for _, idxs in baldes:
+        for a in range(len(idxs)):
+            i = idxs[a]
+            for b in range(a + 1, len(idxs)):
+                pares.add((i, idxs[b]))
+
+    # mesma ordem da varredura i < j original (grafo idêntico, inclusive adjacência)
+    return sorted(pares)
+
+
+def construir_grafo(disciplinas, conflito_por_prof=True, conflito_por_semestre=True,
+                    compacto=False):
     """
     Cria o grafo: 1 nó por disciplina.
     Aresta se: (professor em comum) OU (mesmo semestre), conforme flags.
+    compacto=True devolve um GrafoCompacto em vez de nx.Graph.
     """
-    G = nx.Graph()
     nomes = [d["nome"] for d in disciplinas]
+    pares = _pares_em_conflito(disciplinas, conflito_por_prof, conflito_por_semestre)
+
+    if compacto:
+        indice = {}
+        for nome in nomes:
+            indice.setdefault(nome, len(indice))
+        if len(indice) != len(nomes):
+            # nomes repetidos viram um nó só (como no nx.Graph)
+            pares = sorted({
+                tuple(sorted((indice[nomes[i]], indice[nomes[j]]))) for i, j in pares
+            })
+        return GrafoCompacto(list(indice), pares)
+
+    G = nx.Graph()
     G.add_nodes_from(nomes)
+    G.add_edges_from((nomes[i], nomes[j]) for i, j in pares)
 
-    for i in range(len(disciplinas)):
-        for j in range(i + 1, len(disciplinas)):
-            d1, d2 = disciplinas[i], disciplinas[j]
-            add_edge = False
+    return G
 
-            # Conflito por professor
-            if conflito_por_prof:
-                profs1 = _tokens_prof(d1.get("prof", ""))
-                profs2 = _tokens_prof(d2.get("prof", ""))
-                if profs1 and profs2 and (profs1 & profs2):
-                    add_edge = True
 
-            # Conflito por semestre
-            if not add_edge and conflito_por_semestre:
-                s1 = _norm_semestre(d1.get("semestre", ""))
-                s2 = _norm_semestre(d2.get("semestre", ""))
-                if s1 and s2 and s1 == s2:
-                    add_edge = True
+# ========= Coloração balanceada com grupos, fixos e domínios =========
 
-            if add_edge:
-                G.add_edge(d1["nome"], d2["nome"])
+class _CargasBlocos:
+    """
+    Blocos agrupados por carga (nº de nós alocados), como bitmask por carga.
+    Escolher o bloco menos carregado dentre os livres custa O(nº de cargas
+    distintas) em vez de reordenar todos os blocos a cada grupo.
+    """
+    __slots__ = ("carga", "por_carga", "ordenadas")
 
-    return G
+    def __init__(self, num_blocos):
+        self.carga = [0] * num_blocos
+        self.por_carga = {0: (1 << num_blocos) - 1} if num_blocos > 0 else {}
+        self.ordenadas = [0] if num_blocos > 0 else []
 
+    def _mover(self, bloco, de, para):
+        bit = 1 << bloco
+        resto = self.por_carga[de] & ~bit
+        if resto:
+            self.por_carga[de] = resto
+        else:
+            del self.por_carga[de]
+            self.ordenadas.remove(de)
+        if para in self.por_carga:
+            self.por_carga[para] |= bit
+        else:
+            self.por_carga[para] = bit
+            bisect.insort(self.ordenadas, para)
+        self.carga[bloco] = para
 
-# ========= Coloração balanceada com grupos, fixos e domínios =========
+    def adicionar(self, bloco, qtd):
+        self._mover(bloco, self.carga[bloco], self.carga[bloco] + qtd)
 
-def colorir_grafo_balanceado(
-    grafo,
-    num_blocos=10,
-    fixos=None,
-    pares_mesmo_horario=None,
-    pares_mesmo_bloco=None,
-    dominios_por_no=None,      # dict no -> set(blocos permitidos)
-    allow_extra_blocks=False,
-    hard_fail=True
-):
-    if fixos is None:
-        fixos = {}
-    if pares_mesmo_horario is None:
-        pares_mesmo_horario = []
-    if pares_mesmo_bloco is None:
-        pares_mesmo_bloco = []
-    if dominios_por_no is None:
-        dominios_por_no = {}
+    def remover(self, bloco, qtd):
+        self._mover(bloco, self.carga[bloco], self.carga[bloco] - qtd)
+
+    def menos_carregado(self, livres):
+        """Menor bloco de menor carga dentre os bits de 'livres' (ou None)."""
+        if not livres:
+            return None
+        for c in self.ordenadas:
+            cand = self.por_carga[c] & livres
+            if cand:
+                return (cand & -cand).bit_length() - 1
+        return None
+
+
+class _Progresso:
+    """
+    Eventos de progresso do motor para quem acompanha a geração ao vivo.
+    Os laços quentes só decrementam um contador (tique); o relógio é lido a
+    cada `passo` tiques e um evento sai no máximo a cada `intervalo` segundos.
+    emitir(evento) recebe dicts {"fase": ..., ...}.
+    """
+    __slots__ = ("emitir", "intervalo", "passo", "_n", "_proximo")
+
+    def __init__(self, emitir, intervalo=0.2, passo=64):
+        self.emitir = emitir
+        self.intervalo = intervalo
+        self.passo = passo
+        self._n = passo
+        self._proximo = 0.0
+
+    def tique(self):
+        self._n -= 1
+        if self._n > 0:
+            return False
+        self._n = self.passo
+        agora = time.monotonic()
+        if agora < self._proximo:
+            return False
+        self._proximo = agora + self.intervalo
+        return True
+
+    def __call__(self, fase, **dados):
+        dados["fase"] = fase
+        self.emitir(dados)
+
+
+def _progresso(emitir):
+    return emitir if emitir is None or isinstance(emitir, _Progresso) else _Progresso(emitir)
+
+
+class _Instancia:
+    """
+    Problema de alocação já pré-processado, no espaço de inteiros do
+    GrafoCompacto: grupos "mesmo bloco", domínios e fixos por grupo.
+    """
+
+    def __init__(self, gc, num_blocos, grupos, grupo_por_no, dominios_grupo,
+                 fixo_por_grupo, total_blocos, dominio_mask=None):
+        self.gc = gc
+        self.nomes = gc.nomes
+        self.num_blocos = num_blocos
+        self.total_blocos = total_blocos
+        self.grupos = grupos
+        self.grupo_de = array("i", [grupo_por_no[i] for i in range(len(gc.nomes))])
+        self.dominios_grupo = dominios_grupo
+        if dominio_mask is None:
+            mascara_blocos = (1 << total_blocos) - 1
+            dominio_mask = {
+                lid: sum(1 << b for b in dom if b >= 0) & mascara_blocos
+                for lid, dom in dominios_grupo.items()
+            }
+        self.dominio_mask = dominio_mask
+        self.fixo_por_grupo = fixo_por_grupo
+
+    def grau_grupo(self, lid):
+        graus = self.gc.graus
+        return sum(graus[m] for m in self.grupos[lid])
+
+    def ordem_estatica(self, rng=None):
+        """
+        Grupos sem fixo por “força” (grau, tamanho, menor rótulo), decrescente.
+        Com rng, o grau é perturbado em ±20% e o desempate é aleatório
+        (ordens diferentes para o portfólio).
+        """
+        grupos, nomes = self.grupos, self.nomes
+        livres = [lid for lid in grupos if lid not in self.fixo_por_grupo]
+        if rng is None:
+            chave = {lid: (self.grau_grupo(lid), len(grupos[lid]), min(nomes[m] for m in grupos[lid]))
+                     for lid in livres}
+        else:
+            chave = {lid: (self.grau_grupo(lid) * rng.uniform(0.8, 1.2), len(grupos[lid]), rng.random())
+                     for lid in livres}
+        return sorted(livres, key=chave.__getitem__, reverse=True)
+
+
+class _Alocacao:
+    """
+    Estado mutável da alocação sobre uma _Instancia.
+      cor[i]       = bloco do nó i (-1 = livre)
+      proibidos[g] = bitmask dos blocos onde o grupo g não cabe (vizinho já lá)
+      cargas       = blocos por carga, para achar o menos carregado
+    """
+
+    def __init__(self, inst, progresso=None):
+        self.inst = inst
+        self.cor = array("i", [-1]) * len(inst.nomes)
+        self.proibidos = {lid: 0 for lid in inst.grupos}
+        self.cargas = _CargasBlocos(inst.total_blocos)
+        self.ordem_alocacao = []
+        self.progresso = progresso
+
+    def relatar_alocacao(self):
+        """Evento "alocacao" com a fração de grupos já alocados."""
+        feitos, total = len(self.ordem_alocacao), len(self.inst.grupos)
+        self.progresso("alocacao", grupos_alocados=feitos, total_grupos=total,
+                       percentual=round(100.0 * feitos / total, 1) if total else 100.0)
+
+    def livres(self, lid):
+        """Bitmask dos blocos do domínio em que o grupo ainda cabe."""
+        return self.inst.dominio_mask[lid] & ~self.proibidos[lid]
+
+    def alocar(self, lid, bloco):
+        """
+        Aloca o grupo no bloco. Retorna a trilha [(grupo, mask anterior)] dos
+        grupos que passaram a ter o bloco proibido.
+        """
+        inst, cor, proibidos = self.inst, self.cor, self.proibidos
+        indptr, indices, grupo_de = inst.gc.indptr, inst.gc.indices, inst.grupo_de
+        bit = 1 << bloco
+        trilha = []
+        for m in inst.grupos[lid]:
+            cor[m] = bloco
+            for k in range(indptr[m], indptr[m + 1]):
+                h = grupo_de[indices[k]]
+                antes = proibidos[h]
+                if not antes & bit:
+                    proibidos[h] = antes | bit
+                    trilha.append((h, antes))
+        self.ordem_alocacao.append(lid)
+        self.cargas.adicionar(bloco, len(inst.grupos[lid]))
+        return trilha
+
+    def desalocar(self, lid, bloco, trilha):
+        """Desfaz alocar(lid, bloco) a partir da trilha devolvida por ele."""
+        proibidos = self.proibidos
+        for h, antes in reversed(trilha):
+            proibidos[h] = antes
+        for m in self.inst.grupos[lid]:
+            self.cor[m] = -1
+        self.ordem_alocacao.pop()
+        self.cargas.remover(bloco, len(self.inst.grupos[lid]))
+
+    def cores(self):
+        nomes, grupos, cor = self.inst.nomes, self.inst.grupos, self.cor
+        out = {}
+        for lid in self.ordem_alocacao:
+            for m in sorted(grupos[lid]):
+                out[nomes[m]] = cor[m]
+        return out
+
+
+def _preparar_instancia(grafo, num_blocos, fixos, pares_mesmo, dominios_por_no,
+                        allow_extra_blocks, hard_fail):
+    """Valida entradas e monta a _Instancia (grupos, domínios, fixos)."""
+    gc = grafo if isinstance(grafo, GrafoCompacto) else GrafoCompacto.de_networkx(grafo)
+    nomes, indice = gc.nomes, gc.indice
+    indptr, indices = gc.indptr, gc.indices
+    n = len(nomes)
 
     # --- Valida nós dos fixos ---
     for no in list(fixos.keys()):
-        if no not in grafo:
+        if no not in indice:
             msg = f"Nó fixo '{no}' não existe no grafo."
             if hard_fail:
                 raise ValueError(msg)
             else:
-                print("[AVISO]", msg)
+                log.warning(msg)
                 fixos.pop(no, None)
+    fixos_idx = {indice[no]: b for no, b in fixos.items()}
 
     # --- Grupos "mesmo bloco" ---
-    nos = list(grafo.nodes())
-    # OBS: pares_mesmo_horario e pares_mesmo_bloco são tratados como "mesmo bloco"
-    pares_unificados = list(pares_mesmo_horario) + list(pares_mesmo_bloco)
-    grupos, grupo_por_no = construir_grupos(nos, pares_unificados)
+    pares_idx = []
+    for a, b in pares_mesmo:
+        if a in indice and b in indice:
+            pares_idx.append((indice[a], indice[b]))
+        else:
+            log.warning("Par ignorado (nó não existe no grafo): (%s, %s)", a, b)
+    grupos, grupo_por_no = construir_grupos(range(n), pares_idx)
 
     # --- Checagem de conflito intra-grupo (arestas dentro do grupo) ---
     for lid, mems in grupos.items():
         for m in mems:
-            for viz in grafo[m]:
+            for k in range(indptr[m], indptr[m + 1]):
+                viz = indices[k]
                 if viz in mems:
-                    msg = (f"Grupo {lid} impossível: '{m}' e '{viz}' são do mesmo grupo e são vizinhos.")
+                    msg = (f"Grupo {nomes[lid]} impossível: '{nomes[m]}' e '{nomes[viz]}' "
+                           f"são do mesmo grupo e são vizinhos.")
                     if hard_fail:
                         raise ValueError(msg)
                     else:
-                        print("[AVISO]", msg)
+                        log.warning(msg)
 
     # --- Domínio por GRUPO = interseção dos domínios dos membros (ou todos os blocos se ninguém tiver domínio) ---
     todos_blocos = set(range(num_blocos))
@@ -149,16 +548,16 @@ def colorir_grafo_balanceado(
     for lid, mems in grupos.items():
         doms = []
         for m in mems:
-            if m in dominios_por_no:
-                doms.append(set(dominios_por_no[m]))
+            if nomes[m] in dominios_por_no:
+                doms.append(set(dominios_por_no[nomes[m]]))
         if doms:
             inter = set.intersection(*doms)
             if not inter:
-                msg = f"Domínio vazio no grupo {lid}: interseção de dias/slots ficou vazia."
+                msg = f"Domínio vazio no grupo {nomes[lid]}: interseção de dias/slots ficou vazia."
                 if hard_fail:
                     raise ValueError(msg)
                 else:
-                    print("[AVISO]", msg)
+                    log.warning(msg)
             dominios_grupo[lid] = inter
         else:
             dominios_grupo[lid] = set(todos_blocos)  # sem restrição de dia
@@ -166,147 +565,1384 @@ def colorir_grafo_balanceado(
     # --- Propaga fixos dentro do grupo e checa compatibilidade com domínio ---
     fixo_por_grupo = {}
     for lid, membros in grupos.items():
-        blocos_dos_membros = {fixos[m] for m in membros if m in fixos}
+        blocos_dos_membros = {fixos_idx[m] for m in membros if m in fixos_idx}
         if len(blocos_dos_membros) > 1:
-            msg = f"Conflito de fixos dentro do grupo {lid}: blocos {sorted(blocos_dos_membros)}."
+            msg = f"Conflito de fixos dentro do grupo {nomes[lid]}: blocos {sorted(blocos_dos_membros)}."
             if hard_fail:
                 raise ValueError(msg)
             else:
-                print("[AVISO]", msg)
+                log.warning(msg)
         if len(blocos_dos_membros) == 1:
             bloco = next(iter(blocos_dos_membros))
             # checa se o bloco fixo está no domínio do grupo (dia correto)
             if bloco not in dominios_grupo[lid]:
-                msg = f"Fixo incompatível com domínio do grupo {lid}: bloco {bloco} fora do dia permitido."
+                msg = f"Fixo incompatível com domínio do grupo {nomes[lid]}: bloco {bloco} fora do dia permitido."
                 if hard_fail:
                     raise ValueError(msg)
                 else:
-                    print("[AVISO]", msg)
+                    log.warning(msg)
             fixo_por_grupo[lid] = bloco
 
-    # --- Checa conflito entre fixos vizinhos ---
-    for a in fixos:
-        for b in grafo.neighbors(a):
-            if b in fixos and fixos[a] == fixos[b]:
-                msg = f"Conflito: '{a}' e '{b}' são vizinhos e estão fixos no mesmo bloco {fixos[a]}."
-                if hard_fail:
-                    raise ValueError(msg)
-                else:
-                    print("[AVISO]", msg)
+    # --- Checa conflito entre fixos vizinhos (o fixo vale para o grupo todo) ---
+    for lid, bloco_a in fixo_por_grupo.items():
+        for a in grupos[lid]:
+            for k in range(indptr[a], indptr[a + 1]):
+                b = indices[k]
+                outro = grupo_por_no[b]
+                if outro > lid and fixo_por_grupo.get(outro) == bloco_a:
+                    fixados = "estão fixos" if a in fixos_idx and b in fixos_idx else "seus grupos estão fixos"
+                    msg = (f"Conflito: '{nomes[a]}' e '{nomes[b]}' são vizinhos e {fixados} "
+                           f"no mesmo bloco {bloco_a}.")
+                    if hard_fail:
+                        raise ValueError(msg)
+                    else:
+                        log.warning(msg)
 
-    # --- Estruturas de alocação ---
-    cores = {}
-    blocos_ocupados = defaultdict(set)
-    blocos_contagem = [0] * num_blocos
+    # --- Universo de blocos (extras só se permitido) ---
+    total_blocos = num_blocos
+    if allow_extra_blocks:
+        extras = [b for d in dominios_grupo.values() for b in d] + list(fixo_por_grupo.values())
+        total_blocos = max([num_blocos] + [b + 1 for b in extras])
+    for bloco in fixo_por_grupo.values():
+        if bloco >= total_blocos:
+            raise ValueError(f"Bloco fixo {bloco} fora do limite num_blocos={num_blocos}.")
 
-    # --- Semeia fixos por grupo ---
-    for lid, membros in grupos.items():
-        if lid in fixo_por_grupo:
-            bloco = fixo_por_grupo[lid]
-            if bloco >= num_blocos:
-                if not allow_extra_blocks:
-                    raise ValueError(f"Bloco fixo {bloco} fora do limite num_blocos={num_blocos}.")
-                while bloco >= len(blocos_contagem):
-                    blocos_contagem.append(0)
-            for m in membros:
-                cores[m] = bloco
-                blocos_ocupados[bloco].add(m)
-            blocos_contagem[bloco] += len(membros)
-
-    # --- Ordenação de grupos sem fixo (por “força”, determinística) ---
-    def grau_grupo(lid):
-        return sum(grafo.degree[n] for n in grupos[lid])
-
-    grupos_nao_fixos = [lid for lid in grupos if lid not in fixo_por_grupo]
-    # critério determinístico: grau, tamanho, menor rótulo
-    grupos_ordenados = sorted(
-        grupos_nao_fixos,
-        key=lambda lid: (grau_grupo(lid), len(grupos[lid]), min(grupos[lid])),
-        reverse=True
-    )
+    return _Instancia(gc, num_blocos, grupos, grupo_por_no, dominios_grupo,
+                      fixo_por_grupo, total_blocos)
 
-    # --- Meta de equilíbrio ---
-    total_nos = grafo.number_of_nodes()
-    blocos_alvo = math.ceil(total_nos / num_blocos) if num_blocos > 0 else total_nos
 
-    # --- Função: grupo cabe no bloco sem conflito e respeitando domínio ---
-    def grupo_cabe_no_bloco(lid, bloco):
-        # respeita domínio do grupo
-        if bloco not in dominios_grupo[lid]:
-            return False
-        mems = grupos[lid]
+def _semear_fixos(inst, estado):
+    for lid in inst.grupos:
+        if lid in inst.fixo_por_grupo:
+            estado.alocar(lid, inst.fixo_por_grupo[lid])
+
+
+def _relatar_grupos(inst, progresso):
+    progresso("grupos", total_grupos=len(inst.grupos), total_nos=len(inst.nomes),
+              fixos=len(inst.fixo_por_grupo), total_blocos=inst.total_blocos)
+
+
+def _falha_alocacao(inst, estado, lid, hard_fail):
+    """DEBUG do grupo que ficou sem bloco + erro/aviso."""
+    nomes, mems = inst.nomes, inst.grupos[lid]
+    indptr, indices, cor = inst.gc.indptr, inst.gc.indices, estado.cor
+    log.debug("Falha ao alocar grupo: %s membros: %s", nomes[lid], sorted(nomes[m] for m in mems))
+    log.debug("Domínio (blocos): %s", sorted(inst.dominios_grupo[lid]))
+    for b in sorted(inst.dominios_grupo[lid]):
+        conflitos = set()
         for m in mems:
-            for viz in grafo[m]:
-                if viz in blocos_ocupados[bloco]:
-                    return False
-        return True
+            for k in range(indptr[m], indptr[m + 1]):
+                if cor[indices[k]] == b:
+                    conflitos.add(nomes[indices[k]])
+        if conflitos:
+            log.debug(" Bloco %s: CONFLITO com %s", b, ", ".join(sorted(conflitos)))
+        else:
+            log.debug(" Bloco %s: sem conflitos (pode ter falhado por meta/capacidade)", b)
+
+    msg = f"Sem bloco disponível no domínio (dia) para o grupo {nomes[lid]}."
+    if hard_fail:
+        raise RuntimeError(msg)
+    else:
+        log.warning(msg)
+
+
+def _alocar_guloso(inst, estado, ao_falhar, rng=None):
+    """
+    Ordem estática por grau: cada grupo vai para o bloco livre (domínio sem
+    proibidos) de menor carga, empate pelo menor índice. Como as cargas são
+    visitadas em ordem crescente, a meta ceil(n / num_blocos) já é respeitada
+    sempre que possível.
+    """
+    prog = estado.progresso
+    for lid in inst.ordem_estatica(rng):
+        if estado.cor[lid] >= 0:
+            continue
+        bloco = estado.cargas.menos_carregado(estado.livres(lid))
+        if bloco is None:
+            ao_falhar(lid)
+            continue
+        estado.alocar(lid, bloco)
+        if prog is not None and prog.tique():
+            estado.relatar_alocacao()
 
-    # --- Alocação por grupos ---
-    for lid in grupos_ordenados:
-        mems = grupos[lid]
-        if any(m in cores for m in mems):
+
+def _alocar_dsatur(inst, estado, ao_falhar, rng=None):
+    """
+    DSATUR por grupos: sempre aloca o grupo com menos blocos livres no seu
+    domínio (i.e. mais blocos proibidos pelos vizinhos já alocados); empate
+    pela ordem estática. Fila de prioridade com invalidação preguiçosa: uma
+    entrada nova é empilhada quando o grupo ganha um bloco proibido.
+    """
+    ordem = inst.ordem_estatica(rng)
+    rank = {lid: r for r, lid in enumerate(ordem)}
+    cor = estado.cor
+    falhos = set()
+    prog = estado.progresso
+
+    fila = [(estado.livres(lid).bit_count(), rank[lid], lid) for lid in ordem]
+    heapq.heapify(fila)
+
+    while fila:
+        qtd, _, lid = heapq.heappop(fila)
+        if cor[lid] >= 0 or lid in falhos or qtd != estado.livres(lid).bit_count():
+            continue  # já resolvido ou entrada velha
+        bloco = estado.cargas.menos_carregado(estado.livres(lid))
+        if bloco is None:
+            ao_falhar(lid)
+            falhos.add(lid)
             continue
-        alocado = False
+        for h, _ in estado.alocar(lid, bloco):
+            if cor[h] < 0:
+                heapq.heappush(fila, (estado.livres(h).bit_count(), rank[h], h))
+        if prog is not None and prog.tique():
+            estado.relatar_alocacao()
 
-        # tenta blocos do DOMÍNIO do grupo em ordem de carga (mais vazios primeiro)
-        candidatos = sorted(
-            dominios_grupo[lid],
-            key=lambda b: blocos_contagem[b] if b < len(blocos_contagem) else 10**9
-        )
 
-        # 1) dentro da meta
-        for bloco in candidatos:
-            if bloco >= num_blocos:
-                if not allow_extra_blocks:
-                    continue
-                while bloco >= len(blocos_contagem):
-                    blocos_contagem.append(0)
-            if grupo_cabe_no_bloco(lid, bloco) and blocos_contagem[bloco] + len(mems) <= blocos_alvo:
-                for m in mems:
-                    cores[m] = bloco
-                    blocos_ocupados[bloco].add(m)
-                blocos_contagem[bloco] += len(mems)
-                alocado = True
+def _busca_completa(inst, ordem_guloso, dica, limite_nos, limite_segundos, stats,
+                    progresso=None):
+    """
+    Busca completa por grupos com forward checking e backjumping dirigido por
+    conflitos (FC-CBJ). Parte da alocação gulosa: os grupos são escolhidos por
+    menos blocos livres (MRV), empate pela ordem em que o guloso os alocou, e o
+    bloco do guloso (dica) é o primeiro valor tentado; depois, menor carga.
+
+    Retorna uma _Alocacao completa, ou None se a instância for inviável ou o
+    limite de nós/tempo estourar (stats["busca_resultado"] diz qual).
+    """
+    estado = _Alocacao(inst, progresso)
+    _semear_fixos(inst, estado)
+    cor, carga = estado.cor, estado.cargas.carga
+    prazo = time.monotonic() + limite_segundos if limite_segundos else None
+
+    livres_grupos = [lid for lid in inst.ordem_estatica() if lid not in dica]
+    rank = {lid: r for r, lid in enumerate(list(ordem_guloso) + livres_grupos)}
+    podas = {lid: set() for lid in inst.grupos}  # níveis que proibiram blocos do grupo
+
+    def fim(resultado, nos, backtracks):
+        stats["busca_nos"] = nos
+        stats["busca_backtracks"] = backtracks
+        stats["busca_resultado"] = resultado
+        return estado if resultado == "solucao" else None
+
+    if any(not estado.livres(lid) for lid in rank):
+        return fim("inviavel", 0, 0)  # fixos/domínios já zeram algum grupo
+    if any(not estado.livres(lid) >> b & 1 for lid, b in inst.fixo_por_grupo.items()):
+        return fim("inviavel", 0, 0)  # fixo em conflito (só avisado sem hard_fail)
+
+    fila = [(estado.livres(lid).bit_count(), rank[lid], lid) for lid in rank]
+    heapq.heapify(fila)
+
+    def escolher():
+        while fila:
+            qtd, _, lid = heapq.heappop(fila)
+            if cor[lid] < 0 and qtd == estado.livres(lid).bit_count():
+                return lid
+        return None
+
+    def candidatos(lid):
+        livres = estado.livres(lid)
+        blocos = []
+        while livres:
+            bit = livres & -livres
+            blocos.append(bit.bit_length() - 1)
+            livres ^= bit
+        blocos.sort(key=lambda b: (b != dica.get(lid), carga[b], b))
+        return blocos
+
+    # pilha de níveis: [lid, candidatos restantes, bloco, trilha, conjunto de conflito]
+    pilha = []
+    nos = backtracks = 0
+
+    def desfazer(d):
+        lid, _, bloco, trilha, _ = pilha[d]
+        for h, _ in trilha:
+            podas[h].discard(d)
+        estado.desalocar(lid, bloco, trilha)
+        pilha[d][2], pilha[d][3] = None, None
+        for h, _ in trilha:
+            if cor[h] < 0:
+                heapq.heappush(fila, (estado.livres(h).bit_count(), rank[h], h))
+        heapq.heappush(fila, (estado.livres(lid).bit_count(), rank[lid], lid))
+
+    lid = escolher()
+    if lid is None:
+        return fim("solucao", nos, backtracks)
+    pilha.append([lid, candidatos(lid), None, None, set()])
+
+    while True:
+        d = len(pilha) - 1
+        lid, cands, _, _, conf = pilha[d]
+
+        avancou = False
+        while cands:
+            nos += 1
+            if nos > limite_nos or (prazo is not None and time.monotonic() > prazo):
+                return fim("limite", nos, backtracks)
+            if progresso is not None and progresso.tique():
+                progresso("busca", nos=nos, backtracks=backtracks,
+                          grupos_alocados=len(estado.ordem_alocacao),
+                          total_grupos=len(inst.grupos))
+
+            bloco = cands.pop(0)
+            trilha = estado.alocar(lid, bloco)
+            pilha[d][2], pilha[d][3] = bloco, trilha
+            for h, _ in trilha:
+                podas[h].add(d)
+
+            # forward checking: algum vizinho livre ficou sem bloco?
+            vazio = None
+            for h, _ in trilha:
+                if cor[h] < 0 and not estado.livres(h):
+                    vazio = h
+                    break
+            if vazio is None:
+                for h, _ in trilha:
+                    if cor[h] < 0:
+                        heapq.heappush(fila, (estado.livres(h).bit_count(), rank[h], h))
+                avancou = True
                 break
 
-        # 2) qualquer bloco do domínio
-        if not alocado:
-            for bloco in candidatos:
-                if bloco >= num_blocos and not allow_extra_blocks:
+            conf |= podas[vazio] - {d}
+            desfazer(d)
+
+        if avancou:
+            prox = escolher()
+            if prox is None:
+                return fim("solucao", nos, backtracks)
+            pilha.append([prox, candidatos(prox), None, None, set()])
+            continue
+
+        # sem valores: salta para o nível mais profundo entre os culpados
+        backtracks += 1
+        culpados = conf | podas[lid]
+        if not culpados:
+            return fim("inviavel", nos, backtracks)
+        alvo = max(culpados)
+        pilha.pop()
+        heapq.heappush(fila, (estado.livres(lid).bit_count(), rank[lid], lid))
+        while len(pilha) - 1 > alvo:
+            desfazer(len(pilha) - 1)
+            pilha.pop()
+        pilha[alvo][4] |= culpados - {alvo}
+        desfazer(alvo)
+
+
+def _desbalanceamento_ideal(inst, tam=None):
+    """
+    Limite inferior do desbalanceamento: arredondamento da média e blocos
+    já cheios só de fixos. tam: lid -> nº de nós (padrão: todos os grupos).
+    """
+    if tam is None:
+        tam = {lid: len(mems) for lid, mems in inst.grupos.items()}
+    nb = inst.total_blocos
+    if not nb:
+        return 1
+    total = sum(tam.values())
+    carga_fixa = [0] * nb
+    for lid, b in inst.fixo_por_grupo.items():
+        carga_fixa[b] += tam.get(lid, 0)
+    return max(0 if total % nb == 0 else 1, max(carga_fixa) - total // nb)
+
+
+def _balancear_busca_local(inst, estado, iteracoes, segundos, semente, stats):
+    """
+    Busca tabu para reduzir o desbalanceamento (carga máx - mín entre os
+    blocos) de uma alocação já viável. Movimentos: um grupo para outro bloco
+    livre, ou troca de uma cadeia de Kempe entre dois blocos. Só mexe em
+    grupos sem fixo e nunca sai do domínio nem cria conflito.
+
+    Custo = (máx - mín, soma dos quadrados das cargas), avaliado de forma
+    incremental sobre _CargasBlocos. Retorna uma _Alocacao com a melhor
+    solução vista.
+    """
+    grupos, dominio_mask = inst.grupos, inst.dominio_mask
+    indptr, indices, grupo_de = inst.gc.indptr, inst.gc.indices, inst.grupo_de
+    nb = inst.total_blocos
+    rng = random.Random(semente)
+    prazo = time.monotonic() + segundos if segundos else None
+
+    bloco = {lid: estado.cor[lid] for lid in estado.ordem_alocacao}
+    moveis = [lid for lid in bloco if lid not in inst.fixo_por_grupo]
+    tam = {lid: len(grupos[lid]) for lid in bloco}
+
+    # adjacência entre grupos (com multiplicidade) e conta[g][b] = nº de nós
+    # vizinhos do grupo g no bloco b; o grupo cabe em b se conta[g][b] == 0
+    adj = {}
+    for lid in bloco:
+        viz = defaultdict(int)
+        for m in grupos[lid]:
+            for k in range(indptr[m], indptr[m + 1]):
+                h = grupo_de[indices[k]]
+                if h != lid and h in bloco:
+                    viz[h] += 1
+        adj[lid] = list(viz.items())
+    conta = {lid: [0] * nb for lid in bloco}
+    for lid in bloco:
+        for h, w in adj[lid]:
+            conta[lid][bloco[h]] += w
+
+    membros = [set() for _ in range(nb)]
+    cargas = _CargasBlocos(nb)
+    for lid, b in bloco.items():
+        membros[b].add(lid)
+        cargas.adicionar(b, tam[lid])
+    carga = cargas.carga
+    quad = [sum(c * c for c in carga)]
+
+    def custo():
+        return (cargas.ordenadas[-1] - cargas.ordenadas[0], quad[0])
+
+    def simular(deltas):
+        """Custo se as cargas mudassem por deltas {bloco: delta} (sem aplicar)."""
+        q = quad[0]
+        for b, dlt in deltas.items():
+            q += (carga[b] + dlt) ** 2 - carga[b] ** 2
+            cargas._mover(b, carga[b], carga[b] + dlt)
+        res = (cargas.ordenadas[-1] - cargas.ordenadas[0], q)
+        for b, dlt in deltas.items():
+            cargas._mover(b, carga[b], carga[b] - dlt)
+        return res
+
+    def mover(lid, para):
+        de = bloco[lid]
+        for h, w in adj[lid]:
+            conta[h][de] -= w
+            conta[h][para] += w
+        bloco[lid] = para
+        membros[de].discard(lid)
+        membros[para].add(lid)
+        s = tam[lid]
+        quad[0] += (carga[de] - s) ** 2 - carga[de] ** 2 + (carga[para] + s) ** 2 - carga[para] ** 2
+        cargas.remover(de, s)
+        cargas.adicionar(para, s)
+
+    def cabe(lid, b):
+        return b != bloco[lid] and (dominio_mask[lid] >> b) & 1 and not conta[lid][b]
+
+    def cadeia(lid, b, limite=64):
+        """Cadeia de Kempe de lid entre bloco[lid] e b (None se travada)."""
+        a = bloco[lid]
+        vistos, fila = {lid}, [lid]
+        while fila:
+            x = fila.pop()
+            outro = b if bloco[x] == a else a
+            if x in inst.fixo_por_grupo or not (dominio_mask[x] >> outro) & 1:
+                return None
+            for h, _ in adj[x]:
+                if h not in vistos and bloco[h] == outro:
+                    vistos.add(h)
+                    fila.append(h)
+                    if len(vistos) > limite:
+                        return None
+        return vistos
+
+    atual = custo()
+    stats["desbalanceamento_inicial"] = atual[0]
+    melhor, melhor_bloco = atual, dict(bloco)
+    ideal = _desbalanceamento_ideal(inst, tam)
+    tabu = {}
+    it = 0
+    prog = estado.progresso
+
+    while it < iteracoes and melhor[0] > ideal and moveis:
+        if prazo is not None and time.monotonic() > prazo:
+            break
+        it += 1
+        cmax, cmin = cargas.ordenadas[-1], cargas.ordenadas[0]
+        blocos_max = [b for b in range(nb) if carga[b] == cmax]
+        blocos_min = [b for b in range(nb) if carga[b] == cmin]
+        origem = [lid for b in blocos_max for lid in membros[b] if lid not in inst.fixo_por_grupo]
+        amostra = moveis if len(moveis) <= 200 else rng.sample(moveis, 200)
+
+        candidatos = []  # (custo, desempate, [(grupo, bloco destino)])
+        for lid in origem:
+            for b in range(nb):
+                if cabe(lid, b):
+                    candidatos.append(([(lid, b)], {bloco[lid]: -tam[lid], b: tam[lid]}))
+            for z in blocos_min:
+                if z == bloco[lid] or cabe(lid, z):
                     continue
-                if bloco >= len(blocos_contagem):
-                    if allow_extra_blocks:
-                        while bloco >= len(blocos_contagem):
-                            blocos_contagem.append(0)
-                    else:
-                        continue
-                if grupo_cabe_no_bloco(lid, bloco):
-                    for m in mems:
-                        cores[m] = bloco
-                        blocos_ocupados[bloco].add(m)
-                    blocos_contagem[bloco] += len(mems)
-                    alocado = True
+                cad = cadeia(lid, z)
+                if cad:
+                    a = bloco[lid]
+                    movs = [(x, z if bloco[x] == a else a) for x in cad]
+                    d_a = sum(tam[x] for x, para in movs if para == a) - sum(tam[x] for x, para in movs if para == z)
+                    candidatos.append((movs, {a: d_a, z: -d_a}))
+        for lid in amostra:
+            for z in blocos_min:
+                if cabe(lid, z):
+                    candidatos.append(([(lid, z)], {bloco[lid]: -tam[lid], z: tam[lid]}))
+
+        escolhido = None
+        for movs, deltas in candidatos:
+            c = simular(deltas)
+            proibido = any(tabu.get((x, para), 0) >= it for x, para in movs)
+            if proibido and not c < melhor:
+                continue
+            chave = (c, rng.random())
+            if escolhido is None or chave < escolhido[0]:
+                escolhido = (chave, movs)
+        if escolhido is None:
+            break
+
+        for x, para in escolhido[1]:
+            tabu[(x, bloco[x])] = it + 7 + rng.randrange(max(1, len(moveis) // 10 + 1))
+            mover(x, para)
+        atual = custo()
+        if atual < melhor:
+            melhor, melhor_bloco = atual, dict(bloco)
+        if prog is not None and prog.tique():
+            prog("balanceamento", iteracao=it, desbalanceamento=melhor[0], ideal=ideal)
+
+    stats["desbalanceamento_final"] = melhor[0]
+    stats["balanceamento_iteracoes"] = it
+
+    novo = _Alocacao(inst, prog)
+    for lid in estado.ordem_alocacao:
+        novo.alocar(lid, melhor_bloco[lid])
+    if prog is not None:
+        prog("balanceamento", iteracao=it, desbalanceamento=melhor[0], ideal=ideal)
+    return novo
+
+
+ESTRATEGIAS = {
+    "guloso": _alocar_guloso,
+    "dsatur": _alocar_dsatur,
+}
+
+
+def _colorir(inst, strategy, hard_fail, busca_completa, limite_nos, limite_segundos, stats,
+             rng=None, relatar=True, progresso=None):
+    """
+    Fixos + estratégia (+ busca completa se pedida).
+    Retorna (_Alocacao, grupos que ficaram sem bloco). Com relatar=True, cada
+    falha gera o DEBUG de _falha_alocacao (e erro, se hard_fail).
+    """
+    estado = _Alocacao(inst, progresso)
+    _semear_fixos(inst, estado)
+    stats["busca_nos"] = 0
+    stats["busca_backtracks"] = 0
+
+    if not busca_completa and relatar:
+        falhos = []
+
+        def ao_falhar(lid):
+            _falha_alocacao(inst, estado, lid, hard_fail)
+            falhos.append(lid)
+
+        ESTRATEGIAS[strategy](inst, estado, ao_falhar, rng)
+        if progresso is not None:
+            estado.relatar_alocacao()
+        return estado, falhos
+
+    falhos = []
+    ESTRATEGIAS[strategy](inst, estado, falhos.append, rng)
+    if progresso is not None:
+        estado.relatar_alocacao()
+    if falhos and busca_completa:
+        log.info("[BUSCA] %d grupo(s) sem bloco no guloso; iniciando busca completa.", len(falhos))
+        dica = {lid: estado.cor[lid] for lid in estado.ordem_alocacao if lid not in inst.fixo_por_grupo}
+        resolvido = _busca_completa(
+            inst, list(dica), dica, limite_nos, limite_segundos, stats, progresso
+        )
+        if progresso is not None:
+            progresso("busca", nos=stats["busca_nos"], backtracks=stats["busca_backtracks"],
+                      resultado=stats["busca_resultado"])
+        log.info("[BUSCA] %s: %d nós, %d backtracks.",
+                 stats["busca_resultado"], stats["busca_nos"], stats["busca_backtracks"])
+        if resolvido is not None:
+            return resolvido, []
+    if relatar:
+        for lid in falhos:
+            _falha_alocacao(inst, estado, lid, hard_fail)
+
+    return estado, falhos
+
+
+def resumo_alocacao(cores):
+    """(blocos_usados, desbalanceamento) como em /gerar-grade: só blocos usados."""
+    dist = defaultdict(int)
+    for b in cores.values():
+        dist[b] += 1
+    if not dist:
+        return 0, 0
+    return len(dist), max(dist.values()) - min(dist.values())
+
+
+# ========= Portfólio (várias ordens/estratégias em paralelo) =========
+
+def _tentativa_portfolio(inst, strategy, semente, opcoes):
+    """
+    Uma tentativa do portfólio (roda em processo separado). semente=None é a
+    ordem determinística; senão a ordem é perturbada com random.Random(semente).
+    """
+    rng = None if semente is None else random.Random(semente)
+    stats = {}
+    t0 = time.perf_counter()
+    estado, falhos = _colorir(
+        inst, strategy, False, opcoes["busca_completa"], opcoes["limite_nos"],
+        opcoes["limite_segundos"], stats, rng=rng, relatar=False
+    )
+    if not falhos and opcoes["balancear"]:
+        estado = _balancear_busca_local(
+            inst, estado, opcoes["balancear_iteracoes"], opcoes["balancear_segundos"],
+            semente or 0, stats
+        )
+    cores = estado.cores()
+    blocos_usados, desbalanceamento = resumo_alocacao(cores)
+    return {
+        "viavel": not falhos,
+        "desbalanceamento": desbalanceamento,
+        "blocos_usados": blocos_usados,
+        "strategy": strategy,
+        "semente": semente,
+        "segundos": time.perf_counter() - t0,
+        "stats": stats,
+        "cores": cores,
+    }
+
+
+def _chave_portfolio(res):
+    return (not res["viavel"], res["desbalanceamento"], res["blocos_usados"])
+
+
+def colorir_portfolio(
+    grafo,
+    num_blocos=10,
+    fixos=None,
+    pares_mesmo_horario=None,
+    pares_mesmo_bloco=None,
+    dominios_por_no=None,
+    allow_extra_blocks=False,
+    hard_fail=True,
+    tentativas=8,
+    trabalhadores=None,        # processos; None = nº de CPUs, 1 = sem pool
+    estrategias=("guloso", "dsatur"),
+    alvo_desbalanceamento=None,  # para cedo ao achar solução viável com desb <= alvo
+    semente=0,
+    busca_completa=False,
+    limite_nos=200000,
+    limite_segundos=10.0,
+    balancear=False,
+    balancear_iteracoes=2000,
+    balancear_segundos=5.0,
+    stats=None,
+    progresso=None
+):
+    """
+    Portfólio: roda 'tentativas' alocações (estratégias alternadas, cada uma
+    com sua semente) num ProcessPoolExecutor e fica com a melhor por
+    (viável, desbalanceamento, blocos_usados). As primeiras tentativas de cada
+    estratégia usam a ordem determinística. Retorna dict nome -> bloco.
+    """
+    if stats is None:
+        stats = {}
+    if fixos is None:
+        fixos = {}
+    progresso = _progresso(progresso)
+    pares = list(pares_mesmo_horario or []) + list(pares_mesmo_bloco or [])
+    for st in estrategias:
+        if st not in ESTRATEGIAS:
+            raise ValueError(f"strategy inválida: '{st}' (use {', '.join(ESTRATEGIAS)}).")
+
+    inst = _preparar_instancia(
+        grafo, num_blocos, fixos, pares, dominios_por_no or {}, allow_extra_blocks, hard_fail
+    )
+    if progresso is not None:
+        _relatar_grupos(inst, progresso)
+    opcoes = {
+        "busca_completa": busca_completa, "limite_nos": limite_nos,
+        "limite_segundos": limite_segundos, "balancear": balancear,
+        "balancear_iteracoes": balancear_iteracoes, "balancear_segundos": balancear_segundos,
+    }
+    tarefas = []
+    for i in range(max(1, tentativas)):
+        st = estrategias[i % len(estrategias)]
+        sem = None if i < len(estrategias) else semente + i
+        tarefas.append((st, sem))
+
+    def bom_o_bastante(res):
+        return (alvo_desbalanceamento is not None and res["viavel"]
+                and res["desbalanceamento"] <= alvo_desbalanceamento)
+
+    melhor, feitas = None, 0
+
+    def registrar(res):
+        nonlocal melhor, feitas
+        feitas += 1
+        if melhor is None or _chave_portfolio(res) < _chave_portfolio(melhor):
+            melhor = res
+        if progresso is not None:
+            progresso("portfolio", tentativas_feitas=feitas, total_tentativas=len(tarefas),
+                      melhor_viavel=melhor["viavel"],
+                      melhor_desbalanceamento=melhor["desbalanceamento"])
+        return bom_o_bastante(melhor)
+
+    if trabalhadores == 1:
+        for st, sem in tarefas:
+            if registrar(_tentativa_portfolio(inst, st, sem, opcoes)):
+                break
+    else:
+        pool = ProcessPoolExecutor(max_workers=trabalhadores)
+        try:
+            futuros = [pool.submit(_tentativa_portfolio, inst, st, sem, opcoes) for st, sem in tarefas]
+            for fut in as_completed(futuros):
+                if registrar(fut.result()):
                     break
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    stats.update(melhor["stats"])
+    stats["portfolio_tentativas"] = feitas
+    stats["portfolio_strategy"] = melhor["strategy"]
+    stats["portfolio_semente"] = melhor["semente"]
+    log.info("[PORTFOLIO] %d tentativa(s); melhor: %s (semente %s), viável=%s, desbalanceamento=%s.",
+             feitas, melhor["strategy"], melhor["semente"], melhor["viavel"], melhor["desbalanceamento"])
+
+    if not melhor["viavel"]:
+        # refaz a tentativa determinística para o relatório de falha usual
+        estado, _ = _colorir(inst, estrategias[0], hard_fail, busca_completa,
+                             limite_nos, limite_segundos, {})
+        return estado.cores()
+    return melhor["cores"]
+
+
+def colorir_grafo_balanceado(
+    grafo,
+    num_blocos=10,
+    fixos=None,
+    pares_mesmo_horario=None,
+    pares_mesmo_bloco=None,
+    dominios_por_no=None,      # dict no -> set(blocos permitidos)
+    allow_extra_blocks=False,
+    hard_fail=True,
+    strategy="guloso",         # chave de ESTRATEGIAS: "guloso" | "dsatur"
+    busca_completa=False,      # se o guloso falhar, tenta busca completa (FC-CBJ)
+    limite_nos=200000,
+    limite_segundos=10.0,
+    balancear=False,           # busca tabu para reduzir o desbalanceamento no fim
+    balancear_iteracoes=2000,
+    balancear_segundos=5.0,
+    semente=0,
+    stats=None,                # dict opcional preenchido com contadores do motor
+    progresso=None             # callable(evento: dict) para acompanhar ao vivo
+):
+    """
+    Aloca cada nó em um bloco (cor) sem conflito entre vizinhos.
+    grafo pode ser nx.Graph ou GrafoCompacto; internamente o motor trabalha
+    sempre sobre o GrafoCompacto (nós como inteiros).
+    Retorna dict nome -> bloco.
+    """
+    if stats is None:
+        stats = {}
+    if fixos is None:
+        fixos = {}
+    progresso = _progresso(progresso)
+    if pares_mesmo_horario is None:
+        pares_mesmo_horario = []
+    if pares_mesmo_bloco is None:
+        pares_mesmo_bloco = []
+    if dominios_por_no is None:
+        dominios_por_no = {}
+    if strategy not in ESTRATEGIAS:
+        raise ValueError(f"strategy inválida: '{strategy}' (use {', '.join(ESTRATEGIAS)}).")
+
+    # OBS: pares_mesmo_horario e pares_mesmo_bloco são tratados como "mesmo bloco"
+    inst = _preparar_instancia(
+        grafo, num_blocos, fixos,
+        list(pares_mesmo_horario) + list(pares_mesmo_bloco),
+        dominios_por_no, allow_extra_blocks, hard_fail
+    )
+    if progresso is not None:
+        _relatar_grupos(inst, progresso)
+
+    estado, _ = _colorir(inst, strategy, hard_fail, busca_completa, limite_nos, limite_segundos,
+                         stats, progresso=progresso)
+
+    if balancear:
+        estado = _balancear_busca_local(
+            inst, estado, balancear_iteracoes, balancear_segundos, semente, stats
+        )
+        log.info("[BALANCEAMENTO] desbalanceamento %d -> %d em %d iterações.",
+                 stats["desbalanceamento_inicial"], stats["desbalanceamento_final"],
+                 stats["balanceamento_iteracoes"])
+
+    return estado.cores()
+
+
+# ========= Decomposição em componentes conexas =========
+
+def _componentes(inst):
+    """
+    Componentes conexas do grafo de grupos (arestas de conflito + "mesmo
+    bloco", que já estão dentro dos grupos), como listas de líderes; as
+    maiores (em nós) primeiro.
+    """
+    grupos, grupo_de = inst.grupos, inst.grupo_de
+    indptr, indices = inst.gc.indptr, inst.gc.indices
+    visto, comps = set(), []
+    for lid in grupos:
+        if lid in visto:
+            continue
+        visto.add(lid)
+        comp, pilha = [], [lid]
+        while pilha:
+            g = pilha.pop()
+            comp.append(g)
+            for m in grupos[g]:
+                for k in range(indptr[m], indptr[m + 1]):
+                    h = grupo_de[indices[k]]
+                    if h not in visto:
+                        visto.add(h)
+                        pilha.append(h)
+        comps.append(comp)
+    comps.sort(key=lambda c: sum(len(grupos[g]) for g in c), reverse=True)
+    return comps
+
+
+def _subinstancia(inst, lids):
+    """
+    _Instancia só com os grupos de uma componente (nós renumerados).
+    Retorna (sub, nos), com nos[i local] = nó na instância original.
+    """
+    grupos = inst.grupos
+    nos = sorted(m for lid in lids for m in grupos[lid])
+    local = {m: i for i, m in enumerate(nos)}
+    gc = inst.gc.subgrafo(nos)
+    sub_grupos = {local[lid]: {local[m] for m in grupos[lid]} for lid in lids}
+    grupo_por_no = {i: lid for lid, mems in sub_grupos.items() for i in mems}
+    dominios = {local[lid]: inst.dominios_grupo[lid] for lid in lids}
+    fixos = {local[lid]: inst.fixo_por_grupo[lid] for lid in lids if lid in inst.fixo_por_grupo}
+    mascaras = {local[lid]: inst.dominio_mask[lid] for lid in lids}
+    sub = _Instancia(gc, inst.num_blocos, sub_grupos, grupo_por_no, dominios, fixos,
+                     inst.total_blocos, mascaras)
+    return sub, nos
+
+
+def _resolver_componentes(subs, strategy, opcoes):
+    """
+    Resolve uma fatia de componentes (roda em processo separado).
+    Retorna [(cor por nó local, falhou, stats)].
+    """
+    out = []
+    for sub in subs:
+        stats = {}
+        estado, falhos = _colorir(
+            sub, strategy, False, opcoes["busca_completa"], opcoes["limite_nos"],
+            opcoes["limite_segundos"], stats, relatar=False
+        )
+        out.append((estado.cor, bool(falhos), stats))
+    return out
+
+
+def _classes_de_blocos(sub):
+    """
+    Blocos intercambiáveis numa componente: os que pertencem exatamente aos
+    mesmos domínios (e fixos) dos seus grupos. Permutar blocos dentro de uma
+    classe preserva domínios, fixos e a ausência de conflitos.
+    """
+    mascaras = {sub.dominio_mask[lid] for lid in sub.grupos}
+    mascaras.update(1 << b for b in sub.fixo_por_grupo.values())
+    mascaras = list(mascaras)
+    classes = defaultdict(list)
+    for b in range(sub.total_blocos):
+        classes[tuple(m >> b & 1 for m in mascaras)].append(b)
+    return list(classes.values())
+
+
+def _mesclar_componentes(inst, resolvidas):
+    """
+    Junta as colorações das componentes numa _Alocacao global. Cada
+    componente (maiores primeiro) tem seus blocos permutados dentro das
+    classes de _classes_de_blocos: o bloco mais cheio da componente vai para
+    o bloco globalmente mais vazio, e assim por diante.
+    resolvidas: [(sub, nos, cor)].
+    """
+    # as componentes não se tocam: preenche cor/cargas direto, sem alocar()
+    # (estado.proibidos não é mantido; depois daqui só cores() e a busca tabu
+    # leem o estado)
+    carga = [0] * inst.total_blocos
+    estado = _Alocacao(inst)
+    for sub, nos, cor in resolvidas:
+        qtd = [0] * inst.total_blocos
+        for c in cor:
+            qtd[c] += 1
+        perm = list(range(inst.total_blocos))
+        for classe in _classes_de_blocos(sub):
+            origem = sorted(classe, key=lambda b: -qtd[b])
+            destino = sorted(classe, key=lambda b: carga[b])
+            for a, b in zip(origem, destino):
+                perm[a] = b
+        for lid, mems in sub.grupos.items():
+            bloco = perm[cor[lid]]
+            for m in mems:
+                estado.cor[nos[m]] = bloco
+            estado.ordem_alocacao.append(inst.grupo_de[nos[lid]])
+            estado.cargas.adicionar(bloco, len(mems))
+            carga[bloco] += len(mems)
+    return estado
+
+
+def colorir_por_componentes(
+    grafo,
+    num_blocos=10,
+    fixos=None,
+    pares_mesmo_horario=None,
+    pares_mesmo_bloco=None,
+    dominios_por_no=None,
+    allow_extra_blocks=False,
+    hard_fail=True,
+    strategy="guloso",
+    busca_completa=False,
+    limite_nos=200000,
+    limite_segundos=10.0,
+    balancear=False,
+    balancear_iteracoes=2000,
+    balancear_segundos=5.0,
+    semente=0,
+    trabalhadores=None,        # processos; None = nº de CPUs, 1 = sem pool
+    stats=None,
+    progresso=None
+):
+    """
+    Mesma interface de colorir_grafo_balanceado, mas separa o grafo (arestas
+    + grupos "mesmo bloco") em componentes conexas e resolve cada uma de
+    forma independente, em fatias num ProcessPoolExecutor. As colorações são
+    juntadas por _mesclar_componentes (permutação de blocos por componente
+    para equilibrar a carga). Como cada componente foi colorida sem ver as
+    outras, domínios por dia podem deixar a permutação longe do ideal: nesse
+    caso (ou com balancear) a mescla termina com a busca tabu global.
+    Se alguma componente falhar, refaz no problema inteiro (relatório de
+    falha usual). Retorna dict nome -> bloco.
+    """
+    if stats is None:
+        stats = {}
+    if fixos is None:
+        fixos = {}
+    progresso = _progresso(progresso)
+    pares = list(pares_mesmo_horario or []) + list(pares_mesmo_bloco or [])
+    if strategy not in ESTRATEGIAS:
+        raise ValueError(f"strategy inválida: '{strategy}' (use {', '.join(ESTRATEGIAS)}).")
+
+    inst = _preparar_instancia(
+        grafo, num_blocos, fixos, pares, dominios_por_no or {}, allow_extra_blocks, hard_fail
+    )
+    if progresso is not None:
+        _relatar_grupos(inst, progresso)
+
+    comps = [_subinstancia(inst, c) for c in _componentes(inst)]
+    opcoes = {"busca_completa": busca_completa, "limite_nos": limite_nos,
+              "limite_segundos": limite_segundos}
+
+    # fatias equilibradas em nº de nós (maior componente vai para a fatia mais leve)
+    n_fatias = min(len(comps), trabalhadores or os.cpu_count() or 1)
+    fatias = [[] for _ in range(n_fatias)]
+    heap = [(0, i) for i in range(n_fatias)]
+    for pos, (sub, _) in enumerate(comps):
+        tam, i = heapq.heappop(heap)
+        fatias[i].append(pos)
+        heapq.heappush(heap, (tam + len(sub.nomes), i))
+
+    resultados, feitas = [None] * len(comps), 0
+
+    def registrar(fatia, saida):
+        nonlocal feitas
+        for pos, res in zip(fatia, saida):
+            resultados[pos] = res
+        feitas += len(fatia)
+        if progresso is not None:
+            progresso("componentes", componentes_resolvidas=feitas, total_componentes=len(comps))
+
+    if n_fatias <= 1:
+        registrar(list(range(len(comps))), _resolver_componentes([s for s, _ in comps], strategy, opcoes))
+    else:
+        with ProcessPoolExecutor(max_workers=n_fatias) as pool:
+            futuros = {
+                pool.submit(_resolver_componentes, [comps[p][0] for p in fatia], strategy, opcoes): fatia
+                for fatia in fatias
+            }
+            for fut in as_completed(futuros):
+                registrar(futuros[fut], fut.result())
+
+    stats["componentes"] = len(comps)
+    stats["componentes_maior"] = len(comps[0][0].nomes) if comps else 0
+    stats["busca_nos"] = sum(r[2].get("busca_nos", 0) for r in resultados)
+    stats["busca_backtracks"] = sum(r[2].get("busca_backtracks", 0) for r in resultados)
 
-        # 3) falhou: DEBUG + erro/aviso
-        if not alocado:
-            print("\n[DEBUG] Falha ao alocar grupo:", lid, "membros:", sorted(mems))
-            print("[DEBUG] Domínio (blocos):", sorted(dominios_grupo[lid]))
-            for b in sorted(dominios_grupo[lid]):
-                conflitos = set()
-                for m in mems:
-                    for viz in grafo[m]:
-                        if viz in blocos_ocupados.get(b, set()):
-                            conflitos.add(viz)
-                if conflitos:
-                    print(f"[DEBUG]  Bloco {b}: CONFLITO com", ", ".join(sorted(conflitos)))
+    refinar = balancear
+    if any(falhou for _, falhou, _ in resultados):
+        log.info("[COMPONENTES] componente sem solução; refazendo no problema inteiro.")
+        estado, _ = _colorir(inst, strategy, hard_fail, busca_completa, limite_nos,
+                             limite_segundos, stats, progresso=progresso)
+    else:
+        estado = _mesclar_componentes(
+            inst, [(sub, nos, res[0]) for (sub, nos), res in zip(comps, resultados)]
+        )
+        stats["desbalanceamento_mesclagem"] = resumo_alocacao(estado.cores())[1]
+        log.info("[COMPONENTES] %d componente(s), maior com %d nó(s), em %d fatia(s); "
+                 "desbalanceamento após a mescla: %d.",
+                 len(comps), stats["componentes_maior"], n_fatias, stats["desbalanceamento_mesclagem"])
+        refinar = refinar or stats["desbalanceamento_mesclagem"] > _desbalanceamento_ideal(inst)
+
+    if refinar:
+        estado = _balancear_busca_local(
+            inst, estado, balancear_iteracoes, balancear_segundos, semente, stats
+        )
+        log.info("[BALANCEAMENTO] desbalanceamento %d -> %d em %d iterações.",
+                 stats["desbalanceamento_inicial"], stats["desbalanceamento_final"],
+                 stats["balanceamento_iteracoes"])
+
+    return estado.cores()
+
+
+# ========= Re-solução incremental a partir de uma alocação anterior =========
+
+def colorir_incremental(
+    grafo,
+    alocacao_anterior,         # dict nome -> bloco de uma geração anterior
+    num_blocos=10,
+    fixos=None,
+    pares_mesmo_horario=None,
+    pares_mesmo_bloco=None,
+    dominios_por_no=None,
+    allow_extra_blocks=False,
+    hard_fail=True,
+    strategy="dsatur",
+    limite_nos=200000,
+    limite_segundos=10.0,
+    stats=None,
+    progresso=None
+):
+    """
+    Repara uma alocação anterior em vez de resolver do zero.
+
+    1) Mantém o bloco anterior de cada grupo que continua coerente (todos os
+       membros no mesmo bloco, dentro do domínio, sem conflito com o que já
+       foi mantido); fixos entram primeiro.
+    2) Só os grupos invalidados (novos, alterados ou em conflito) passam pela
+       estratégia, sobre a alocação parcial.
+    3) Se ainda sobrar grupo, a busca completa recomeça tentando primeiro os
+       blocos anteriores (dica), para mexer no mínimo possível.
+
+    stats recebe incremental_mantidos, incremental_invalidados e
+    incremental_movidos (ocorrências que mudaram de bloco).
+    """
+    if stats is None:
+        stats = {}
+    if fixos is None:
+        fixos = {}
+    if strategy not in ESTRATEGIAS:
+        raise ValueError(f"strategy inválida: '{strategy}' (use {', '.join(ESTRATEGIAS)}).")
+    progresso = _progresso(progresso)
+
+    inst = _preparar_instancia(
+        grafo, num_blocos, fixos,
+        list(pares_mesmo_horario or []) + list(pares_mesmo_bloco or []),
+        dominios_por_no or {}, allow_extra_blocks, hard_fail
+    )
+    if progresso is not None:
+        _relatar_grupos(inst, progresso)
+    return _reparar(inst, alocacao_anterior, strategy, hard_fail, limite_nos, limite_segundos,
+                    stats, progresso)
+
+
+def _reparar(inst, alocacao_anterior, strategy, hard_fail, limite_nos, limite_segundos, stats,
+             progresso=None, relatar=True):
+    """Núcleo de colorir_incremental sobre uma _Instancia já preparada."""
+    indice = inst.gc.indice
+    anterior = {}
+    for nome, bloco in (alocacao_anterior or {}).items():
+        if nome in indice:
+            anterior[indice[nome]] = int(bloco)
+
+    estado = _Alocacao(inst, progresso)
+    _semear_fixos(inst, estado)
+    stats["busca_nos"] = 0
+    stats["busca_backtracks"] = 0
+
+    # 1) mantém o que ainda é válido
+    dica = {}
+    mantidos = []
+    for lid in inst.ordem_estatica():
+        blocos = {anterior.get(m) for m in inst.grupos[lid]}
+        if len(blocos) != 1 or None in blocos:
+            continue
+        bloco = blocos.pop()
+        if not 0 <= bloco < inst.total_blocos:
+            continue
+        dica[lid] = bloco
+        if (estado.livres(lid) >> bloco) & 1:
+            estado.alocar(lid, bloco)
+            mantidos.append(lid)
+
+    invalidados = [lid for lid in inst.grupos if estado.cor[lid] < 0]
+    log.info("[INCREMENTAL] %d grupo(s) mantido(s), %d a realocar.", len(mantidos), len(invalidados))
+
+    # 2) realoca só os invalidados
+    falhos = []
+    ESTRATEGIAS[strategy](inst, estado, falhos.append)
+    if progresso is not None:
+        estado.relatar_alocacao()
+
+    # 3) busca completa guiada pela alocação anterior
+    if falhos:
+        log.info("[BUSCA] %d grupo(s) sem bloco no reparo local; iniciando busca completa.", len(falhos))
+        for lid in estado.ordem_alocacao:
+            dica.setdefault(lid, estado.cor[lid])
+        dica = {lid: b for lid, b in dica.items() if lid not in inst.fixo_por_grupo}
+        ja = set(mantidos)
+        resolvido = _busca_completa(
+            inst, mantidos + [lid for lid in dica if lid not in ja],
+            dica, limite_nos, limite_segundos, stats, progresso
+        )
+        log.info("[BUSCA] %s: %d nós, %d backtracks.",
+                 stats["busca_resultado"], stats["busca_nos"], stats["busca_backtracks"])
+        if resolvido is not None:
+            estado = resolvido
+        elif relatar:
+            for lid in falhos:
+                _falha_alocacao(inst, estado, lid, hard_fail)
+
+    cores = estado.cores()
+    movidos = sum(
+        1 for nome, bloco in cores.items()
+        if nome in alocacao_anterior and int(alocacao_anterior[nome]) != bloco
+    )
+    stats["incremental_mantidos"] = sum(len(inst.grupos[lid]) for lid in mantidos)
+    stats["incremental_invalidados"] = sum(len(inst.grupos[lid]) for lid in invalidados)
+    stats["incremental_movidos"] = movidos
+    return cores
+
+
+# ========= Calendário mínimo (menor nº de blocos viável) =========
+
+def cliques_de_conflito(disciplinas, conflito_por_prof=True, conflito_por_semestre=True,
+                        com_origem=False):
+    """
+    Cliques conhecidas do grafo (uma por professor e por semestre), como listas
+    de nomes. com_origem=True devolve pares ({"origem", "chave"}, nomes), ex.:
+    ({"origem": "semestre", "chave": "3"}, [...]).
+    """
+    nomes = [d["nome"] for d in disciplinas]
+    cliques = []
+    for (origem, chave), idxs in _baldes_conflito(disciplinas, conflito_por_prof, conflito_por_semestre):
+        if len(idxs) > 1:
+            membros = [nomes[i] for i in idxs]
+            cliques.append(({"origem": origem, "chave": chave}, membros) if com_origem else membros)
+    return cliques
+
+
+def limite_inferior_cores(cliques, pares_mesmo=(), rotulo_por_no=None):
+    """
+    Limite inferior do nº de blocos: numa clique, cada grupo "mesmo bloco"
+    precisa de um bloco próprio, então o limite é o maior nº de grupos
+    distintos numa clique. Com rotulo_por_no (ex.: nó -> dia fixo), também
+    conta, por rótulo, os grupos da clique presos àquele rótulo (todos eles
+    disputam os blocos de um único dia).
+    Retorna (limite, {rotulo: limite}).
+    """
+    rotulo_por_no = rotulo_por_no or {}
+    nos = {n for c in cliques for n in c}
+    nos.update(n for par in pares_mesmo for n in par)
+    _, grupo_por_no = construir_grupos(nos, [p for p in pares_mesmo if p[0] != p[1]])
+
+    rotulo_grupo = {}
+    for no, rot in rotulo_por_no.items():
+        if no in grupo_por_no:
+            rotulo_grupo.setdefault(grupo_por_no[no], rot)
+
+    limite, por_rotulo = 0, {}
+    for clique in cliques:
+        grupos = {grupo_por_no[n] for n in clique}
+        limite = max(limite, len(grupos))
+        contagem = defaultdict(int)
+        for g in grupos:
+            if g in rotulo_grupo:
+                contagem[rotulo_grupo[g]] += 1
+        for rot, qtd in contagem.items():
+            por_rotulo[rot] = max(por_rotulo.get(rot, 0), qtd)
+    return limite, por_rotulo
+
+
+def colorir_calendario_minimo(
+    grafo,
+    calendario,                # k -> kwargs do motor: num_blocos, fixos, dominios_por_no, pares_mesmo_bloco
+    k_min,
+    k_max,
+    remapear=None,             # (cores, k_de, k_para) -> cores no calendário k_para
+    strategy="dsatur",
+    limite_nos=200000,
+    limite_segundos=10.0,
+    stats=None
+):
+    """
+    Menor k em [k_min, k_max] com calendario(k) viável.
+
+    Sobe a partir de k_min com passo dobrando até achar um k viável e então
+    faz bisseção entre o último inviável e ele. Nada é refeito: o grafo vira
+    GrafoCompacto uma vez, cada k é tentado no máximo uma vez, e cada
+    tentativa parte da alocação mais próxima já vista (a viável de menor k
+    acima, ou a parcial da última tentativa), levada para o novo calendário
+    por remapear e reparada como em colorir_incremental. Sem alocação
+    anterior, usa a estratégia com busca completa.
+
+    Tentativas que estouram o limite da busca contam como inviáveis, mas
+    deixam stats["otimo_provado"] = False.
+    Retorna (k, cores), ou (None, {}) se nem k_max couber.
+    """
+    if stats is None:
+        stats = {}
+    if strategy not in ESTRATEGIAS:
+        raise ValueError(f"strategy inválida: '{strategy}' (use {', '.join(ESTRATEGIAS)}).")
+    gc = grafo if isinstance(grafo, GrafoCompacto) else GrafoCompacto.de_networkx(grafo)
+    n = gc.number_of_nodes()
+
+    feitas = {}        # k -> (viavel, cores, resultado)
+    tentativas = []
+
+    def semente(k):
+        acima = [kk for kk, (ok, _, _) in feitas.items() if ok and kk > k]
+        if acima:
+            kk = min(acima)
+        elif tentativas:
+            kk = tentativas[-1]["k"]
+        else:
+            return None
+        cores = feitas[kk][1]
+        if not cores:
+            return None
+        return remapear(cores, kk, k) if remapear else dict(cores)
+
+    def tentar(k):
+        if k in feitas:
+            return feitas[k][0]
+        t0 = time.perf_counter()
+        st = {}
+        anterior = semente(k)
+        try:
+            kw = calendario(k)
+            inst = _preparar_instancia(
+                gc, kw["num_blocos"], dict(kw.get("fixos") or {}),
+                list(kw.get("pares_mesmo_bloco") or []), kw.get("dominios_por_no") or {},
+                False, True
+            )
+            if anterior is not None:
+                cores = _reparar(inst, anterior, strategy, False, limite_nos, limite_segundos,
+                                 st, relatar=False)
+            else:
+                estado, _ = _colorir(inst, strategy, False, True, limite_nos, limite_segundos,
+                                     st, relatar=False)
+                cores = estado.cores()
+            viavel = len(cores) == n
+            resultado = "solucao" if viavel else st.get("busca_resultado", "inviavel")
+        except ValueError as e:
+            cores, viavel, resultado = {}, False, f"inviavel: {e}"
+
+        feitas[k] = (viavel, cores, resultado)
+        tentativas.append({
+            "k": k, "viavel": viavel, "resultado": resultado,
+            "reaproveitou": anterior is not None,
+            "segundos": round(time.perf_counter() - t0, 4),
+        })
+        log.info("[CALENDARIO] k=%d: %s (%ss).", k, resultado, tentativas[-1]["segundos"])
+        return viavel
+
+    k_min = max(1, k_min)
+    inviavel, k, passo = k_min - 1, k_min, 1
+    while k <= k_max and not tentar(k):
+        inviavel = k
+        if k == k_max:
+            break
+        k = min(k_max, k + passo)
+        passo *= 2
+
+    stats["tentativas"] = tentativas
+    if not feitas.get(k, (False,))[0]:
+        stats["otimo_provado"] = False
+        return None, {}
+
+    while k - inviavel > 1:
+        meio = (inviavel + k) // 2
+        if tentar(meio):
+            k = meio
+        else:
+            inviavel = meio
+
+    stats["otimo_provado"] = all(
+        t["viavel"] or t["resultado"] != "limite" for t in tentativas if t["k"] < k
+    )
+    return k, feitas[k][1]
+
+
+# ========= Análise de inviabilidade (antes do motor) =========
+
+class EntradaInviavel(ValueError):
+    """Entrada reprovada por analisar_inviabilidade; os certificados ficam em .certificados."""
+
+    def __init__(self, certificados):
+        self.certificados = certificados
+        extra = f" (+{len(certificados) - 1} outro(s))" if len(certificados) > 1 else ""
+        super().__init__(certificados[0]["mensagem"] + extra)
+
+
+def _blocos_da_mascara(mascara):
+    return [b for b in range(mascara.bit_length()) if mascara >> b & 1]
+
+
+def analisar_inviabilidade(grafo, num_blocos, fixos=None, pares_mesmo=(), dominios_por_no=None,
+                           cliques=(), dia_por_bloco=None):
+    """
+    Condições necessárias de viabilidade, checadas antes do motor em tempo
+    quase linear (nós + vizinhança dos grupos e fixos + tamanho das cliques):
+
+    - grupo "mesmo bloco" com dois membros vizinhos ou com fixos diferentes;
+    - grupo cujo domínio (interseção dos membros, e o fixo) ficou vazio;
+    - grupos vizinhos fixos no mesmo bloco (o fixo de um membro vale para
+      o grupo inteiro);
+    - clique com mais grupos que blocos, que a união dos domínios dos seus
+      grupos, ou que os blocos de um domínio (ex.: um dia) ao qual parte
+      dos grupos está presa (pombos por dia).
+
+    cliques: [(origem, nomes)] de cliques_de_conflito(..., com_origem=True).
+    dia_por_bloco: dict bloco -> dia, só para rotular os certificados.
+    Retorna a lista de certificados: dicts com "tipo", "mensagem", "nos" e os
+    dados que provam a inviabilidade. Lista vazia não garante viabilidade.
+    """
+    fixos = fixos or {}
+    dominios_por_no = dominios_por_no or {}
+    dia_por_bloco = dia_por_bloco or {}
+    gc = grafo if isinstance(grafo, GrafoCompacto) else GrafoCompacto.de_networkx(grafo)
+    nomes, indice = gc.nomes, gc.indice
+    indptr, indices = gc.indptr, gc.indices
+    todos = (1 << num_blocos) - 1
+    certificados = []
+
+    def certificar(tipo, mensagem, nos, **dados):
+        certificados.append({"tipo": tipo, "mensagem": mensagem, "nos": sorted(nos), **dados})
+
+    fixos_idx = {indice[no]: b for no, b in fixos.items() if no in indice}
+    pares_idx = [(indice[a], indice[b]) for a, b in pares_mesmo if a in indice and b in indice]
+    grupos, grupo_de = construir_grupos(range(len(nomes)), pares_idx)
+
+    # --- Grupos: conflito interno, fixos e domínio (como máscara de blocos) ---
+    mascara, fixado = {}, {}
+    for lid, mems in grupos.items():
+        membros = sorted(nomes[m] for m in mems)
+        if len(mems) > 1:
+            for m in mems:
+                viz = next((indices[k] for k in range(indptr[m], indptr[m + 1]) if indices[k] in mems), None)
+                if viz is not None:
+                    certificar("grupo_com_conflito",
+                               f"Grupo {membros[0]} impossível: '{nomes[m]}' e '{nomes[viz]}' "
+                               f"são do mesmo grupo e são vizinhos.",
+                               [nomes[m], nomes[viz]], grupo=membros)
+                    break
+
+        dom, restritos = todos, []
+        for m in mems:
+            if nomes[m] in dominios_por_no:
+                dom &= sum(1 << b for b in set(dominios_por_no[nomes[m]]) if 0 <= b < num_blocos)
+                restritos.append(nomes[m])
+        if restritos and not dom:
+            certificar("dominio_vazio",
+                       f"Domínio vazio no grupo {membros[0]}: interseção de dias/slots ficou vazia.",
+                       restritos, grupo=membros,
+                       dominios={n: sorted(dominios_por_no[n]) for n in sorted(restritos)})
+
+        blocos_fixos = sorted({fixos_idx[m] for m in mems if m in fixos_idx})
+        com_fixo = [nomes[m] for m in mems if m in fixos_idx]
+        if len(blocos_fixos) > 1:
+            certificar("fixos_divergentes",
+                       f"Conflito de fixos dentro do grupo {membros[0]}: blocos {blocos_fixos}.",
+                       com_fixo, grupo=membros, blocos=blocos_fixos)
+            dom = 0
+        elif blocos_fixos:
+            bloco = blocos_fixos[0]
+            if not 0 <= bloco < num_blocos:
+                certificar("fixo_fora_do_calendario",
+                           f"Bloco fixo {bloco} fora do limite num_blocos={num_blocos}.",
+                           com_fixo, grupo=membros, bloco=bloco)
+            elif dom and not dom >> bloco & 1:
+                certificar("fixo_fora_do_dominio",
+                           f"Fixo incompatível com domínio do grupo {membros[0]}: "
+                           f"bloco {bloco} fora do dia permitido.",
+                           com_fixo + restritos, grupo=membros, bloco=bloco,
+                           dominio=_blocos_da_mascara(dom))
+            dom &= (1 << bloco) & todos
+            fixado[lid] = bloco
+        mascara[lid] = dom
+
+    # --- Grupos vizinhos fixos no mesmo bloco ---
+    # por grupo: 'a' fixo e 'c' no grupo de 'b' fixo no mesmo bloco também
+    # conflitam se 'a' e 'c' são vizinhos; um certificado por par de grupos
+    for lid, bloco in fixado.items():
+        vistos = set()
+        for a in grupos[lid]:
+            for k in range(indptr[a], indptr[a + 1]):
+                b = indices[k]
+                outro = grupo_de[b]
+                if outro <= lid or outro in vistos or fixado.get(outro) != bloco:
+                    continue
+                vistos.add(outro)
+                origem = {nomes[m]: bloco for m in (*grupos[lid], *grupos[outro]) if m in fixos_idx}
+                if a in fixos_idx and b in fixos_idx:
+                    mensagem = (f"Conflito: '{nomes[a]}' e '{nomes[b]}' são vizinhos e estão fixos "
+                                f"no mesmo bloco {bloco}.")
                 else:
-                    print(f"[DEBUG]  Bloco {b}: sem conflitos (pode ter falhado por meta/capacidade)")
+                    mensagem = (f"Conflito: '{nomes[a]}' e '{nomes[b]}' são vizinhos e seus grupos "
+                                f"estão fixos no mesmo bloco {bloco} (por "
+                                f"{', '.join(repr(n) for n in sorted(origem))}).")
+                certificar("fixos_vizinhos", mensagem, {nomes[a], nomes[b], *origem},
+                           bloco=bloco, fixos=origem)
 
-            msg = f"Sem bloco disponível no domínio (dia) para o grupo {lid}."
-            if hard_fail:
-                raise RuntimeError(msg)
+    # --- Cliques: pombos contra todos os blocos, a união dos domínios e cada domínio ---
+    # (grupos já sem domínio ficam de fora: o certificado deles já saiu acima)
+    vistas = set()
+    for origem, clique in cliques:
+        nos = [indice[n] for n in clique if n in indice]
+        lids = frozenset(grupo_de[i] for i in nos if mascara[grupo_de[i]])
+        if len(lids) < 2 or lids in vistas:
+            continue
+        vistas.add(lids)
+        rotulo = f"{origem['origem'].capitalize()} '{origem['chave']}'"
+
+        def nos_dos(alvos):
+            return [nomes[i] for i in nos if grupo_de[i] in alvos]
+
+        if len(lids) > num_blocos:
+            certificar("clique_excede_blocos",
+                       f"{rotulo}: {len(lids)} grupos em conflito mútuo para {num_blocos} blocos.",
+                       nos_dos(lids), clique=origem, grupos=len(lids), blocos=num_blocos)
+            continue
+
+        por_mascara = defaultdict(list)
+        for lid in lids:
+            por_mascara[mascara[lid]].append(lid)
+        uniao = 0
+        for m in por_mascara:
+            uniao |= m
+
+        # primeiro a união (se falha, os domínios menores são redundantes)
+        for alvo in [uniao] + [m for m in por_mascara if m != uniao]:
+            presos = [lid for m, ls in por_mascara.items() if m & ~alvo == 0 for lid in ls]
+            vagas = alvo.bit_count()
+            if len(presos) <= vagas or (vagas == 1 and all(lid in fixado for lid in presos)):
+                continue  # (fixos no mesmo bloco já saem como "fixos_vizinhos")
+            blocos = _blocos_da_mascara(alvo)
+            dias = {dia_por_bloco.get(b) for b in blocos}
+            if len(dias) == 1 and None not in dias:
+                dia = next(iter(dias))
+                certificar("dia_excedido",
+                           f"{rotulo}: {len(presos)} grupos em conflito mútuo presos a '{dia}', "
+                           f"que tem {vagas} bloco(s).",
+                           nos_dos(set(presos)), clique=origem, grupos=len(presos),
+                           blocos=blocos, dia=dia)
             else:
-                print("[AVISO]", msg)
+                certificar("clique_excede_dominio",
+                           f"{rotulo}: {len(presos)} grupos em conflito mútuo para os "
+                           f"{vagas} bloco(s) dos seus domínios.",
+                           nos_dos(set(presos)), clique=origem, grupos=len(presos), blocos=blocos)
+            if alvo == uniao:
+                break
 
-    return cores
+    return certificados
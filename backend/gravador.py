@@ -0,0 +1,157 @@
+# gravador.py
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import SessionLocal
+from logs import obter_logger
+
+log = obter_logger("gravador")
+
+_FIM = object()
+
+
+class GravadorLotes:
+    """
+    Grava linhas de `modelo` fora do caminho da requisição.
+      - fila em memória limitada (max_fila): cheia, quem enfileira espera
+        (contrapressão) em vez de crescer sem limite;
+      - uma thread consome a fila e insere até max_lote linhas por transação;
+      - enfileirar() devolve um Future com o id da linha (None se falhou);
+        se o lote falha, cada linha é refeita na sua própria transação, e
+        só a que falhou de novo fica de fora;
+      - preparar(db, campos) -> campos, se dado, roda na thread do gravador
+        (dentro da transação do lote) antes de montar cada linha;
+      - esvaziar() espera tudo que já está na fila ir para o banco; parar()
+        esvazia e encerra a thread (chamado no shutdown e no atexit).
+    A thread nasce no primeiro enfileirar, então cada processo (servidor,
+    workers de jobs) tem a sua.
+    """
+
+    def __init__(self, modelo, max_fila=1024, max_lote=64, preparar=None):
+        self.modelo = modelo
+        self.preparar = preparar
+        self.max_lote = max(1, max_lote)
+        self._fila = queue.Queue(max(1, max_fila))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit = False
+        self.gravados = 0
+        self.falhas = 0
+        self.lotes = 0
+        self.reprocessados = 0
+        self.esperas = 0
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if not self._atexit:
+                    atexit.register(self.parar)
+                    self._atexit = True
+                self._thread = threading.Thread(target=self._laco, name="gravador", daemon=True)
+                self._thread.start()
+
+    def enfileirar(self, campos: dict) -> Future:
+        self._garantir_thread()
+        fut = Future()
+        try:
+            self._fila.put_nowait((campos, fut))
+        except queue.Full:
+            with self._lock:
+                self.esperas += 1
+            t0 = time.perf_counter()
+            self._fila.put((campos, fut))
+            espera = time.perf_counter() - t0
+            if espera >= 0.1:
+                log.warning("Fila de gravação cheia: requisição esperou %.3fs.", espera)
+        return fut
+
+    def _laco(self):
+        while True:
+            item = self._fila.get()
+            if item is _FIM:
+                self._fila.task_done()
+                return
+            lote = [item]
+            fim = False
+            while len(lote) < self.max_lote:
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _FIM:
+                    fim = True
+                    break
+                lote.append(item)
+            self._gravar(lote)
+            for _ in lote:
+                self._fila.task_done()
+            if fim:
+                self._fila.task_done()
+                return
+
+    def _gravar(self, lote):
+        ids = self._transacao(lote)
+        if ids is None and len(lote) > 1:
+            # uma linha ruim não pode levar o lote junto: refaz uma por transação
+            with self._lock:
+                self.reprocessados += len(lote)
+            ids = [(self._transacao([item]) or [None])[0] for item in lote]
+        elif ids is None:
+            ids = [None]
+        gravados = sum(gid is not None for gid in ids)
+        with self._lock:
+            self.gravados += gravados
+            self.falhas += len(lote) - gravados
+        for (_, fut), gid in zip(lote, ids):
+            fut.set_result(gid)
+
+    def _transacao(self, lote):
+        """Insere o lote numa transação (sessão nova); ids, ou None se falhou."""
+        db = SessionLocal()
+        try:
+            if self.preparar is not None:
+                linhas = [self.modelo(**self.preparar(db, dict(campos))) for campos, _ in lote]
+            else:
+                linhas = [self.modelo(**campos) for campos, _ in lote]
+            db.add_all(linhas)
+            db.flush()
+            ids = [linha.id for linha in linhas]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            log.error("Erro ao gravar lote de %d linha(s) de %s: %s",
+                      len(lote), self.modelo.__tablename__, e)
+            return None
+        finally:
+            db.close()
+        with self._lock:
+            self.lotes += 1
+        return ids
+
+    def esvaziar(self):
+        """Espera a fila atual chegar ao banco."""
+        if self._thread is not None and self._thread.is_alive():
+            self._fila.join()
+
+    def parar(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._fila.put(_FIM)
+            thread.join()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "na_fila": self._fila.qsize(),
+                "max_fila": self._fila.maxsize,
+                "max_lote": self.max_lote,
+                "gravados": self.gravados,
+                "lotes": self.lotes,
+                "falhas": self.falhas,
+                "reprocessados": self.reprocessados,
+                "esperas": self.esperas,
+            }
@@ -0,0 +1,229 @@
+# historico.py
+import contextlib
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # compressão é opcional
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from logs import obter_logger
+
+log = obter_logger("historico")
+
+_FIM = struct.Struct("<Q")
+
+
+class LogGeracoes:
+    """
+    Log append-only das gerações (substitui o out/geracoes.json reescrito a
+    cada falha). Em diretorio:
+      geracoes-{primeiro id:08d}.jsonl      um registro JSON por linha
+      geracoes-{primeiro id:08d}.jsonl.zst  idem, um frame zstd por registro
+      geracoes-{primeiro id:08d}.idx        fim (uint64 LE) de cada registro
+    O .idx é escrito depois dos dados, então toda entrada dele aponta para um
+    registro completo; sobra sem índice ou entrada do índice pela metade
+    (queda no meio) é truncada no próximo anexar. Anexar é serializado por lock de thread + trava no arquivo .lock
+    (os workers de jobs são outros processos). O segmento atual roda ao
+    passar de max_bytes e só os max_segmentos mais novos ficam.
+    """
+
+    def __init__(self, diretorio, max_bytes=64 * 1024 * 1024, max_segmentos=16, comprimir=False):
+        self.diretorio = Path(diretorio)
+        self.max_bytes = max_bytes
+        self.max_segmentos = max_segmentos
+        if comprimir and zstandard is None:
+            log.warning("zstandard não instalado: log de gerações sem compressão.")
+        self.comprimir = bool(comprimir and zstandard is not None)
+        self._lock = threading.Lock()
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+
+    # ---------- arquivos ----------
+
+    @contextlib.contextmanager
+    def _trava(self):
+        with self._lock, (self.diretorio / ".lock").open("a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _segmentos(self):
+        """[(primeiro id, caminho do .idx)] em ordem."""
+        segs = []
+        for p in self.diretorio.glob("geracoes-*.idx"):
+            try:
+                segs.append((int(p.stem.split("-", 1)[1]), p))
+            except ValueError:
+                continue
+        return sorted(segs)
+
+    def _dados(self, idx, comprimido=None):
+        """Arquivo de dados do segmento (o que existir; senão, o do formato pedido)."""
+        zst = idx.with_suffix(".jsonl.zst")
+        if comprimido is None:
+            comprimido = zst.exists()
+        return (zst if comprimido else idx.with_suffix(".jsonl")), comprimido
+
+    @staticmethod
+    def _fins(idx):
+        dados = idx.read_bytes() if idx.exists() else b""
+        dados = dados[: len(dados) - len(dados) % _FIM.size]
+        return [f for (f,) in _FIM.iter_unpack(dados)]
+
+    def _podar(self, segs):
+        for _, idx in segs[: max(0, len(segs) - self.max_segmentos)]:
+            dados, _ = self._dados(idx)
+            for p in (dados, idx):
+                try:
+                    p.unlink(missing_ok=True)
+                except OSError as e:  # leitor com o arquivo aberto (Windows)
+                    log.error("Não foi possível remover %s: %s", p.name, e)
+
+    # ---------- escrita ----------
+
+    def anexar(self, registro):
+        """Acrescenta o registro (o "id" é atribuído aqui) e devolve o id."""
+        with self._trava():
+            return self._anexar(registro)
+
+    def _anexar(self, registro):
+        segs = self._segmentos()
+        if segs:
+            primeiro, idx = segs[-1]
+            dados, comprimido = self._dados(idx)
+            tam_idx = idx.stat().st_size // _FIM.size
+            fim = 0
+            if tam_idx:
+                with idx.open("rb") as f:
+                    f.seek((tam_idx - 1) * _FIM.size)
+                    (fim,) = _FIM.unpack(f.read(_FIM.size))
+            if tam_idx and fim >= self.max_bytes:
+                primeiro, tam_idx, fim = primeiro + tam_idx, 0, 0
+                idx = self.diretorio / f"geracoes-{primeiro:08d}.idx"
+                dados, comprimido = self._dados(idx, self.comprimir)
+                segs.append((primeiro, idx))
+                self._podar(segs)
+        else:
+            primeiro, tam_idx, fim = 1, 0, 0
+            idx = self.diretorio / f"geracoes-{primeiro:08d}.idx"
+            dados, comprimido = self._dados(idx, self.comprimir)
+
+        gid = primeiro + tam_idx
+        corpo = json.dumps({"id": gid, **registro}, ensure_ascii=False, default=str)
+        corpo = corpo.encode("utf-8") + b"\n"
+        if comprimido:
+            corpo = zstandard.ZstdCompressor().compress(corpo)
+
+        with dados.open("ab") as f:
+            if f.tell() != fim:
+                f.truncate(fim)  # sobra de uma escrita sem índice
+                f.seek(fim)
+            f.write(corpo)
+            f.flush()
+            os.fsync(f.fileno())
+        with idx.open("ab") as f:
+            if f.tell() != tam_idx * _FIM.size:
+                f.truncate(tam_idx * _FIM.size)  # entrada do índice pela metade
+            f.write(_FIM.pack(fim + len(corpo)))
+            f.flush()
+            os.fsync(f.fileno())
+        return gid
+
+    def migrar_legado(self, caminho):
+        """Importa um geracoes.json antigo (lista) e o renomeia para .migrado."""
+        caminho = Path(caminho)
+        if not caminho.exists():
+            return 0
+        with self._trava():
+            if not caminho.exists():  # outro processo já migrou
+                return 0
+            try:
+                with caminho.open("r", encoding="utf-8") as f:
+                    registros = json.load(f)
+            except Exception as e:
+                log.error("Erro ao ler %s para migrar: %s", caminho.name, e)
+                return 0
+            for r in registros:
+                self._anexar({k: v for k, v in r.items() if k != "id"})
+            os.replace(caminho, caminho.with_name(caminho.name + ".migrado"))
+        log.warning("%d geração(ões) de %s migradas para o log em %s.",
+                    len(registros), caminho.name, self.diretorio.name)
+        return len(registros)
+
+    # ---------- leitura ----------
+
+    def linhas(self, desde_id=1, limite=None):
+        """
+        Registros (bytes JSON, sem a quebra de linha) com id >= desde_id, em
+        ordem, no máximo limite. Usa o índice para pular direto ao primeiro.
+        """
+        if limite is not None and limite <= 0:
+            return
+        segs = self._segmentos()
+        for pos, (primeiro, idx) in enumerate(segs):
+            proximo = segs[pos + 1][0] if pos + 1 < len(segs) else None
+            if proximo is not None and proximo <= desde_id:
+                continue
+            fins = self._fins(idx)
+            inicio = max(0, desde_id - primeiro)
+            if inicio >= len(fins):
+                continue
+            dados, comprimido = self._dados(idx)
+            descompressor = zstandard.ZstdDecompressor() if comprimido else None
+            try:
+                f = dados.open("rb")
+            except FileNotFoundError:  # segmento podado durante a leitura
+                continue
+            with f:
+                ini = fins[inicio - 1] if inicio else 0
+                f.seek(ini)
+                for fim in fins[inicio:]:
+                    corpo = f.read(fim - ini)
+                    ini = fim
+                    if descompressor is not None:
+                        corpo = descompressor.decompress(corpo)
+                    yield corpo.rstrip(b"\n")
+                    if limite is not None:
+                        limite -= 1
+                        if limite == 0:
+                            return
+
+    def total(self):
+        """Último id gravado (0 se vazio)."""
+        segs = self._segmentos()
+        if not segs:
+            return 0
+        primeiro, idx = segs[-1]
+        return primeiro + idx.stat().st_size // _FIM.size - 1
+
+    def estatisticas(self):
+        segs = self._segmentos()
+        return {
+            "ultimo_id": self.total(),
+            "segmentos": len(segs),
+            "bytes": sum(self._dados(idx)[0].stat().st_size for _, idx in segs
+                         if self._dados(idx)[0].exists()),
+            "comprimir": self.comprimir,
+            "max_bytes": self.max_bytes,
+            "max_segmentos": self.max_segmentos,
+        }
@@ -0,0 +1,294 @@
+# jobs.py
+"""
+Fila durável de gerações assíncronas.
+
+Os jobs ficam na tabela jobs_geracao (mesmo banco de GeracaoGrade) e são
+consumidos por processos worker separados, que reivindicam o próximo job
+pendente com um UPDATE condicional (só um worker vence). O servidor apenas
+enfileira, consulta e cancela; um job "executando" cujo worker morreu volta
+para a fila (até MAX_TENTATIVAS).
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+
+from database import SessionLocal
+from models import JobGeracao
+from logs import obter_logger
+
+log = obter_logger("jobs")
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+FALHOU = "falhou"
+CANCELADO = "cancelado"
+
+FINAIS = (CONCLUIDO, FALHOU, CANCELADO)
+
+MAX_TENTATIVAS = 3
+INTERVALO_POLL = 0.5
+
+
+def _agora():
+    return datetime.now(timezone.utc)
+
+
+def _job_dict(job: JobGeracao, com_resultado: bool = True) -> dict:
+    out = {
+        "id": job.id,
+        "status": job.status,
+        "criado_em": job.criado_em,
+        "iniciado_em": job.iniciado_em,
+        "concluido_em": job.concluido_em,
+        "tentativas": job.tentativas,
+        "erro": job.erro,
+    }
+    if com_resultado:
+        out["resultado"] = job.resultado_json
+    return out
+
+
+# --------------------------
+# Operações da fila (servidor)
+# --------------------------
+
+
+def enfileirar(entrada: dict) -> dict:
+    db = SessionLocal()
+    try:
+        job = JobGeracao(status=PENDENTE, entrada_json=entrada)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return _job_dict(job, com_resultado=False)
+    finally:
+        db.close()
+
+
+def obter(job_id: int) -> dict | None:
+    db = SessionLocal()
+    try:
+        job = db.query(JobGeracao).filter(JobGeracao.id == job_id).first()
+        return _job_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def cancelar(job_id: int) -> dict | None:
+    """
+    Pendente: sai da fila. Executando: o worker é encerrado (SIGTERM) e o
+    supervisor sobe outro no lugar. Jobs já finalizados não mudam.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(JobGeracao).filter(JobGeracao.id == job_id).first()
+        if not job:
+            return None
+
+        pid = job.worker_pid if job.status == EXECUTANDO else None
+        n = (
+            db.query(JobGeracao)
+            .filter(JobGeracao.id == job_id, JobGeracao.status.in_((PENDENTE, EXECUTANDO)))
+            .update(
+                {JobGeracao.status: CANCELADO, JobGeracao.concluido_em: _agora()},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+
+        if n and pid:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+        db.refresh(job)
+        return _job_dict(job)
+    finally:
+        db.close()
+
+
+def recuperar_interrompidos(pids=None) -> int:
+    """
+    Devolve à fila jobs "executando" (todos, ou só dos pids dados) cujo
+    worker não existe mais. Jobs que já esgotaram MAX_TENTATIVAS falham.
+    """
+    db = SessionLocal()
+    try:
+        q = db.query(JobGeracao).filter(JobGeracao.status == EXECUTANDO)
+        if pids is not None:
+            q = q.filter(JobGeracao.worker_pid.in_(list(pids)))
+
+        n = 0
+        for job in q.all():
+            if (job.tentativas or 0) >= MAX_TENTATIVAS:
+                job.status = FALHOU
+                job.erro = f"Worker encerrado {job.tentativas}x durante o job."
+                job.concluido_em = _agora()
+            else:
+                job.status = PENDENTE
+            job.worker_pid = None
+            n += 1
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+# --------------------------
+# Worker
+# --------------------------
+
+
+def _reivindicar():
+    db = SessionLocal()
+    try:
+        job = (
+            db.query(JobGeracao)
+            .filter(JobGeracao.status == PENDENTE)
+            .order_by(JobGeracao.id)
+            .first()
+        )
+        if not job:
+            return None
+
+        n = (
+            db.query(JobGeracao)
+            .filter(JobGeracao.id == job.id, JobGeracao.status == PENDENTE)
+            .update(
+                {
+                    JobGeracao.status: EXECUTANDO,
+                    JobGeracao.worker_pid: os.getpid(),
+                    JobGeracao.iniciado_em: _agora(),
+                    JobGeracao.tentativas: JobGeracao.tentativas + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return (job.id, job.entrada_json) if n == 1 else None
+    finally:
+        db.close()
+
+
+def _finalizar(job_id: int, status: str, resultado=None, erro=None):
+    # só grava se ninguém cancelou no meio do caminho
+    db = SessionLocal()
+    try:
+        db.query(JobGeracao).filter(
+            JobGeracao.id == job_id, JobGeracao.status == EXECUTANDO
+        ).update(
+            {
+                JobGeracao.status: status,
+                JobGeracao.resultado_json: resultado,
+                JobGeracao.erro: erro,
+                JobGeracao.concluido_em: _agora(),
+                JobGeracao.worker_pid: None,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _laco_worker():
+    # import tardio: o worker roda o mesmo pipeline do endpoint síncrono
+    from fastapi import HTTPException
+    from server import GRAVADOR_GERACOES, Entrada, gerar_grade
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C é tratado pelo servidor
+    pai = os.getppid()
+
+    while True:
+        if os.getppid() != pai:  # servidor morreu sem parar os workers
+            return
+        item = _reivindicar()
+        if item is None:
+            time.sleep(INTERVALO_POLL)
+            continue
+
+        job_id, entrada = item
+        try:
+            resultado = gerar_grade(Entrada.model_validate(entrada))
+            _finalizar(job_id, CONCLUIDO, resultado=resultado)
+        except HTTPException as e:
+            erro = e.detail if isinstance(e.detail, str) else json.dumps(e.detail, ensure_ascii=False)
+            _finalizar(job_id, FALHOU, erro=erro)
+        except Exception as e:
+            _finalizar(job_id, FALHOU, erro=f"{type(e).__name__}: {e}")
+        # o worker morre por terminate(), sem atexit: a GeracaoGrade do job
+        # vai para o banco antes do próximo
+        GRAVADOR_GERACOES.esvaziar()
+
+
+class GerenciadorWorkers:
+    """
+    Mantém `n` processos worker vivos. Um worker que morre (cancelamento,
+    crash) é substituído e o job que ele segurava volta para a fila.
+    Os workers não são daemon: o portfólio, os componentes e o lote abrem
+    ProcessPoolExecutor dentro do job, e processo daemon não pode ter
+    filhos. Por isso parar() também roda no atexit (antes do join dos
+    filhos não-daemon feito pelo multiprocessing), e um worker cujo
+    servidor morreu sai sozinho.
+    """
+
+    def __init__(self, n: int = 2):
+        self.n = max(0, n)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs = []
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _novo(self):
+        p = self._ctx.Process(target=_laco_worker, name="worker-geracao", daemon=False)
+        p.start()
+        return p
+
+    def _supervisionar(self):
+        while not self._parar.wait(1.0):
+            mortos = [p for p in self._procs if not p.is_alive()]
+            if not mortos:
+                continue
+            recuperar_interrompidos(pids=[p.pid for p in mortos])
+            self._procs = [p for p in self._procs if p.is_alive()]
+            while len(self._procs) < self.n and not self._parar.is_set():
+                self._procs.append(self._novo())
+
+    def iniciar(self):
+        n = recuperar_interrompidos()
+        if n:
+            log.warning("%d job(s) interrompido(s) voltaram para a fila.", n)
+        self._parar.clear()
+        self._procs = [self._novo() for _ in range(self.n)]
+        self._thread = threading.Thread(target=self._supervisionar, daemon=True)
+        self._thread.start()
+        atexit.register(self.parar)
+
+    def parar(self, timeout: float = 5.0):
+        atexit.unregister(self.parar)
+        if not self._procs:
+            return
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        for p in self._procs:
+            p.terminate()
+        for p in self._procs:
+            p.join(timeout)
+        # o que estava rodando volta a ser pendente no próximo start
+        recuperar_interrompidos(pids=[p.pid for p in self._procs])
+        self._procs = []
+
+    def estatisticas(self) -> dict:
+        return {
+            "workers": self.n,
+            "vivos": sum(1 for p in self._procs if p.is_alive()),
+            "pids": [p.pid for p in self._procs],
+        }
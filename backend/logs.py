@@ -0,0 +1,90 @@
+# logs.py
+"""
+Logs do motor e do servidor via `logging`, com coleta por requisição.
+
+Uma geração abre coletar_logs(): os registros emitidos no mesmo contexto
+(contextvars) vão para um buffer em memória só daquela requisição, sem
+trocar sys.stdout, então requisições paralelas não se misturam. O terminal
+recebe apenas registros a partir de LOG_NIVEL_TERMINAL (padrão WARNING).
+"""
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_ROTULOS = {
+    logging.DEBUG: "[DEBUG] ",
+    logging.WARNING: "[AVISO] ",
+    logging.ERROR: "[ERRO] ",
+    logging.CRITICAL: "[ERRO] ",
+}
+
+
+class _Formato(logging.Formatter):
+    """Mesmo formato dos antigos prints: "[AVISO] msg", "[DEBUG] msg"; INFO sem rótulo."""
+
+    def format(self, record):
+        texto = _ROTULOS.get(record.levelno, "") + record.getMessage()
+        if record.exc_info:
+            texto += "\n" + self.formatException(record.exc_info)
+        return texto
+
+
+_linhas_contexto: ContextVar = ContextVar("linhas_log", default=None)
+
+
+class _HandlerColetor(logging.Handler):
+    def emit(self, record):
+        linhas = _linhas_contexto.get()
+        if linhas is not None:
+            linhas.append(self.format(record))
+
+
+class Coletor:
+    def __init__(self):
+        self.linhas = []
+
+    def texto(self) -> str:
+        return "\n".join(self.linhas).strip()
+
+
+RAIZ = logging.getLogger("grade")
+
+
+def _configurar():
+    RAIZ.setLevel(logging.DEBUG)
+    RAIZ.propagate = False
+
+    coletor = _HandlerColetor()
+    coletor.setFormatter(_Formato())
+    RAIZ.addHandler(coletor)
+
+    terminal = logging.StreamHandler(sys.stdout)
+    terminal.setLevel(os.getenv("LOG_NIVEL_TERMINAL", "WARNING").upper())
+    terminal.setFormatter(_Formato())
+    RAIZ.addHandler(terminal)
+    return terminal
+
+
+_TERMINAL = _configurar()
+
+
+def nivel_terminal(nivel):
+    """Ajusta o que vai para o terminal (a CLI mostra INFO)."""
+    _TERMINAL.setLevel(nivel)
+
+
+def obter_logger(nome: str) -> logging.Logger:
+    return RAIZ.getChild(nome)
+
+
+@contextmanager
+def coletar_logs():
+    """Bufferiza os logs emitidos neste contexto; use coletor.texto() no fim."""
+    coletor = Coletor()
+    token = _linhas_contexto.set(coletor.linhas)
+    try:
+        yield coletor
+    finally:
+        _linhas_contexto.reset(token)
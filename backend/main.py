@@ -1,10 +1,23 @@
 # main.py
 import csv
+import logging
+import math
 import os
 import re
+import sys
 from datetime import datetime
 from collections import defaultdict
-from grafo import construir_grafo, colorir_grafo_balanceado
+from grafo import (
+    construir_grafo,
+    colorir_grafo_balanceado,
+    cliques_de_conflito,
+    limite_inferior_cores,
+    analisar_inviabilidade,
+    colorir_calendario_minimo,
+)
+from logs import obter_logger, nivel_terminal
+
+log = obter_logger("main")
 
 # ========= Leitura dos CSVs =========
 
@@ -78,35 +91,151 @@ def carregar_fixos(caminho):
                 try:
                     fixos[disc] = int(bloco_txt)
                 except ValueError:
-                    print(f"[AVISO] Bloco inválido para '{disc}': '{bloco_txt}' (ignorado).")
+                    log.warning("Bloco inválido para '%s': '%s' (ignorado).", disc, bloco_txt)
     return fixos
 
+MAPA_DIAS = {
+    'segunda':'segunda','seg':'segunda',
+    'terca':'terca','terça':'terca','ter':'terca',
+    'quarta':'quarta','qua':'quarta',
+    'quinta':'quinta','qui':'quinta',
+    'sexta':'sexta','sex':'sexta',
+    'sabado':'sabado','sábado':'sabado','sab':'sabado',
+    'domingo':'domingo','dom':'domingo'
+}
+
+def normalizar_dia(dia):
+    """'Seg', 'terça', ... -> 'segunda', 'terca', ...; '' se não reconhecer."""
+    return MAPA_DIAS.get((dia or "").strip().lower(), "")
+
 def carregar_dia_fixo(caminho):
     """
     Aceita: seg/segunda, ter/terça/terca, qua/quarta, qui/quinta, sex/sexta,
             sab/sábado/sabado, dom/domingo
     """
     dia_por_disc = {}
-    mapa = {
-        'segunda':'segunda','seg':'segunda',
-        'terca':'terca','terça':'terca','ter':'terca',
-        'quarta':'quarta','qua':'quarta',
-        'quinta':'quinta','qui':'quinta',
-        'sexta':'sexta','sex':'sexta',
-        'sabado':'sabado','sábado':'sabado','sab':'sabado',
-        'domingo':'domingo','dom':'domingo'
-    }
     if os.path.exists(caminho):
         with open(caminho, newline='', encoding='utf-8-sig') as csvfile:
             for r in csv.DictReader(csvfile):
                 d = (r.get("disciplina") or "").strip()
                 dia = (r.get("dia") or "").strip().lower()
-                if d and dia in mapa:
-                    dia_por_disc[d] = mapa[dia]
+                if d and dia in MAPA_DIAS:
+                    dia_por_disc[d] = MAPA_DIAS[dia]
                 elif d:
-                    print(f"[AVISO] Dia '{dia}' inválido para {d} (ignorado).")
+                    log.warning("Dia '%s' inválido para %s (ignorado).", dia, d)
     return dia_por_disc
 
+# ========= Ocorrências e restrições por nome =========
+
+class IndiceOcorrencias:
+    """
+    Índice nome base -> ocorrências em ordem, montado uma vez por entrada.
+    Uma disciplina com aulas_por_semana = n vira n nós "Nome [i/n]" (ou só
+    "Nome" se n = 1). A busca por nome aceita diferenças de maiúsculas e
+    espaços; nomes que não resolvem ficam em nao_resolvidos em vez de
+    virarem restrições vazias.
+    """
+
+    def __init__(self, disciplinas):
+        self.disciplinas = []             # expandidas (aulas_por_semana = 1)
+        self.ocorrencias = {}             # nome base -> [nomes expandidos]
+        self.base_por_expandida = {}
+        self.nao_resolvidos = []
+        self._por_chave = defaultdict(list)
+
+        for d in disciplinas:
+            base = d["nome"]
+            aps = max(1, int(d.get("aulas_por_semana", 1) or 1))
+            nomes = [f"{base} [{i+1}/{aps}]" if aps > 1 else base for i in range(aps)]
+            if base not in self.ocorrencias:
+                self._por_chave[self._chave(base)].append(base)
+            self.ocorrencias.setdefault(base, []).extend(
+                n for n in nomes if n not in self.base_por_expandida
+            )
+            for nome in nomes:
+                self.base_por_expandida[nome] = base
+                self.disciplinas.append({**d, "nome": nome, "aulas_por_semana": 1})
+
+    @staticmethod
+    def _chave(nome):
+        return " ".join(str(nome).split()).casefold()
+
+    def _nao_resolvido(self, nome, motivo, restricao):
+        self.nao_resolvidos.append({"nome": nome, "motivo": motivo, "restricao": restricao})
+
+    def base(self, nome, restricao=""):
+        """Nome base canônico (ou None, registrando o motivo)."""
+        if nome in self.ocorrencias:
+            return nome
+        candidatos = self._por_chave.get(self._chave(nome), [])
+        if len(candidatos) == 1:
+            return candidatos[0]
+        self._nao_resolvido(nome, "ambigua" if candidatos else "desconhecida", restricao)
+        return None
+
+    def expandir(self, nome, ocorrencia=None, restricao=""):
+        """Ocorrências do nome (todas, ou só a ocorrencia-ésima, 1-based)."""
+        base = self.base(nome, restricao)
+        if base is None:
+            return []
+        nomes = self.ocorrencias[base]
+        if ocorrencia is None:
+            return nomes
+        idx = int(ocorrencia) - 1
+        if 0 <= idx < len(nomes):
+            return [nomes[idx]]
+        self._nao_resolvido(f"{nome} (ocorrência {ocorrencia})", "ocorrencia_invalida", restricao)
+        return []
+
+def expandir_restricoes(indice, restricoes):
+    """
+    Traduz restrições (dicts com tipo, disciplina, bloco, ocorrencia, dia,
+    disciplina1, disciplina2) para os nomes expandidos do índice:
+      - fixo/dia_fixo: por ocorrência;
+      - nao_coincidir: todo par de ocorrências (são arestas);
+      - mesmo_bloco/mesmo_horario: as ocorrências dos dois lados ligadas em
+        estrela à primeira, o que forma o mesmo grupo que o produto cartesiano
+        com O(a + b) pares.
+    Nomes/dias que não resolvem vão para indice.nao_resolvidos.
+    """
+    fixos, dia_por_disc = {}, {}
+    pares_nao, pares_mesmo = [], []
+
+    for r in restricoes:
+        tipo = r.get("tipo")
+        if tipo == "fixo":
+            if r.get("disciplina") and r.get("bloco") is not None:
+                for nome in indice.expandir(r["disciplina"], r.get("ocorrencia"), tipo):
+                    fixos[nome] = int(r["bloco"])
+
+        elif tipo == "dia_fixo":
+            if r.get("disciplina") and r.get("dia"):
+                dia = normalizar_dia(r["dia"])
+                if not dia:
+                    indice._nao_resolvido(r["dia"], "dia_invalido", tipo)
+                    continue
+                for nome in indice.expandir(r["disciplina"], restricao=tipo):
+                    dia_por_disc[nome] = dia
+
+        elif tipo in ("nao_coincidir", "mesmo_bloco", "mesmo_horario"):
+            if r.get("disciplina1") and r.get("disciplina2"):
+                a_list = indice.expandir(r["disciplina1"], restricao=tipo)
+                b_list = indice.expandir(r["disciplina2"], restricao=tipo)
+                if not a_list or not b_list:
+                    continue
+                if tipo == "nao_coincidir":
+                    pares_nao.extend((a, b) for a in a_list for b in b_list if a != b)
+                else:
+                    raiz = a_list[0]
+                    pares_mesmo.extend((raiz, x) for x in a_list[1:] + b_list if x != raiz)
+
+    return {
+        "fixos": fixos,
+        "dia_por_disc": dia_por_disc,
+        "pares_nao": pares_nao,
+        "pares_mesmo": pares_mesmo,
+    }
+
 # ========= Calendário (dias × blocos/dia) =========
 
 DIAS_ABRV = ['Seg','Ter','Qua','Qui','Sex','Sáb','Dom']
@@ -142,6 +271,62 @@ def indice_blocos_por_dia(horarios):
             idx.setdefault(dia_norm, set()).add(bloco)
     return idx
 
+# ========= Calendário mínimo =========
+
+def _remapear_blocos(cores, blocos_dia_de, blocos_dia_para):
+    """Leva cada disciplina para o mesmo (dia, horário) no calendário com outro nº de blocos/dia."""
+    out = {}
+    for disc, bloco in cores.items():
+        dia, slot = divmod(bloco, blocos_dia_de)
+        if slot < blocos_dia_para:
+            out[disc] = dia * blocos_dia_para + slot
+    return out
+
+def buscar_blocos_por_dia_minimo(G, dias_semana, fixos, dia_por_disc, pares_mesmo, cliques,
+                                 blocos_max=12, strategy="dsatur", limite_nos=200000,
+                                 limite_segundos=10.0):
+    """
+    Menor blocos_por_dia (com dias_semana fixo) que comporta a grade.
+    Limite inferior: maior clique (professor/semestre, contando grupos
+    "mesmo bloco" uma vez) dividida pelos dias, maior clique presa a um
+    único dia e o maior bloco fixo. Daí a busca segue com
+    grafo.colorir_calendario_minimo.
+    Retorna dict com blocos_por_dia (None se nem blocos_max couber),
+    limite_inferior, horarios, cores, otimo_provado e tentativas.
+    """
+    dias_validos = indice_blocos_por_dia(montar_horarios(dias_semana, 1))
+    rotulos = {d: dia for d, dia in dia_por_disc.items() if d in G and dia in dias_validos}
+    limite, por_dia = limite_inferior_cores(cliques, pares_mesmo, rotulos)
+
+    k_min = max(1, math.ceil(limite / dias_semana), max(por_dia.values(), default=0))
+    fixos = {d: b for d, b in fixos.items() if d in G and b >= 0}
+    if fixos:
+        k_min = max(k_min, math.ceil((max(fixos.values()) + 1) / dias_semana))
+
+    def calendario(k):
+        horarios = montar_horarios(dias_semana, k)
+        idx_dia = indice_blocos_por_dia(horarios)
+        return {
+            "num_blocos": len(horarios),
+            "fixos": {d: b for d, b in fixos.items() if b < len(horarios)},
+            "dominios_por_no": {d: set(idx_dia[dia]) for d, dia in rotulos.items()},
+            "pares_mesmo_bloco": pares_mesmo,
+        }
+
+    stats = {}
+    k, cores = colorir_calendario_minimo(
+        G, calendario, k_min, blocos_max, remapear=_remapear_blocos, strategy=strategy,
+        limite_nos=limite_nos, limite_segundos=limite_segundos, stats=stats
+    )
+    return {
+        "blocos_por_dia": k,
+        "limite_inferior": k_min,
+        "horarios": montar_horarios(dias_semana, k) if k else None,
+        "cores": cores,
+        "otimo_provado": stats["otimo_provado"],
+        "tentativas": stats["tentativas"],
+    }
+
 # ========= Exportação: Excel (matriz/lista) + CSV =========
 
 def salvar_grade_excel_csv(cores, horarios, nome_exibicao, caminho_base="out/alocacaohorario"):
@@ -157,7 +342,7 @@ def salvar_grade_excel_csv(cores, horarios, nome_exibicao, caminho_base="out/alo
     try:
         import pandas as pd
     except Exception:
-        print("[AVISO] Para exportar Excel/CSV instale: python -m pip install pandas openpyxl")
+        log.warning("Para exportar Excel/CSV instale: python -m pip install pandas openpyxl")
         return
 
     os.makedirs("out", exist_ok=True)
@@ -174,7 +359,7 @@ def salvar_grade_excel_csv(cores, horarios, nome_exibicao, caminho_base="out/alo
         data.append((dia_sigla, hhmm, exib))
 
     if not data:
-        print("[AVISO] Nada para exportar (data vazia).")
+        log.warning("Nada para exportar (data vazia).")
         return
 
     # Ordem canônica de dias e horas presentes
@@ -245,7 +430,7 @@ def salvar_grade_excel_csv(cores, horarios, nome_exibicao, caminho_base="out/alo
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         alt = f"{base_abs}_{ts}.xlsx"
         _write_excel(alt)
-        print(f"\n[AVISO] O Excel estava aberto. Salvei com outro nome: {alt}")
+        log.warning("O Excel estava aberto. Salvei com outro nome: %s", alt)
 
     list_df.to_csv(csv_path, index=False, encoding="utf-8-sig")
     print("CSV salvo em:", csv_path)
@@ -254,17 +439,22 @@ def salvar_grade_excel_csv(cores, horarios, nome_exibicao, caminho_base="out/alo
 
 def main():
     dados_dir = "dados"
+    nivel_terminal(logging.INFO)  # na CLI o terminal mostra também [BUSCA], [BALANCEAMENTO]...
+
+    # --minimo: em vez de perguntar os blocos por dia, busca o menor que comporta a grade
+    minimo = "--minimo" in sys.argv[1:]
 
     # 1) Quantos dias e quantos blocos por dia
     try:
         dias_semana = int(input("Quantos dias na semana (1–7)? ").strip() or "5")
-        blocos_dia  = int(input("Quantos blocos por dia? ").strip() or "4")
+        blocos_dia  = None if minimo else int(input("Quantos blocos por dia? ").strip() or "4")
     except ValueError:
-        print("[AVISO] Entrada inválida. Usando padrão 5 dias × 4 blocos.")
-        dias_semana, blocos_dia = 5, 4
+        log.warning("Entrada inválida. Usando padrão 5 dias × 4 blocos.")
+        dias_semana, blocos_dia = 5, (None if minimo else 4)
 
-    horarios = montar_horarios(dias_semana, blocos_dia)
-    num_blocos = len(horarios)
+    if not minimo:
+        horarios = montar_horarios(dias_semana, blocos_dia)
+        num_blocos = len(horarios)
 
     # 2) Entradas
     disciplinas = carregar_disciplinas(os.path.join(dados_dir, "disciplinas.csv"))
@@ -280,46 +470,84 @@ def main():
     prof_display = {d["nome"]: d.get("prof_display", "") for d in disciplinas}
     nome_exibicao = {disc: (f"{disc} / {prof_display[disc]}" if prof_display.get(disc) else disc) for disc in G.nodes()}
 
-    # Restrições "não podem coincidir" (opcional; pode remover se quiser só por semestre/prof)
+    # Restrições: "não podem coincidir" (opcional; pode remover se quiser só por
+    # semestre/prof), grupos "mesmo bloco", fixos e dias fixos; os nomes são
+    # resolvidos pelo mesmo índice do servidor
     restricoes = carregar_pares(os.path.join(dados_dir, "restricoes.csv"))
-    for a, b in restricoes:
-        if a in G and b in G:
-            G.add_edge(a, b)
-        else:
-            print(f"[AVISO] Restrição ignorada (nó não existe no grafo): ({a}, {b})")
-
-    # Grupos "mesmo bloco" (opcionais)
     pares_mesmo_a = carregar_pares(os.path.join(dados_dir, "mesmo_bloco.csv"))
     pares_mesmo_b = carregar_pares(os.path.join(dados_dir, "mesmo_horario.csv"))  # opcional
     pares_mesmo   = pares_mesmo_a + [p for p in pares_mesmo_b if p not in pares_mesmo_a]
 
+    indice = IndiceOcorrencias(disciplinas)
+    traduzidas = expandir_restricoes(
+        indice,
+        [{"tipo": "nao_coincidir", "disciplina1": a, "disciplina2": b} for a, b in restricoes]
+        + [{"tipo": "mesmo_bloco", "disciplina1": a, "disciplina2": b} for a, b in pares_mesmo]
+        + [{"tipo": "fixo", "disciplina": d, "bloco": b}
+           for d, b in carregar_fixos(os.path.join(dados_dir, "fixos.csv")).items()]
+        + [{"tipo": "dia_fixo", "disciplina": d, "dia": dia}
+           for d, dia in carregar_dia_fixo(os.path.join(dados_dir, "dia_fixo.csv")).items()]
+    )
+    for item in indice.nao_resolvidos:
+        log.warning("Restrição ignorada (%s): '%s' (%s).", item["restricao"], item["nome"], item["motivo"])
+
+    for a, b in traduzidas["pares_nao"]:
+        G.add_edge(a, b)
+    pares_mesmo = traduzidas["pares_mesmo"]
+
     # Fixos
-    fixos = carregar_fixos(os.path.join(dados_dir, "fixos.csv"))
-    fixos = {d:b for d,b in fixos.items() if d in G}
-    fora = {disc: b for disc, b in fixos.items() if b < 0 or b >= num_blocos}
-    if fora:
-        print(f"[AVISO] Fixos fora do calendário (0..{num_blocos-1}) ignorados: {fora}")
-        fixos = {d:b for d,b in fixos.items() if 0 <= b < num_blocos}
+    fixos = traduzidas["fixos"]
+    if not minimo:
+        fora = {disc: b for disc, b in fixos.items() if b < 0 or b >= num_blocos}
+        if fora:
+            log.warning("Fixos fora do calendário (0..%d) ignorados: %s", num_blocos - 1, fora)
+            fixos = {d:b for d,b in fixos.items() if 0 <= b < num_blocos}
 
     # Domínios por dia (dia_fixo.csv)
-    dia_por_disc = carregar_dia_fixo(os.path.join(dados_dir, "dia_fixo.csv"))
-    idx_dia = indice_blocos_por_dia(horarios)
-    dominios = {}
-    for disc, dia in dia_por_disc.items():
-        if disc in G and dia in idx_dia:
-            dominios[disc] = set(idx_dia[dia])
+    dia_por_disc = traduzidas["dia_por_disc"]
 
     # 3) Coloração / Alocação
-    cores = colorir_grafo_balanceado(
-        G,
-        num_blocos=num_blocos,
-        fixos=fixos,
-        pares_mesmo_horario=pares_mesmo,   # tratado como “mesmo bloco”
-        pares_mesmo_bloco=pares_mesmo,
-        dominios_por_no=dominios,
-        allow_extra_blocks=False,
-        hard_fail=True
-    )
+    if minimo:
+        busca = buscar_blocos_por_dia_minimo(
+            G, dias_semana, fixos, dia_por_disc, pares_mesmo, cliques_de_conflito(disciplinas)
+        )
+        if busca["blocos_por_dia"] is None:
+            log.error("Nenhum calendário com %s dias e até 12 blocos/dia comporta a grade.", dias_semana)
+            return
+        blocos_dia = busca["blocos_por_dia"]
+        horarios = busca["horarios"]
+        num_blocos = len(horarios)
+        cores = busca["cores"]
+        print(f"\nCalendário mínimo: {dias_semana} dias × {blocos_dia} blocos "
+              f"(limite inferior {busca['limite_inferior']}"
+              f"{'' if busca['otimo_provado'] else '; mínimo não provado'}).")
+    else:
+        idx_dia = indice_blocos_por_dia(horarios)
+        dominios = {}
+        for disc, dia in dia_por_disc.items():
+            if disc in G and dia in idx_dia:
+                dominios[disc] = set(idx_dia[dia])
+
+        certificados = analisar_inviabilidade(
+            G, num_blocos, fixos, pares_mesmo, dominios,
+            cliques=cliques_de_conflito(disciplinas, com_origem=True),
+            dia_por_bloco={b: dia for dia, blocos in idx_dia.items() for b in blocos},
+        )
+        if certificados:
+            for c in certificados:
+                log.error("%s", c["mensagem"])
+            return
+
+        cores = colorir_grafo_balanceado(
+            G,
+            num_blocos=num_blocos,
+            fixos=fixos,
+            pares_mesmo_horario=pares_mesmo,   # tratado como “mesmo bloco”
+            pares_mesmo_bloco=pares_mesmo,
+            dominios_por_no=dominios,
+            allow_extra_blocks=False,
+            hard_fail=True
+        )
 
     # 4) Saída — Disciplinas (console)
     print("\n--- Alocação das Disciplinas ---")
@@ -1,13 +1,19 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Index, JSON, LargeBinary
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from database import Base
 
 
 class GeracaoGrade(Base):
     __tablename__ = "geracoes_grade"
+    # filtros de /admin/geracoes com paginação por id (keyset)
+    __table_args__ = (
+        Index("ix_geracoes_grade_sucesso_id", "sucesso", "id"),
+        Index("ix_geracoes_grade_dataset_id", "dataset_hash", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    criado_em = Column(DateTime(timezone=True), server_default=func.now())
+    criado_em = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     qtd_disciplinas = Column(Integer, default=0)
     qtd_restricoes = Column(Integer, default=0)
@@ -17,7 +23,55 @@ class GeracaoGrade(Base):
     ocorrencias_alocadas = Column(Integer, default=0)
 
     sucesso = Column(Boolean, default=True)
+    erro = Column(String, nullable=True)
+    segundos = Column(Float, nullable=True)  # tempo da geração (preparo + motor)
+
+    # datasets.chave_disciplinas das disciplinas da entrada
+    dataset_hash = Column(String(64), nullable=True)
+
+    # sha256 dos blobs em payloads_json (ver payloads.py)
+    entrada_hash = Column(String(64), nullable=True, index=True)
+    resultado_hash = Column(String(64), nullable=True)
+
+    # formato antigo (JSON cru na linha); só lido para gerações sem hash
+    entrada_json = deferred(Column(JSON, nullable=True))
+    resultado_json = deferred(Column(JSON, nullable=True))
+
+
+class PayloadJSON(Base):
+    __tablename__ = "payloads_json"
+
+    hash = Column(String(64), primary_key=True)
+    criado_em = Column(DateTime(timezone=True), server_default=func.now())
+
+    tamanho = Column(Integer, default=0)  # bytes do JSON antes da compressão
+    dados = Column(LargeBinary, nullable=False)  # JSON canônico comprimido (zstd)
+
+
+class CacheResultado(Base):
+    __tablename__ = "cache_resultados"
+
+    chave = Column(String(64), primary_key=True)
+    criado_em = Column(DateTime(timezone=True), server_default=func.now())
+    acessado_em = Column(DateTime(timezone=True), nullable=True, index=True)  # poda por idade/LRU
+
+    resultado_json = Column(JSON, nullable=False)
+
+
+class JobGeracao(Base):
+    __tablename__ = "jobs_geracao"
+
+    id = Column(Integer, primary_key=True, index=True)
+    criado_em = Column(DateTime(timezone=True), server_default=func.now())
+    iniciado_em = Column(DateTime(timezone=True), nullable=True)
+    concluido_em = Column(DateTime(timezone=True), nullable=True)
+
+    # pendente | executando | concluido | falhou | cancelado
+    status = Column(String(16), default="pendente", index=True)
+    worker_pid = Column(Integer, nullable=True)
+    tentativas = Column(Integer, default=0)
+
     erro = Column(String, nullable=True)
 
-    entrada_json = Column(JSON, nullable=True)
+    entrada_json = Column(JSON, nullable=False)
     resultado_json = Column(JSON, nullable=True)
@@ -0,0 +1,67 @@
+# payloads.py
+"""
+JSONs grandes do histórico (entrada e resultado de GeracaoGrade) guardados
+uma vez por conteúdo na tabela payloads_json: chave = sha256 do JSON
+canônico (chaves ordenadas, sem espaços), corpo comprimido com zstd.
+Reenviar a mesma entrada aponta para o mesmo blob.
+"""
+import hashlib
+import json
+import threading
+
+import zstandard
+
+from models import PayloadJSON
+
+_local = threading.local()
+
+
+def _compressor():
+    # Zstd(De)Compressor não é thread-safe: um por thread
+    if not hasattr(_local, "c"):
+        _local.c = zstandard.ZstdCompressor(level=6)
+        _local.d = zstandard.ZstdDecompressor()
+    return _local.c, _local.d
+
+
+def canonico(obj) -> bytes:
+    return json.dumps(
+        obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+def guardar(db, obj):
+    """
+    Grava obj (se ainda não existe) na sessão db e devolve o hash; None
+    para obj None. Não faz commit.
+    """
+    if obj is None:
+        return None
+    corpo = canonico(obj)
+    chave = hashlib.sha256(corpo).hexdigest()
+    novos = db.info.setdefault("payloads_novos", set())
+    if chave in novos or db.get(PayloadJSON, chave) is not None:
+        return chave
+    campos = dict(hash=chave, tamanho=len(corpo), dados=_compressor()[0].compress(corpo))
+    dialeto = db.get_bind().dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        # servidor e workers de jobs podem gravar o mesmo blob ao mesmo tempo
+        if dialeto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        db.execute(insert(PayloadJSON).values(**campos).on_conflict_do_nothing(index_elements=["hash"]))
+    else:
+        db.add(PayloadJSON(**campos))
+    novos.add(chave)
+    return chave
+
+
+def carregar(db, chave):
+    """JSON do blob chave (None se chave é None ou o blob sumiu)."""
+    if chave is None:
+        return None
+    item = db.get(PayloadJSON, chave)
+    if item is None:
+        return None
+    return json.loads(_compressor()[1].decompress(item.dados))
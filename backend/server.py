@@ -1,51 +1,73 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import case, func, select
 from typing import List, Optional, Literal, Dict, Any
 from pathlib import Path
 from datetime import datetime
-from contextlib import redirect_stdout, redirect_stderr
+from email.utils import formatdate, parsedate_to_datetime
 from collections import defaultdict
+from contextlib import asynccontextmanager
 import re
 import csv
-import sys
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import io
+import os
 import json
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side
-
-from grafo import construir_grafo, colorir_grafo_balanceado
-from main import montar_horarios, indice_blocos_por_dia
+import hashlib
+import queue
+import threading
+
+from grafo import (
+    construir_grafo,
+    colorir_grafo_balanceado,
+    colorir_portfolio,
+    colorir_por_componentes,
+    colorir_incremental,
+    resumo_alocacao,
+    cliques_de_conflito,
+    analisar_inviabilidade,
+    EntradaInviavel,
+)
+from main import (
+    montar_horarios,
+    indice_blocos_por_dia,
+    buscar_blocos_por_dia_minimo,
+    normalizar_dia,
+    IndiceOcorrencias,
+    expandir_restricoes,
+)
 
 """"from supabase_client import supabase
 """ ""
-from database import Base, engine, SessionLocal
+from database import Base, engine, SessionLocal, adicionar_colunas_novas
 from models import GeracaoGrade
+from cache import CacheResultados
+from datasets import CacheDatasets, chave_disciplinas
+from historico import LogGeracoes
+from gravador import GravadorLotes
+import payloads
+from exportacao import (
+    CacheExportacoes,
+    CacheXlsxGeracoes,
+    chave_exportacao,
+    escrever_xlsx,
+    montar_grade_visual,
+    exportar as exportar_visual,
+)
+import jobs
+from logs import coletar_logs, obter_logger
+
+log = obter_logger("server")
 
 # --------------------------
 # Helpers
 # --------------------------
 
 
-class _Tee(io.StringIO):
-    """
-    Captura prints (stdout/stderr) e ao mesmo tempo continua escrevendo no terminal.
-    """
-
-    def __init__(self, real_stream):
-        super().__init__()
-        self.real_stream = real_stream
-
-    def write(self, s):
-        try:
-            self.real_stream.write(s)
-            self.real_stream.flush()
-        except Exception:
-            pass
-        return super().write(s)
-
-
 def _prof_display(prof_raw: str) -> str:
     toks = [t.strip() for t in re.split(r"[|,;/]+", str(prof_raw)) if t.strip()]
     uniq = list(dict.fromkeys(toks))
@@ -53,39 +75,7 @@ def _prof_display(prof_raw: str) -> str:
 
 
 def _norm_dia(dia: str) -> str:
-    mapa = {
-        "segunda": "segunda",
-        "seg": "segunda",
-        "terca": "terca",
-        "terça": "terca",
-        "ter": "terca",
-        "quarta": "quarta",
-        "qua": "quarta",
-        "quinta": "quinta",
-        "qui": "quinta",
-        "sexta": "sexta",
-        "sex": "sexta",
-        "sabado": "sabado",
-        "sábado": "sabado",
-        "sab": "sabado",
-        "domingo": "domingo",
-        "dom": "domingo",
-    }
-    d = (dia or "").strip().lower()
-    return mapa.get(d, "")
-
-
-def _periodo_do_indice(indice_no_dia: int) -> str:
-    return str(indice_no_dia + 1)
-
-
-def _esc_csv(v):
-    s = str(v or "")
-    if '"' in s:
-        s = s.replace('"', '""')
-    if "," in s or "\n" in s or '"' in s:
-        return f'"{s}"'
-    return s
+    return normalizar_dia(dia)
 
 
 # --------------------------
@@ -98,6 +88,20 @@ class Config(BaseModel):
     blocos_por_dia: int = 4
     conflito_por_prof: bool = True
     conflito_por_semestre: bool = True
+    strategy: Literal["guloso", "dsatur"] = "guloso"
+    busca_completa: bool = False
+    busca_limite_nos: int = 200000
+    busca_limite_segundos: float = 10.0
+    balancear: bool = False
+    balancear_iteracoes: int = 2000
+    balancear_segundos: float = 5.0
+    portfolio_tentativas: int = 0
+    portfolio_trabalhadores: Optional[int] = None
+    portfolio_alvo: Optional[int] = None
+    # resolve cada componente conexa à parte, em paralelo (tem precedência sobre o portfólio)
+    decompor_componentes: bool = False
+    componentes_trabalhadores: Optional[int] = None
+    usar_cache: bool = True  # False força recalcular (não entra na chave)
 
 
 class Disciplina(BaseModel):
@@ -125,6 +129,38 @@ class Entrada(BaseModel):
     restricoes: List[Restricao] = []
 
 
+class DeltaGeracao(BaseModel):
+    """Alterações sobre a entrada de uma geração já salva."""
+
+    geracao_id: int
+    disciplinas: List[Disciplina] = []  # novas ou alteradas (pelo nome)
+    remover_disciplinas: List[str] = []
+    restricoes: List[Restricao] = []  # adicionadas
+    remover_restricoes: List[Restricao] = []
+    config: Optional[Config] = None  # None = mantém a config da geração
+
+
+class CalendarioMinimoEntrada(Entrada):
+    """config.blocos_por_dia é ignorado: é o que se busca (até blocos_por_dia_max)."""
+
+    blocos_por_dia_max: int = 12
+
+
+class LoteEntrada(BaseModel):
+    """
+    Varredura de cenários: config é a base comum e grade diz, por campo da
+    Config, os valores a combinar (produto cartesiano), ex.
+    {"dias_semana": [5, 6], "blocos_por_dia": [3, 4], "conflito_por_prof": [true, false]}.
+    """
+
+    config: Config = Config()
+    grade: Dict[str, List[Any]] = {}
+    disciplinas: List[Disciplina]
+    restricoes: List[Restricao] = []
+    trabalhadores: Optional[int] = None  # processos; None = nº de CPUs, 1 = sem pool
+    persistir_vencedoras: bool = True
+
+
 class ImportarArquivosEntrada(BaseModel):
     arquivos: List[str]
 
@@ -141,8 +177,21 @@ class ExportarGradeEntrada(BaseModel):
 # App / diretórios
 # --------------------------
 
-app = FastAPI()
+@asynccontextmanager
+async def _ciclo_de_vida(app):
+    """Sobe os workers de jobs; no fim, para-os, esvazia o gravador e salva o índice de out/."""
+    WORKERS.iniciar()
+    try:
+        yield
+    finally:
+        WORKERS.parar()
+        GRAVADOR_GERACOES.parar()
+        CACHE_EXPORTACOES.salvar()
+
+
+app = FastAPI(lifespan=_ciclo_de_vida)
 Base.metadata.create_all(bind=engine)
+adicionar_colunas_novas()
 
 app.add_middleware(
     CORSMiddleware,
@@ -150,13 +199,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Proximo-Cursor"],  # paginação de /admin/geracoes
 )
 
 BASE_DIR = Path(__file__).resolve().parent
 DADOS_DIR = BASE_DIR / "dados"
 OUT_DIR = BASE_DIR / "out"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
-GERACOES_JSON = OUT_DIR / "geracoes.json"
+GERACOES_JSON = OUT_DIR / "geracoes.json"  # formato antigo, migrado para GERACOES_LOG
+
+LOTE_MAX_VARIANTES = int(os.getenv("LOTE_MAX_VARIANTES", "256"))
+
+CACHE_RESULTADOS = CacheResultados(
+    max_itens=int(os.getenv("CACHE_GRADE_MAX", "128")),
+    persistir=os.getenv("CACHE_GRADE_DB", "1") == "1",
+    max_itens_disco=int(os.getenv("CACHE_GRADE_DB_MAX", "10000")),
+    max_idade_s=float(os.getenv("CACHE_GRADE_DB_DIAS", "30")) * 24 * 3600,
+)
+
+CACHE_DATASETS = CacheDatasets(
+    OUT_DIR / "cache_datasets",
+    max_itens=int(os.getenv("CACHE_DATASETS_MAX", "16")),
+)
+
+GERACOES_LOG = LogGeracoes(
+    OUT_DIR / "geracoes",
+    max_bytes=int(float(os.getenv("GERACOES_LOG_MAX_MB", "64")) * 1024 * 1024),
+    max_segmentos=int(os.getenv("GERACOES_LOG_SEGMENTOS", "16")),
+    comprimir=os.getenv("GERACOES_LOG_ZSTD", "0") == "1",
+)
+GERACOES_LOG.migrar_legado(GERACOES_JSON)
+
+def _preparar_geracao(db, campos):
+    """entrada/resultado viram blobs comprimidos em payloads_json (por hash)."""
+    campos["dataset_hash"] = chave_disciplinas(campos["entrada"].get("disciplinas", []))
+    campos["entrada_hash"] = payloads.guardar(db, campos.pop("entrada"))
+    campos["resultado_hash"] = payloads.guardar(db, campos.pop("resultado"))
+    return campos
+
+
+CACHE_EXPORTACOES = CacheExportacoes(
+    OUT_DIR,
+    max_bytes=int(float(os.getenv("EXPORT_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    max_idade_s=float(os.getenv("EXPORT_CACHE_MAX_DIAS", "30")) * 86400,
+)
+
+CACHE_XLSX_GERACOES = CacheXlsxGeracoes(
+    OUT_DIR / "xlsx_geracoes",
+    max_itens=int(os.getenv("XLSX_GERACOES_MAX", "512")),
+)
+
+GRAVADOR_GERACOES = GravadorLotes(
+    GeracaoGrade,
+    max_fila=int(os.getenv("GRAVADOR_MAX_FILA", "1024")),
+    max_lote=int(os.getenv("GRAVADOR_MAX_LOTE", "64")),
+    preparar=_preparar_geracao,
+)
+
+WORKERS = jobs.GerenciadorWorkers(int(os.getenv("JOBS_WORKERS", "2")))
 
 
 # --------------------------
@@ -371,8 +471,25 @@ def listar_dados():
     return {"datasets": _listar_datasets()}
 
 
+def _ler_dataset(nome: str, disc_path: Path, arquivos_restricoes: List[Path]) -> Dict[str, Any]:
+    disciplinas_raw = _ler_csv(disc_path)
+    disciplinas = [_normalizar_disciplina_row(r) for r in disciplinas_raw]
+
+    restricoes: list[dict] = []
+
+    for p in arquivos_restricoes:
+        rows = _ler_csv(p)
+        restricoes.extend(_inferir_restricoes(rows, p.name))
+
+    return {"nome": nome, "disciplinas": disciplinas, "restricoes": restricoes}
+
+
 @app.get("/dados/{nome}")
 def carregar_dados(nome: str):
+    """
+    Dataset {nome}_disciplinas.csv + {nome}_*.csv de restrições. Vem do
+    CACHE_DATASETS enquanto nenhum arquivo mudar (mtime/tamanho).
+    """
     disc_path = DADOS_DIR / f"{nome}_disciplinas.csv"
     if not disc_path.exists():
         raise HTTPException(
@@ -380,19 +497,27 @@ def carregar_dados(nome: str):
             detail=f"Dataset '{nome}' não encontrado (faltando {disc_path.name})",
         )
 
-    disciplinas_raw = _ler_csv(disc_path)
-    disciplinas = [_normalizar_disciplina_row(r) for r in disciplinas_raw]
+    arquivos_restricoes = [
+        p for p in sorted(DADOS_DIR.glob(f"{nome}_*.csv"))
+        if not p.name.endswith("_disciplinas.csv")
+    ]
+    dados, _ = CACHE_DATASETS.obter(
+        nome,
+        [disc_path] + arquivos_restricoes,
+        lambda: _ler_dataset(nome, disc_path, arquivos_restricoes),
+    )
+    return dados
 
-    restricoes: list[dict] = []
 
-    for p in sorted(DADOS_DIR.glob(f"{nome}_*.csv")):
-        if p.name.endswith("_disciplinas.csv"):
-            continue
+@app.get("/admin/datasets")
+def estatisticas_datasets():
+    return CACHE_DATASETS.estatisticas()
 
-        rows = _ler_csv(p)
-        restricoes.extend(_inferir_restricoes(rows, p.name))
 
-    return {"nome": nome, "disciplinas": disciplinas, "restricoes": restricoes}
+@app.delete("/admin/datasets")
+def limpar_datasets():
+    CACHE_DATASETS.limpar()
+    return {"ok": True}
 
 
 # --------------------------
@@ -493,210 +618,242 @@ async def upload_restricoes(files: List[UploadFile] = File(...)):
 # --------------------------
 
 
-@app.post("/gerar-grade")
-def gerar_grade(dados: Entrada) -> Dict[str, Any]:
-    tee_out = _Tee(sys.stdout)
-    tee_err = _Tee(sys.stderr)
+def _expandir_entrada(dados: Entrada) -> Dict[str, Any]:
+    """
+    Parte da preparação que não depende da Config: expande ocorrências
+    (aulas_por_semana) e traduz as restrições para os nomes expandidos
+    (main.IndiceOcorrencias / main.expandir_restricoes, os mesmos da CLI).
+    """
+    disciplinas_orig = [d.model_dump() for d in dados.disciplinas]
+    indice = IndiceOcorrencias(disciplinas_orig)
+    traduzidas = expandir_restricoes(indice, (r.model_dump() for r in dados.restricoes))
+
+    if indice.nao_resolvidos:
+        log.warning(
+            "%d referência(s) em restrições não resolvida(s): %s",
+            len(indice.nao_resolvidos),
+            ", ".join(f"{n['nome']} ({n['motivo']})" for n in indice.nao_resolvidos[:20]),
+        )
 
-    try:
-        with redirect_stdout(tee_out), redirect_stderr(tee_err):
-            dias_semana = dados.config.dias_semana
-            blocos_por_dia = dados.config.blocos_por_dia
-
-            horarios = montar_horarios(dias_semana, blocos_por_dia)
-            num_blocos = len(horarios)
-
-            disciplinas_orig = [d.model_dump() for d in dados.disciplinas]
-
-            disciplinas_list = []
-            nome_base_por_expandida: Dict[str, str] = {}
-
-            for d in disciplinas_orig:
-                nome_base = d["nome"]
-                prof = d.get("prof", "")
-                semestre = d.get("semestre", "")
-                aps = max(1, int(d.get("aulas_por_semana", 1) or 1))
-
-                for i in range(aps):
-                    nome_expandido = (
-                        f"{nome_base} [{i+1}/{aps}]" if aps > 1 else nome_base
-                    )
-
-                    disciplinas_list.append(
-                        {
-                            "nome": nome_expandido,
-                            "prof": prof,
-                            "semestre": semestre,
-                            "aulas_por_semana": 1,
-                        }
-                    )
-
-                    nome_base_por_expandida[nome_expandido] = nome_base
-
-            def expandir_nome_disciplina(nome: str) -> List[str]:
-                if not nome:
-                    return []
-                encontrados = [
-                    n for n, base in nome_base_por_expandida.items() if base == nome
-                ]
-                return encontrados if encontrados else [nome]
-
-            def expandir_nome_disciplina_por_ocorrencia(
-                nome: str, ocorrencia: Optional[int]
-            ) -> List[str]:
-                encontrados = expandir_nome_disciplina(nome)
-                if not encontrados:
-                    return []
-
-                if ocorrencia is None:
-                    return encontrados
-
-                idx = int(ocorrencia) - 1
-                if 0 <= idx < len(encontrados):
-                    return [encontrados[idx]]
-
-                return []
-
-            G = construir_grafo(
-                disciplinas_list,
-                conflito_por_prof=dados.config.conflito_por_prof,
-                conflito_por_semestre=dados.config.conflito_por_semestre,
-            )
+    return {
+        "disciplinas_orig": disciplinas_orig,
+        "chave_disciplinas": chave_disciplinas(disciplinas_orig),
+        "disciplinas_list": indice.disciplinas,
+        "nome_base_por_expandida": indice.base_por_expandida,
+        "nao_resolvidos": indice.nao_resolvidos,
+        **traduzidas,
+    }
 
-            fixos: Dict[str, int] = {}
-            pares_mesmo: List[tuple] = []
-            pares_nao: List[tuple] = []
-            dia_por_disc: Dict[str, str] = {}
-
-            for r in dados.restricoes:
-                if r.tipo == "fixo":
-                    if r.disciplina and r.bloco is not None:
-                        expandidas = expandir_nome_disciplina_por_ocorrencia(
-                            r.disciplina, r.ocorrencia
-                        )
-                        for nome_exp in expandidas:
-                            fixos[nome_exp] = int(r.bloco)
-
-                elif r.tipo == "dia_fixo":
-                    if r.disciplina and r.dia:
-                        dn = _norm_dia(r.dia)
-                        if dn:
-                            for nome_exp in expandir_nome_disciplina(r.disciplina):
-                                dia_por_disc[nome_exp] = dn
-
-                elif r.tipo == "nao_coincidir":
-                    if r.disciplina1 and r.disciplina2:
-                        a_list = expandir_nome_disciplina(r.disciplina1)
-                        b_list = expandir_nome_disciplina(r.disciplina2)
-                        for a in a_list:
-                            for b in b_list:
-                                if a != b:
-                                    pares_nao.append((a, b))
-
-                elif r.tipo in ("mesmo_bloco", "mesmo_horario"):
-                    if r.disciplina1 and r.disciplina2:
-                        a_list = expandir_nome_disciplina(r.disciplina1)
-                        b_list = expandir_nome_disciplina(r.disciplina2)
-                        for a in a_list:
-                            for b in b_list:
-                                if a != b:
-                                    pares_mesmo.append((a, b))
-
-            for a, b in pares_nao:
-                if a in G and b in G:
-                    G.add_edge(a, b)
-
-            fixos = {d: b for d, b in fixos.items() if d in G}
-            fixos = {d: b for d, b in fixos.items() if 0 <= b < num_blocos}
-
-            dominios: Dict[str, set] = {}
-            idx_dia = indice_blocos_por_dia(horarios)
-
-            for disc, dia_norm in dia_por_disc.items():
-                if disc in G and dia_norm in idx_dia:
-                    dominios[disc] = set(idx_dia[dia_norm])
-
-            cores = colorir_grafo_balanceado(
-                G,
-                num_blocos=num_blocos,
-                fixos=fixos,
-                pares_mesmo_horario=pares_mesmo,
-                pares_mesmo_bloco=pares_mesmo,
-                dominios_por_no=dominios,
-                allow_extra_blocks=False,
-                hard_fail=True,
-            )
 
-            dist = defaultdict(int)
-            for _, b in cores.items():
-                dist[b] += 1
+def _grafo_conflitos(expansao: Dict[str, Any], conflito_por_prof: bool, conflito_por_semestre: bool):
+    """
+    Grafo de conflitos (professor/semestre + "não coincidir") da entrada
+    expandida, como GrafoCompacto. A parte professor/semestre vem compilada
+    do CACHE_DATASETS quando as disciplinas são as de um dataset carregado.
+    """
+    base, origem = CACHE_DATASETS.grafo(
+        expansao["chave_disciplinas"],
+        (conflito_por_prof, conflito_por_semestre),
+        lambda: construir_grafo(
+            expansao["disciplinas_list"],
+            conflito_por_prof=conflito_por_prof,
+            conflito_por_semestre=conflito_por_semestre,
+            compacto=True,
+        ),
+    )
+    if origem != "montado":
+        log.info("grafo de conflitos: %s.", origem)
+    return base.com_arestas(expansao["pares_nao"])
 
-            usados = sorted(dist.keys())
-            desbalanceamento = 0
-            if usados:
-                desbalanceamento = max(dist[b] for b in usados) - min(
-                    dist[b] for b in usados
-                )
 
-            total_disciplinas_base = len(disciplinas_orig)
+def _cliques(expansao: Dict[str, Any], conflito_por_prof: bool, conflito_por_semestre: bool):
+    """Cliques de professor/semestre (com origem), memorizadas na expansão por flags."""
+    memo = expansao.setdefault("cliques", {})
+    chave = (conflito_por_prof, conflito_por_semestre)
+    if chave not in memo:
+        memo[chave] = cliques_de_conflito(expansao["disciplinas_list"], *chave, com_origem=True)
+    return memo[chave]
 
-            total_ocorrencias = sum(
-                max(1, int(d.get("aulas_por_semana", 1) or 1)) for d in disciplinas_orig
-            )
 
-            ocorrencias_alocadas = len(
-                [k for k in cores.keys() if k in nome_base_por_expandida]
-            )
+def _problema_da_config(expansao: Dict[str, Any], G, config: Config) -> Dict[str, Any]:
+    """Calendário da Config sobre um grafo já montado: horários, fixos e domínios por dia."""
+    horarios = montar_horarios(config.dias_semana, config.blocos_por_dia)
+    num_blocos = len(horarios)
 
-            disciplinas_base_alocadas = len(
-                set(
-                    nome_base_por_expandida.get(k, k)
-                    for k in cores.keys()
-                    if k in nome_base_por_expandida
-                )
-            )
+    fixos = {d: b for d, b in expansao["fixos"].items() if d in G}
+    fixos = {d: b for d, b in fixos.items() if 0 <= b < num_blocos}
 
-            prof_display = {}
-            for d in disciplinas_list:
-                prof_display[d["nome"]] = _prof_display(d.get("prof", ""))
+    dominios: Dict[str, set] = {}
+    idx_dia = indice_blocos_por_dia(horarios)
 
-            nome_exibicao = {}
-            for disc in G.nodes():
-                nome_base = nome_base_por_expandida.get(disc, disc)
-                prof_txt = prof_display.get(disc, "")
-                nome_exibicao[disc] = (
-                    f"{nome_base} / {prof_txt}" if prof_txt else nome_base
-                )
+    for disc, dia_norm in expansao["dia_por_disc"].items():
+        if disc in G and dia_norm in idx_dia:
+            dominios[disc] = set(idx_dia[dia_norm])
+
+    return {
+        "cliques": _cliques(expansao, config.conflito_por_prof, config.conflito_por_semestre),
+        "dia_por_bloco": {b: dia for dia, blocos in idx_dia.items() for b in blocos},
+        "G": G,
+        "horarios": horarios,
+        "num_blocos": num_blocos,
+        "fixos": fixos,
+        "pares_mesmo": expansao["pares_mesmo"],
+        "dominios": dominios,
+        "disciplinas_orig": expansao["disciplinas_orig"],
+        "disciplinas_list": expansao["disciplinas_list"],
+        "nome_base_por_expandida": expansao["nome_base_por_expandida"],
+        "nao_resolvidos": expansao["nao_resolvidos"],
+    }
+
+
+def _preparar_problema(dados: Entrada) -> Dict[str, Any]:
+    """
+    Expande ocorrências (aulas_por_semana), monta o grafo de conflitos e
+    traduz as restrições para fixos, pares "mesmo bloco" e domínios por dia.
+    """
+    expansao = _expandir_entrada(dados)
+    G = _grafo_conflitos(
+        expansao, dados.config.conflito_por_prof, dados.config.conflito_por_semestre
+    )
+    return _problema_da_config(expansao, G, dados.config)
+
+
+def _certificados_inviabilidade(problema: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """grafo.analisar_inviabilidade sobre o problema."""
+    return analisar_inviabilidade(
+        problema["G"],
+        problema["num_blocos"],
+        fixos=problema["fixos"],
+        pares_mesmo=problema["pares_mesmo"],
+        dominios_por_no=problema["dominios"],
+        cliques=problema["cliques"],
+        dia_por_bloco=problema["dia_por_bloco"],
+    )
+
+
+def _opcoes_motor(problema: Dict[str, Any], config: Config, stats_motor: dict) -> dict:
+    """Argumentos comuns de colorir_grafo_balanceado/colorir_portfolio."""
+    return dict(
+        num_blocos=problema["num_blocos"],
+        fixos=problema["fixos"],
+        pares_mesmo_horario=problema["pares_mesmo"],
+        pares_mesmo_bloco=problema["pares_mesmo"],
+        dominios_por_no=problema["dominios"],
+        allow_extra_blocks=False,
+        hard_fail=True,
+        busca_completa=config.busca_completa,
+        limite_nos=config.busca_limite_nos,
+        limite_segundos=config.busca_limite_segundos,
+        balancear=config.balancear,
+        balancear_iteracoes=config.balancear_iteracoes,
+        balancear_segundos=config.balancear_segundos,
+        stats=stats_motor,
+    )
+
+
+def _montar_resultado(
+    problema: Dict[str, Any], cores: dict, stats_motor: dict, logs: str
+) -> Dict[str, Any]:
+    G = problema["G"]
+    horarios = problema["horarios"]
+    disciplinas_orig = problema["disciplinas_orig"]
+    disciplinas_list = problema["disciplinas_list"]
+    nome_base_por_expandida = problema["nome_base_por_expandida"]
+
+    dist = defaultdict(int)
+    for _, b in cores.items():
+        dist[b] += 1
+
+    usados = sorted(dist.keys())
+    desbalanceamento = 0
+    if usados:
+        desbalanceamento = max(dist[b] for b in usados) - min(dist[b] for b in usados)
+
+    total_disciplinas_base = len(disciplinas_orig)
+
+    total_ocorrencias = sum(
+        max(1, int(d.get("aulas_por_semana", 1) or 1)) for d in disciplinas_orig
+    )
+
+    ocorrencias_alocadas = len([k for k in cores.keys() if k in nome_base_por_expandida])
+
+    disciplinas_base_alocadas = len(
+        set(
+            nome_base_por_expandida.get(k, k)
+            for k in cores.keys()
+            if k in nome_base_por_expandida
+        )
+    )
+
+    prof_display = {}
+    for d in disciplinas_list:
+        prof_display[d["nome"]] = _prof_display(d.get("prof", ""))
+
+    nome_exibicao = {}
+    for disc in G.nodes():
+        nome_base = nome_base_por_expandida.get(disc, disc)
+        prof_txt = prof_display.get(disc, "")
+        nome_exibicao[disc] = f"{nome_base} / {prof_txt}" if prof_txt else nome_base
+
+    return {
+        "alocacao": cores,
+        "horarios": horarios,
+        "stats": {
+            "total_blocos": problema["num_blocos"],
+            "blocos_usados": len(usados),
+            "desbalanceamento": desbalanceamento,
+            "dist_por_bloco": {str(k): int(v) for k, v in dist.items()},
+            "total_disciplinas_base": total_disciplinas_base,
+            "disciplinas_base_alocadas": disciplinas_base_alocadas,
+            "total_ocorrencias": total_ocorrencias,
+            "ocorrencias_alocadas": ocorrencias_alocadas,
+            "busca_nos": stats_motor.get("busca_nos", 0),
+            "busca_backtracks": stats_motor.get("busca_backtracks", 0),
+            "balanceamento_iteracoes": stats_motor.get("balanceamento_iteracoes", 0),
+            "portfolio_tentativas": stats_motor.get("portfolio_tentativas", 0),
+            "componentes": stats_motor.get("componentes", 0),
+            "incremental_mantidos": stats_motor.get("incremental_mantidos", 0),
+            "incremental_invalidados": stats_motor.get("incremental_invalidados", 0),
+            "incremental_movidos": stats_motor.get("incremental_movidos", 0),
+        },
+        "nome_exibicao": nome_exibicao,
+        "restricoes_nao_resolvidas": problema.get("nao_resolvidos", []),
+        "logs": logs,
+    }
 
-            logs = (tee_out.getvalue() + "\n" + tee_err.getvalue()).strip()
-
-            resultado = {
-                "alocacao": cores,
-                "horarios": horarios,
-                "stats": {
-                    "total_blocos": num_blocos,
-                    "blocos_usados": len(usados),
-                    "desbalanceamento": desbalanceamento,
-                    "dist_por_bloco": {str(k): int(v) for k, v in dist.items()},
-                    "total_disciplinas_base": total_disciplinas_base,
-                    "disciplinas_base_alocadas": disciplinas_base_alocadas,
-                    "total_ocorrencias": total_ocorrencias,
-                    "ocorrencias_alocadas": ocorrencias_alocadas,
-                },
-                "nome_exibicao": nome_exibicao,
-                "logs": logs,
-            }
+
+def _executar_geracao(dados: Entrada, resolver) -> Dict[str, Any]:
+    """
+    Roda uma geração completa (preparo, análise de inviabilidade, motor,
+    resultado) capturando os logs e registrando no banco.
+    resolver(problema, stats_motor) -> cores. Entrada reprovada pela análise
+    não chega ao motor: o 400 traz os certificados em detail["certificados"].
+    """
+    t0 = time.perf_counter()
+    try:
+        with coletar_logs() as coletor:
+            problema = _preparar_problema(dados)
+            certificados = _certificados_inviabilidade(problema)
+            if certificados:
+                for c in certificados:
+                    log.warning("%s", c["mensagem"])
+                raise EntradaInviavel(certificados)
+            stats_motor: Dict[str, Any] = {}
+            cores = resolver(problema, stats_motor)
+
+            resultado = _montar_resultado(problema, cores, stats_motor, coletor.texto())
 
         salvar_geracao_grade(
             entrada=dados.model_dump(),
             resultado=resultado,
             sucesso=True,
+            segundos=time.perf_counter() - t0,
         )
 
         return resultado
 
     except Exception as e:
-        logs = (tee_out.getvalue() + "\n" + tee_err.getvalue()).strip()
+        logs = coletor.texto()
         msg = str(e)
 
         detail = ""
@@ -709,6 +866,7 @@ def gerar_grade(dados: Entrada) -> Dict[str, Any]:
             resultado=None,
             sucesso=False,
             erro=detail,
+            segundos=time.perf_counter() - t0,
         )
         salvar_geracao_json(
             entrada=dados.model_dump(),
@@ -716,235 +874,501 @@ def gerar_grade(dados: Entrada) -> Dict[str, Any]:
             sucesso=False,
             erro=detail,
         )
+        if isinstance(e, EntradaInviavel):
+            raise HTTPException(
+                status_code=400,
+                detail={"erro": msg, "certificados": e.certificados, "logs": logs},
+            )
         raise HTTPException(status_code=400, detail=detail)
 
 
-# --------------------------
-# Exportação visual
-# --------------------------
+def _chave_entrada(dados: Entrada) -> str:
+    """
+    Hash (sha256) da entrada normalizada: ordem de disciplinas/restrições não
+    importa e campos são normalizados só onde isso não muda o resultado
+    (professores como exibidos, semestre, dia, "mesmo_horario" = "mesmo_bloco").
+    """
+    config = dados.config.model_dump(exclude={"usar_cache"})
+
+    disciplinas = sorted(
+        (
+            d.nome,
+            _prof_display(d.prof),
+            str(d.semestre).strip().lower(),
+            max(1, int(d.aulas_por_semana or 1)),
+        )
+        for d in dados.disciplinas
+    )
 
+    restricoes = sorted(
+        json.dumps(
+            {
+                "tipo": "mesmo_bloco" if r.tipo == "mesmo_horario" else r.tipo,
+                "disciplina": r.disciplina,
+                "bloco": r.bloco,
+                "ocorrencia": r.ocorrencia,
+                "dia": _norm_dia(r.dia) if r.dia else None,
+                "disciplina1": r.disciplina1,
+                "disciplina2": r.disciplina2,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        for r in dados.restricoes
+    )
 
-def _montar_grade_visual(
-    alocacao: dict, horarios: dict, nome_exibicao: dict, semestre_por_disc: dict
-):
-    dias_ordem = ["seg", "ter", "qua", "qui", "sex", "sab", "dom"]
-
-    dia_map = {
-        "Seg": "seg",
-        "Ter": "ter",
-        "Qua": "qua",
-        "Qui": "qui",
-        "Sex": "sex",
-        "Sab": "sab",
-        "Dom": "dom",
-    }
+    canonico = json.dumps(
+        {"config": config, "disciplinas": disciplinas, "restricoes": restricoes},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+def _resolver_padrao(config: Config, progresso=None):
+    """resolver de _executar_geracao para /gerar-grade (estratégia ou portfólio)."""
+
+    def resolver(problema, stats_motor):
+        if progresso is not None:
+            G = problema["G"]
+            progresso({"fase": "grafo", "nos": G.number_of_nodes(), "arestas": G.number_of_edges()})
+        opcoes = _opcoes_motor(problema, config, stats_motor)
+        if config.decompor_componentes:
+            return colorir_por_componentes(
+                problema["G"],
+                strategy=config.strategy,
+                trabalhadores=config.componentes_trabalhadores,
+                progresso=progresso,
+                **opcoes,
+            )
+        if config.portfolio_tentativas > 1:
+            return colorir_portfolio(
+                problema["G"],
+                tentativas=config.portfolio_tentativas,
+                trabalhadores=config.portfolio_trabalhadores,
+                alvo_desbalanceamento=config.portfolio_alvo,
+                progresso=progresso,
+                **opcoes,
+            )
+        return colorir_grafo_balanceado(
+            problema["G"], strategy=config.strategy, progresso=progresso, **opcoes
+        )
 
-    grade = {}
-    sem_semestre = {}
-
-    def push_cell(container, semestre, periodo, dia, texto):
-        if semestre not in container:
-            container[semestre] = {}
-        if periodo not in container[semestre]:
-            container[semestre][periodo] = {}
-        if dia not in container[semestre][periodo]:
-            container[semestre][periodo][dia] = []
-        container[semestre][periodo][dia].append(texto)
-
-    def push_sem_semestre(container, periodo, dia, texto):
-        if periodo not in container:
-            container[periodo] = {}
-        if dia not in container[periodo]:
-            container[periodo][dia] = []
-        container[periodo][dia].append(texto)
-
-    total_blocos = len(horarios)
-    blocos_por_dia = 4
-    if total_blocos % 5 == 0 and total_blocos > 0:
-        blocos_por_dia = total_blocos // 5
-
-    for disc, bloco_raw in alocacao.items():
-        bloco = int(bloco_raw)
-        label = horarios.get(bloco, "")
-        partes = str(label).split(" ")
-        dia_txt = partes[0] if partes else ""
-        dia = dia_map.get(dia_txt)
-        if not dia:
-            continue
+    return resolver
 
-        indice_no_dia = bloco % blocos_por_dia
-        periodo = _periodo_do_indice(indice_no_dia)
 
-        nome_base = re.sub(r"\s*\[\d+/\d+\]", "", disc)
-        nome = nome_exibicao.get(disc, nome_base)
+def _gerar_grade(dados: Entrada, progresso=None) -> Dict[str, Any]:
+    resolver = _resolver_padrao(dados.config, progresso)
 
-        semestre = str(semestre_por_disc.get(nome_base, "")).strip()
+    if not dados.config.usar_cache:
+        resultado = _executar_geracao(dados, resolver)
+        resultado["cache"] = {"chave": None, "hit": False, "origem": "desativado"}
+        return resultado
 
-        if not semestre:
-            push_sem_semestre(sem_semestre, periodo, dia, nome)
-        else:
-            push_cell(grade, semestre, periodo, dia, nome)
+    chave = _chave_entrada(dados)
+    resultado, origem = CACHE_RESULTADOS.obter_ou_calcular(
+        chave, lambda: _executar_geracao(dados, resolver)
+    )
+    resultado["cache"] = {"chave": chave, "hit": origem != "calculado", "origem": origem}
+    return resultado
 
-    return grade, sem_semestre, dias_ordem, blocos_por_dia
 
+@app.post("/gerar-grade")
+def gerar_grade(dados: Entrada) -> Dict[str, Any]:
+    return _gerar_grade(dados)
 
-def _gerar_csv_visual(
-    caminho_csv: Path,
-    alocacao: dict,
-    horarios: dict,
-    nome_exibicao: dict,
-    semestre_por_disc: dict,
-):
-    grade, sem_semestre, dias, blocos_por_dia = _montar_grade_visual(
-        alocacao, horarios, nome_exibicao, semestre_por_disc
-    )
 
-    dias_uteis = dias[:5]
-    semestres = sorted(grade.keys(), key=lambda x: str(x))
-    periodos = [str(i + 1) for i in range(blocos_por_dia)]
+def _evento_sse(evento: str, dados) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n"
 
-    linhas = []
 
-    linhas.append(_esc_csv("Oferta Regular — 2026 / 1"))
-    linhas.append(",".join([_esc_csv(x) for x in ["Semestre", "Período", *dias_uteis]]))
+@app.post("/gerar-grade/stream")
+def gerar_grade_stream(dados: Entrada):
+    """
+    Mesma geração de /gerar-grade, mas como Server-Sent Events: eventos
+    "progresso" (grafo, grupos, alocacao, busca, balanceamento, portfolio,
+    componentes) enquanto o motor roda e, no fim, "resultado" ou "erro".
+    """
+    fila = queue.Queue()
 
-    for sem in semestres:
-        for p in periodos:
-            row = [sem, p]
-            for dia in dias_uteis:
-                lista = grade.get(sem, {}).get(p, {}).get(dia, [])
-                row.append("\n".join(lista))
-            linhas.append(",".join(_esc_csv(x) for x in row))
+    def rodar():
+        try:
+            fila.put(("resultado", _gerar_grade(dados, lambda ev: fila.put(("progresso", ev)))))
+        except HTTPException as e:
+            fila.put(("erro", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            fila.put(("erro", {"status_code": 500, "detail": str(e)}))
+
+    threading.Thread(target=rodar, daemon=True).start()
+
+    def eventos():
+        while True:
+            evento, conteudo = fila.get()
+            yield _evento_sse(evento, conteudo)
+            if evento != "progresso":
+                return
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if sem_semestre:
-        linhas.append("")
-        linhas.append(_esc_csv("Disciplinas sem semestre informado"))
-        linhas.append(",".join([_esc_csv(x) for x in ["Período", *dias_uteis]]))
 
-        for p in periodos:
-            row = [p]
-            for dia in dias_uteis:
-                lista = sem_semestre.get(p, {}).get(dia, [])
-                row.append("\n".join(lista))
-            linhas.append(",".join(_esc_csv(x) for x in row))
+@app.get("/admin/cache")
+def estatisticas_cache():
+    return CACHE_RESULTADOS.estatisticas()
 
-    caminho_csv.write_text("\n".join(linhas), encoding="utf-8-sig")
 
+@app.delete("/admin/cache")
+def limpar_cache():
+    CACHE_RESULTADOS.limpar()
+    return {"ok": True}
 
-def _gerar_xlsx_visual(
-    caminho_xlsx: Path,
-    alocacao: dict,
-    horarios: dict,
-    nome_exibicao: dict,
-    semestre_por_disc: dict,
-):
-    grade, sem_semestre, dias, blocos_por_dia = _montar_grade_visual(
-        alocacao, horarios, nome_exibicao, semestre_por_disc
+
+def _aplicar_delta(entrada: Entrada, delta: DeltaGeracao) -> Entrada:
+    remover = set(delta.remover_disciplinas)
+    por_nome = {d.nome: d for d in entrada.disciplinas if d.nome not in remover}
+    for d in delta.disciplinas:
+        por_nome[d.nome] = d
+
+    removidas = [r.model_dump() for r in delta.remover_restricoes]
+    restricoes = [r for r in entrada.restricoes if r.model_dump() not in removidas]
+    restricoes.extend(delta.restricoes)
+
+    return Entrada(
+        config=delta.config or entrada.config,
+        disciplinas=list(por_nome.values()),
+        restricoes=restricoes,
     )
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Grade"
-
-    bold = Font(bold=True)
-    title_font = Font(bold=True, size=14)
-    center = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    top_left = Alignment(horizontal="left", vertical="top", wrap_text=True)
-    thin = Side(style="thin")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-    dias_uteis = dias[:5]
-    headers = ["Semestre", "Período", *dias_uteis]
-
-    # título principal
-    ws.merge_cells("A1:G1")
-    ws["A1"] = "Oferta Regular — 2026 / 1"
-    ws["A1"].font = title_font
-    ws["A1"].alignment = center
-
-    # cabeçalho tabela principal
-    for c, h in enumerate(headers, start=1):
-        cell = ws.cell(row=2, column=c, value=h)
-        cell.font = bold
-        cell.alignment = center
-        cell.border = border
-
-    row_idx = 3
-    semestres = sorted(grade.keys(), key=lambda x: str(x))
-    periodos = [str(i + 1) for i in range(blocos_por_dia)]
-
-    for sem in semestres:
-        inicio_sem = row_idx
-
-        for p in periodos:
-            linha = [sem, p]
-            for dia in dias_uteis:
-                lista = grade.get(sem, {}).get(p, {}).get(dia, [])
-                linha.append("\n".join(lista))
-            ws.append(linha)
-
-            for c in range(1, 8):
-                cell = ws.cell(row=row_idx, column=c)
-                cell.border = border
-                cell.alignment = center if c <= 2 else top_left
-
-            row_idx += 1
-
-        if row_idx - 1 > inicio_sem:
-            ws.merge_cells(
-                start_row=inicio_sem, start_column=1, end_row=row_idx - 1, end_column=1
+
+@app.post("/gerar-grade/incremental")
+def gerar_grade_incremental(delta: DeltaGeracao) -> Dict[str, Any]:
+    """
+    Re-resolve a partir de uma GeracaoGrade salva: aplica o delta à entrada
+    dela e usa a alocação anterior como ponto de partida, realocando só o
+    que foi invalidado.
+    """
+    db = SessionLocal()
+    try:
+        base = db.query(GeracaoGrade).filter(GeracaoGrade.id == delta.geracao_id).first()
+        if not base:
+            raise HTTPException(status_code=404, detail="Geração não encontrada")
+        entrada_json, resultado_json = _payloads_geracao(db, base) if base.sucesso else (None, None)
+        if not resultado_json or not entrada_json:
+            raise HTTPException(
+                status_code=400,
+                detail="Geração base sem resultado (falhou); use /gerar-grade.",
+            )
+        entrada_base = Entrada.model_validate(entrada_json)
+        alocacao_anterior = dict(resultado_json.get("alocacao") or {})
+    finally:
+        db.close()
+
+    dados = _aplicar_delta(entrada_base, delta)
+
+    def resolver(problema, stats_motor):
+        opcoes = _opcoes_motor(problema, dados.config, stats_motor)
+        for chave in ("busca_completa", "balancear", "balancear_iteracoes", "balancear_segundos"):
+            opcoes.pop(chave)
+        return colorir_incremental(
+            problema["G"],
+            alocacao_anterior,
+            strategy=dados.config.strategy,
+            **opcoes,
+        )
+
+    resultado = _executar_geracao(dados, resolver)
+    resultado["geracao_base_id"] = delta.geracao_id
+    return resultado
+
+
+@app.post("/gerar-grade/calendario-minimo")
+def gerar_grade_calendario_minimo(dados: CalendarioMinimoEntrada) -> Dict[str, Any]:
+    """
+    Menor blocos_por_dia (com config.dias_semana fixo) que comporta a grade,
+    com a alocação encontrada. Limite inferior pelas cliques de professor/
+    semestre, fixos e dias fixos; depois busca crescente + bisseção
+    reaproveitando as tentativas (main.buscar_blocos_por_dia_minimo).
+    A geração final é salva como uma /gerar-grade comum.
+    """
+    config = dados.config
+    with coletar_logs() as coletor:
+        expansao = _expandir_entrada(dados)
+        G = _grafo_conflitos(expansao, config.conflito_por_prof, config.conflito_por_semestre)
+
+        # as checagens só ficam mais fáceis com mais blocos/dia: se falham no
+        # máximo, falham em todos
+        maximo = config.model_copy(update={"blocos_por_dia": dados.blocos_por_dia_max})
+        certificados = _certificados_inviabilidade(_problema_da_config(expansao, G, maximo))
+        if certificados:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "erro": f"Nenhum calendário com {config.dias_semana} dias e até "
+                    f"{dados.blocos_por_dia_max} blocos/dia comporta a grade.",
+                    "certificados": certificados,
+                    "logs": coletor.texto(),
+                },
             )
-            ws.cell(row=inicio_sem, column=1).alignment = center
-            ws.cell(row=inicio_sem, column=1).font = bold
-            ws.cell(row=inicio_sem, column=1).border = border
-
-    # seção sem semestre informado
-    if sem_semestre:
-        row_idx += 2
-
-        ws.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=6)
-        ws.cell(row=row_idx, column=1, value="Disciplinas sem semestre informado")
-        ws.cell(row=row_idx, column=1).font = title_font
-        ws.cell(row=row_idx, column=1).alignment = center
-
-        row_idx += 1
-        headers2 = ["Período", *dias_uteis]
-        for c, h in enumerate(headers2, start=1):
-            cell = ws.cell(row=row_idx, column=c, value=h)
-            cell.font = bold
-            cell.alignment = center
-            cell.border = border
-
-        row_idx += 1
-        for p in periodos:
-            linha = [p]
-            for dia in dias_uteis:
-                lista = sem_semestre.get(p, {}).get(dia, [])
-                linha.append("\n".join(lista))
-
-            for c, valor in enumerate(linha, start=1):
-                cell = ws.cell(row=row_idx, column=c, value=valor)
-                cell.border = border
-                cell.alignment = center if c == 1 else top_left
-
-            row_idx += 1
-
-    larguras = {
-        "A": 12,
-        "B": 12,
-        "C": 32,
-        "D": 32,
-        "E": 32,
-        "F": 32,
-        "G": 32,
+
+        cliques = [nomes for _, nomes in _cliques(
+            expansao, config.conflito_por_prof, config.conflito_por_semestre
+        )]
+        busca = buscar_blocos_por_dia_minimo(
+            G,
+            config.dias_semana,
+            expansao["fixos"],
+            expansao["dia_por_disc"],
+            expansao["pares_mesmo"],
+            cliques,
+            blocos_max=dados.blocos_por_dia_max,
+            strategy=config.strategy,
+            limite_nos=config.busca_limite_nos,
+            limite_segundos=config.busca_limite_segundos,
+        )
+
+    resumo = {k: busca[k] for k in ("blocos_por_dia", "limite_inferior", "otimo_provado", "tentativas")}
+    if busca["blocos_por_dia"] is None:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "erro": f"Nenhum calendário com {config.dias_semana} dias e até "
+                f"{dados.blocos_por_dia_max} blocos/dia comporta a grade.",
+                "calendario_minimo": resumo,
+                "logs": coletor.texto(),
+            },
+        )
+
+    final = Entrada(
+        config=config.model_copy(update={"blocos_por_dia": busca["blocos_por_dia"]}),
+        disciplinas=dados.disciplinas,
+        restricoes=dados.restricoes,
+    )
+
+    def resolver(problema, stats_motor):
+        return busca["cores"]
+
+    resultado = _executar_geracao(final, resolver)
+    resultado["logs"] = (coletor.texto() + "\n" + resultado["logs"]).strip()
+    resultado["calendario_minimo"] = resumo
+    return resultado
+
+
+# --------------------------
+# Varredura de cenários (lote)
+# --------------------------
+
+_LOTE_GRAFOS: Dict[tuple, Any] = {}
+
+
+def _iniciar_worker_lote(grafos):
+    # grafos base chegam uma vez por processo, não a cada variante
+    global _LOTE_GRAFOS
+    _LOTE_GRAFOS = grafos
+
+
+def _resolver_variante(indice: int, chave_grafo: tuple, problema: Dict[str, Any], config: dict):
+    """Resolve uma variante do lote (roda no pool). Erros viram linha inviável."""
+    config = Config.model_validate(config)
+    problema = {**problema, "G": _LOTE_GRAFOS[chave_grafo]}
+    stats_motor: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    with coletar_logs() as coletor:
+        try:
+            cores = _resolver_padrao(config)(problema, stats_motor)
+            erro = None
+        except Exception as e:
+            cores, erro = None, str(e)
+    return {
+        "indice": indice,
+        "cores": cores,
+        "stats_motor": stats_motor,
+        "segundos": time.perf_counter() - t0,
+        "erro": erro,
+        "logs": coletor.texto(),
+    }
+
+
+def _variantes_lote(lote: LoteEntrada) -> List[Config]:
+    campos = set(Config.model_fields)
+    desconhecidos = sorted(set(lote.grade) - campos)
+    if desconhecidos:
+        raise HTTPException(
+            status_code=400, detail=f"Campos de grade desconhecidos: {', '.join(desconhecidos)}"
+        )
+
+    nomes = list(lote.grade)
+    valores = [lote.grade[n] for n in nomes]
+    total = 1
+    for v in valores:
+        total *= len(v)
+    if total > LOTE_MAX_VARIANTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Grade com {total} variantes (máx. {LOTE_MAX_VARIANTES}).",
+        )
+
+    base = lote.config.model_dump()
+    variantes = []
+    for combo in itertools.product(*valores):
+        config = Config.model_validate({**base, **dict(zip(nomes, combo))})
+        # o lote já é o pool: portfólio/componentes dentro da variante rodam sem processos extras
+        config.portfolio_trabalhadores = 1
+        config.componentes_trabalhadores = 1
+        variantes.append(config)
+    return variantes
+
+
+@app.post("/gerar-grade/lote")
+def gerar_grade_lote(lote: LoteEntrada) -> Dict[str, Any]:
+    """
+    Resolve todas as variantes da grade de Config para o mesmo conjunto de
+    disciplinas/restrições e devolve uma tabela comparativa. O grafo de
+    conflitos é montado uma vez por combinação de conflito_por_prof/
+    conflito_por_semestre e as variantes rodam num ProcessPoolExecutor.
+
+    Vencedoras = viáveis com menor (desbalanceamento, total_blocos); só elas
+    são salvas em GeracaoGrade (se persistir_vencedoras).
+    """
+    variantes = _variantes_lote(lote)
+    entrada_base = Entrada(config=lote.config, disciplinas=lote.disciplinas, restricoes=lote.restricoes)
+    expansao = _expandir_entrada(entrada_base)
+
+    grafos = {}
+    for config in variantes:
+        chave = (config.conflito_por_prof, config.conflito_por_semestre)
+        if chave not in grafos:
+            grafos[chave] = _grafo_conflitos(expansao, *chave)
+
+    tarefas, brutos = [], []
+    for i, config in enumerate(variantes):
+        chave = (config.conflito_por_prof, config.conflito_por_semestre)
+        problema = _problema_da_config(expansao, grafos[chave], config)
+        # variante reprovada pela análise nem vai para o pool
+        certificados = _certificados_inviabilidade(problema)
+        if certificados:
+            brutos.append({
+                "indice": i, "cores": None, "stats_motor": {}, "segundos": 0.0,
+                "erro": str(EntradaInviavel(certificados)), "certificados": certificados, "logs": "",
+            })
+            continue
+        # só o necessário para o motor; o resto fica no processo principal
+        problema = {k: problema[k] for k in ("num_blocos", "fixos", "pares_mesmo", "dominios")}
+        tarefas.append((i, chave, problema, config.model_dump()))
+
+    t0 = time.perf_counter()
+    if lote.trabalhadores == 1 or len(tarefas) <= 1:
+        _iniciar_worker_lote(grafos)
+        brutos += [_resolver_variante(*t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=lote.trabalhadores,
+            initializer=_iniciar_worker_lote,
+            initargs=(grafos,),
+        ) as pool:
+            futuros = [pool.submit(_resolver_variante, *t) for t in tarefas]
+            brutos += [f.result() for f in as_completed(futuros)]
+    brutos.sort(key=lambda r: r["indice"])
+    segundos_total = time.perf_counter() - t0
+
+    campos_grade = list(lote.grade)
+    tabela = []
+    for bruto, config in zip(brutos, variantes):
+        cores = bruto["cores"] or {}
+        blocos_usados, desbalanceamento = resumo_alocacao(cores)
+        tabela.append(
+            {
+                "variante": bruto["indice"],
+                "config": {c: getattr(config, c) for c in campos_grade},
+                "viavel": bruto["erro"] is None,
+                "total_blocos": config.dias_semana * config.blocos_por_dia,
+                "blocos_usados": blocos_usados,
+                "desbalanceamento": desbalanceamento,
+                "segundos": round(bruto["segundos"], 4),
+                "erro": bruto["erro"],
+                "certificados": bruto.get("certificados", []),
+                "vencedora": False,
+                "geracao_id": None,
+            }
+        )
+
+    viaveis = [l for l in tabela if l["viavel"]]
+    vencedoras = []
+    if viaveis:
+        melhor = min((l["desbalanceamento"], l["total_blocos"]) for l in viaveis)
+        for linha in viaveis:
+            if (linha["desbalanceamento"], linha["total_blocos"]) != melhor:
+                continue
+            linha["vencedora"] = True
+            i = linha["variante"]
+            config, bruto = variantes[i], brutos[i]
+            chave = (config.conflito_por_prof, config.conflito_por_semestre)
+            problema = _problema_da_config(expansao, grafos[chave], config)
+            resultado = _montar_resultado(problema, bruto["cores"], bruto["stats_motor"], bruto["logs"])
+            if lote.persistir_vencedoras:
+                entrada = Entrada(config=config, disciplinas=lote.disciplinas, restricoes=lote.restricoes)
+                linha["geracao_id"] = salvar_geracao_grade(
+                    entrada=entrada.model_dump(), resultado=resultado, sucesso=True,
+                    segundos=bruto["segundos"],
+                )
+            vencedoras.append({"variante": i, "geracao_id": linha["geracao_id"], "resultado": resultado})
+
+    # as vencedoras vão num lote só; a resposta precisa dos ids
+    for linha in tabela:
+        if linha["geracao_id"] is not None:
+            linha["geracao_id"] = linha["geracao_id"].result()
+    for v in vencedoras:
+        if v["geracao_id"] is not None:
+            v["geracao_id"] = v["geracao_id"].result()
+
+    return {
+        "variantes": len(tabela),
+        "viaveis": len(viaveis),
+        "grafos_montados": len(grafos),
+        "segundos": round(segundos_total, 4),
+        "tabela": tabela,
+        "vencedoras": vencedoras,
     }
-    for col, largura in larguras.items():
-        ws.column_dimensions[col].width = largura
 
-    for i in range(1, ws.max_row + 1):
-        ws.row_dimensions[i].height = 34
 
-    wb.save(caminho_xlsx)
+# --------------------------
+# Jobs assíncronos
+# --------------------------
+
+
+@app.post("/jobs/gerar-grade", status_code=202)
+def criar_job_gerar_grade(dados: Entrada) -> Dict[str, Any]:
+    """Enfileira a geração e retorna o id na hora; acompanhe em GET /jobs/{id}."""
+    return jobs.enfileirar(dados.model_dump())
+
+
+@app.get("/jobs/{job_id}")
+def obter_job(job_id: int):
+    job = jobs.obter(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@app.post("/jobs/{job_id}/cancelar")
+def cancelar_job(job_id: int):
+    job = jobs.cancelar(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@app.get("/admin/workers")
+def estatisticas_workers():
+    return WORKERS.estatisticas()
+
+
+# --------------------------
+# Exportação visual
+# --------------------------
 
 
 @app.post("/exportar-grade")
@@ -957,30 +1381,30 @@ def exportar_grade(payload: ExportarGradeEntrada) -> Dict[str, Any]:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Payload inválido: {e}")
 
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_name = f"{payload.prefixo}_{ts}"
-
-    caminho_csv = OUT_DIR / f"{base_name}.csv"
-    caminho_xlsx = OUT_DIR / f"{base_name}.xlsx"
+    def gerar(caminho_csv, caminho_xlsx):
+        visual = montar_grade_visual(alocacao, horarios, nome_exib, semestre_por_disc)
+        exportar_visual(caminho_csv, caminho_xlsx, visual)
 
     try:
-        _gerar_csv_visual(caminho_csv, alocacao, horarios, nome_exib, semestre_por_disc)
-        _gerar_xlsx_visual(
-            caminho_xlsx, alocacao, horarios, nome_exib, semestre_por_disc
+        arquivos, origem = CACHE_EXPORTACOES.obter_ou_exportar(
+            chave_exportacao(alocacao, horarios, nome_exib, semestre_por_disc),
+            payload.prefixo,
+            gerar,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Falha ao salvar grade: {e}")
 
     return {
-        "csv": f"/out/{caminho_csv.name}",
-        "xlsx": f"/out/{caminho_xlsx.name}",
+        "csv": f"/out/{arquivos['csv']}",
+        "xlsx": f"/out/{arquivos['xlsx']}",
+        "cache": origem,
     }
 
 
 @app.get("/out")
 def listar_out():
-    arquivos = sorted([p.name for p in OUT_DIR.glob("*") if p.is_file()])
-    return {"arquivos": arquivos}
+    """Exportações do CACHE_EXPORTACOES, incluindo as que a CLI gravou em out/."""
+    return {"arquivos": CACHE_EXPORTACOES.listar()}
 
 
 @app.get("/out/{arquivo}")
@@ -988,52 +1412,165 @@ def baixar_out(arquivo: str):
     path = (OUT_DIR / arquivo).resolve()
     if OUT_DIR not in path.parents or not path.exists() or not path.is_file():
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    CACHE_EXPORTACOES.tocar(path.name)
     return FileResponse(path, filename=path.name)
 
 
+@app.get("/admin/exportacoes")
+def estatisticas_exportacoes():
+    return {**CACHE_EXPORTACOES.estatisticas(), "xlsx_geracoes": CACHE_XLSX_GERACOES.estatisticas()}
+
+
+def _filtros_geracoes(sucesso, desde, ate, dataset):
+    filtros = []
+    if sucesso is not None:
+        filtros.append(GeracaoGrade.sucesso == sucesso)
+    if desde is not None:
+        filtros.append(GeracaoGrade.criado_em >= desde)
+    if ate is not None:
+        filtros.append(GeracaoGrade.criado_em < ate)
+    if dataset:
+        filtros.append(GeracaoGrade.dataset_hash == dataset)
+    return filtros
+
+
 @app.get("/admin/geracoes")
-def listar_geracoes():
+def listar_geracoes(
+    response: Response,
+    cursor: Optional[int] = None,
+    limite: int = Query(100, ge=1, le=1000),
+    sucesso: Optional[bool] = None,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    dataset: Optional[str] = None,
+):
+    """
+    Gerações da mais nova para a mais antiga, paginadas por keyset: a
+    próxima página é ?cursor=<X-Proximo-Cursor> (header exposto no CORS).
+    O keyset é só o id: é único e crescente (nada repete nem some entre
+    páginas, ao contrário de criado_em, que empata dentro de um lote do
+    gravador), e criado_em vem do mesmo INSERT, então a ordem por id é a
+    de criado_em.
+    Filtros: sucesso, intervalo [desde, ate) em criado_em e dataset
+    (datasets.chave_disciplinas, ver /admin/datasets).
+    """
     db = SessionLocal()
 
     try:
-        geracoes = (
-            db.query(GeracaoGrade).order_by(GeracaoGrade.id.desc()).limit(100).all()
-        )
-
-        return [
-            {
-                "id": g.id,
-                "criado_em": g.criado_em,
-                "sucesso": g.sucesso,
-                "qtd_disciplinas": g.qtd_disciplinas,
-                "qtd_restricoes": g.qtd_restricoes,
-                "total_blocos": g.total_blocos,
-                "blocos_usados": g.blocos_usados,
-                "total_ocorrencias": g.total_ocorrencias,
-                "ocorrencias_alocadas": g.ocorrencias_alocadas,
-                "erro": g.erro,
-            }
-            for g in geracoes
-        ]
+        consulta = db.query(
+            GeracaoGrade.id,
+            GeracaoGrade.criado_em,
+            GeracaoGrade.sucesso,
+            GeracaoGrade.qtd_disciplinas,
+            GeracaoGrade.qtd_restricoes,
+            GeracaoGrade.total_blocos,
+            GeracaoGrade.blocos_usados,
+            GeracaoGrade.total_ocorrencias,
+            GeracaoGrade.ocorrencias_alocadas,
+            GeracaoGrade.segundos,
+            GeracaoGrade.dataset_hash,
+            GeracaoGrade.erro,
+        ).filter(*_filtros_geracoes(sucesso, desde, ate, dataset))
+        if cursor is not None:
+            consulta = consulta.filter(GeracaoGrade.id < cursor)
+        geracoes = consulta.order_by(GeracaoGrade.id.desc()).limit(limite + 1).all()
+
+        if len(geracoes) > limite:
+            geracoes = geracoes[:limite]
+            response.headers["X-Proximo-Cursor"] = str(geracoes[-1].id)
+
+        return [g._asdict() for g in geracoes]
 
     finally:
         db.close()
 
 
+@app.get("/admin/geracoes/estatisticas")
+def estatisticas_geracoes(
+    sucesso: Optional[bool] = None,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    dataset: Optional[str] = None,
+):
+    """
+    Por dia (criado_em): total, taxa de sucesso, média de blocos_usados das
+    bem-sucedidas e percentis (p50/p90/p99, nearest-rank) de segundos.
+    Tudo agregado no banco; só as linhas por dia voltam.
+    """
+    filtros = _filtros_geracoes(sucesso, desde, ate, dataset)
+    dia = func.date(GeracaoGrade.criado_em)
+
+    totais = (
+        select(
+            dia.label("dia"),
+            func.count().label("total"),
+            func.sum(case((GeracaoGrade.sucesso, 1), else_=0)).label("sucessos"),
+            func.avg(case((GeracaoGrade.sucesso, GeracaoGrade.blocos_usados))).label("media_blocos_usados"),
+        )
+        .where(*filtros)
+        .group_by(dia)
+        .order_by(dia)
+    )
+
+    ordenados = (
+        select(
+            dia.label("dia"),
+            GeracaoGrade.segundos.label("segundos"),
+            func.row_number().over(partition_by=dia, order_by=GeracaoGrade.segundos).label("pos"),
+            func.count().over(partition_by=dia).label("n"),
+        )
+        .where(GeracaoGrade.segundos.is_not(None), *filtros)
+        .subquery()
+    )
+    percentis = select(
+        ordenados.c.dia,
+        *(
+            # nearest-rank: menor valor com posição >= p% de n
+            func.min(case((ordenados.c.pos * 100 >= p * ordenados.c.n, ordenados.c.segundos))).label(f"p{p}")
+            for p in (50, 90, 99)
+        ),
+    ).group_by(ordenados.c.dia)
+
+    with engine.connect() as con:
+        tempos = {r.dia: r for r in con.execute(percentis)}
+        dias = []
+        for r in con.execute(totais):
+            t = tempos.get(r.dia)
+            dias.append(
+                {
+                    "dia": r.dia,
+                    "total": r.total,
+                    "sucessos": r.sucessos,
+                    "taxa_sucesso": round(r.sucessos / r.total, 4) if r.total else None,
+                    "media_blocos_usados": (
+                        round(float(r.media_blocos_usados), 2)
+                        if r.media_blocos_usados is not None else None
+                    ),
+                    "segundos_p50": round(t.p50, 4) if t and t.p50 is not None else None,
+                    "segundos_p90": round(t.p90, 4) if t and t.p90 is not None else None,
+                    "segundos_p99": round(t.p99, 4) if t and t.p99 is not None else None,
+                }
+            )
+    return dias
+
+
 def salvar_geracao_grade(
     entrada: dict,
     resultado: dict | None = None,
     sucesso: bool = True,
     erro: str | None = None,
+    segundos: float | None = None,
 ):
-    db = SessionLocal()
-
-    try:
-        stats = {}
-        if isinstance(resultado, dict):
-            stats = resultado.get("stats", {}) or {}
+    """
+    Enfileira o registro no GRAVADOR_GERACOES (a resposta não espera o
+    banco). Devolve um Future com o id da GeracaoGrade (None se falhar).
+    """
+    stats = {}
+    if isinstance(resultado, dict):
+        stats = resultado.get("stats", {}) or {}
 
-        registro = GeracaoGrade(
+    return GRAVADOR_GERACOES.enfileirar(
+        dict(
             sucesso=sucesso,
             qtd_disciplinas=len(entrada.get("disciplinas", [])),
             qtd_restricoes=len(entrada.get("restricoes", [])),
@@ -1042,18 +1579,23 @@ def salvar_geracao_grade(
             total_ocorrencias=int(stats.get("total_ocorrencias", 0) or 0),
             ocorrencias_alocadas=int(stats.get("ocorrencias_alocadas", 0) or 0),
             erro=erro,
-            entrada_json=entrada,
-            resultado_json=resultado,
+            segundos=segundos,
+            entrada=entrada,
+            resultado=resultado,
         )
+    )
 
-        db.add(registro)
-        db.commit()
 
-    except Exception as e:
-        print("Erro ao salvar geração no banco:", e)
+@app.get("/admin/gravador")
+def estatisticas_gravador():
+    return GRAVADOR_GERACOES.estatisticas()
 
-    finally:
-        db.close()
+
+def _payloads_geracao(db, geracao: GeracaoGrade):
+    """(entrada, resultado) descomprimidos; gerações antigas têm o JSON na linha."""
+    if geracao.entrada_hash is None and geracao.resultado_hash is None:
+        return geracao.entrada_json, geracao.resultado_json
+    return payloads.carregar(db, geracao.entrada_hash), payloads.carregar(db, geracao.resultado_hash)
 
 
 @app.get("/admin/geracoes/{geracao_id}")
@@ -1066,6 +1608,7 @@ def obter_geracao(geracao_id: int):
         if not geracao:
             raise HTTPException(status_code=404, detail="Geração não encontrada")
 
+        entrada, resultado = _payloads_geracao(db, geracao)
         return {
             "id": geracao.id,
             "criado_em": geracao.criado_em,
@@ -1077,8 +1620,8 @@ def obter_geracao(geracao_id: int):
             "total_ocorrencias": geracao.total_ocorrencias,
             "ocorrencias_alocadas": geracao.ocorrencias_alocadas,
             "erro": geracao.erro,
-            "entrada_json": geracao.entrada_json,
-            "resultado_json": geracao.resultado_json,
+            "entrada_json": entrada,
+            "resultado_json": resultado,
         }
 
     finally:
@@ -1092,18 +1635,11 @@ def salvar_geracao_json(
     erro: str | None = None,
 ):
     try:
-        registros = []
-
-        if GERACOES_JSON.exists():
-            with GERACOES_JSON.open("r", encoding="utf-8") as f:
-                registros = json.load(f)
-
         stats = {}
         if isinstance(resultado, dict):
             stats = resultado.get("stats", {}) or {}
 
         registro = {
-            "id": len(registros) + 1,
             "criado_em": datetime.now().isoformat(),
             "sucesso": sucesso,
             "qtd_disciplinas": len(entrada.get("disciplinas", [])),
@@ -1117,52 +1653,128 @@ def salvar_geracao_json(
             "resultado_json": resultado,
         }
 
-        registros.append(registro)
-
-        with GERACOES_JSON.open("w", encoding="utf-8") as f:
-            json.dump(registros, f, ensure_ascii=False, indent=2)
+        GERACOES_LOG.anexar(registro)
 
     except Exception as e:
-        print("Erro ao salvar geração em JSON:", e)
+        log.error("Erro ao salvar geração em JSON: %s", e)
 
 
-@app.get("/admin/geracoes-json")
-def listar_geracoes_json():
-    if not GERACOES_JSON.exists():
-        return []
+def _stream_geracoes(desde_id, limite, formato):
+    """Registros do log como array JSON ("json") ou um por linha ("jsonl")."""
+    if formato == "jsonl":
+        for linha in GERACOES_LOG.linhas(desde_id, limite):
+            yield linha + b"\n"
+        return
+    yield b"["
+    primeiro = True
+    for linha in GERACOES_LOG.linhas(desde_id, limite):
+        yield (b"\n" if primeiro else b",\n") + linha
+        primeiro = False
+    yield b"\n]\n"
+
 
-    with GERACOES_JSON.open("r", encoding="utf-8") as f:
-        return json.load(f)
+@app.get("/admin/geracoes-json")
+def listar_geracoes_json(desde_id: int = 1, limite: Optional[int] = None):
+    """
+    Gerações do log append-only, em ordem de id, lidas em streaming (desde_id
+    pula direto para o registro pelo índice de offsets).
+    """
+    return StreamingResponse(
+        _stream_geracoes(max(1, desde_id), limite, "json"),
+        media_type="application/json",
+    )
 
 
 @app.get("/admin/geracoes-json/download")
-def baixar_geracoes_json():
-    if not GERACOES_JSON.exists():
+def baixar_geracoes_json(formato: Literal["json", "jsonl"] = "json"):
+    if GERACOES_LOG.total() == 0:
         raise HTTPException(
             status_code=404, detail="Arquivo de gerações não encontrado"
         )
 
-    return FileResponse(GERACOES_JSON, filename="geracoes.json")
+    return StreamingResponse(
+        _stream_geracoes(1, None, formato),
+        media_type="application/json" if formato == "json" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="geracoes.{formato}"'},
+    )
 
 
-from fastapi.responses import FileResponse
-from pathlib import Path
+@app.get("/admin/geracoes-log")
+def estatisticas_geracoes_log():
+    return GERACOES_LOG.estatisticas()
 
 
-@app.get("/admin/geracoes/{geracao_id}/xlsx")
-def baixar_xlsx_geracao(geracao_id: int):
+def _nao_modificado(request: Request, etag: str, mtime: float) -> bool:
+    """Pedido condicional satisfeito (If-None-Match tem precedência)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in etags or etag in etags or etag.removeprefix("W/") in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
 
-    pasta = Path("out")
 
-    arquivos = list(pasta.glob("*.xlsx"))
+@app.get("/admin/geracoes/{geracao_id}/xlsx")
+def baixar_xlsx_geracao(geracao_id: int, request: Request):
+    """
+    XLSX da geração, renderizado do resultado_json guardado no primeiro
+    pedido e servido do CACHE_XLSX_GERACOES depois, com ETag/Last-Modified
+    (If-None-Match / If-Modified-Since devolvem 304). Arquivo e ETag são
+    chaveados pelos hashes de entrada/resultado da linha, não só pelo id.
+    """
 
-    if not arquivos:
-        raise HTTPException(status_code=404, detail="Nenhum XLSX encontrado")
+    db = SessionLocal()
+    try:
+        geracao = db.query(GeracaoGrade).filter(GeracaoGrade.id == geracao_id).first()
+        if not geracao:
+            raise HTTPException(status_code=404, detail="Geração não encontrada")
+        if not geracao.sucesso:
+            raise HTTPException(status_code=404, detail="Geração sem resultado (falhou)")
+        payloads_carregados = None
+        if geracao.resultado_hash is not None:
+            versao = hashlib.sha256(
+                f"{geracao.entrada_hash}:{geracao.resultado_hash}".encode()
+            ).hexdigest()[:16]
+        else:  # geração antiga, JSON na linha: a versão vem do próprio conteúdo
+            payloads_carregados = _payloads_geracao(db, geracao)
+            versao = hashlib.sha256(payloads.canonico(payloads_carregados)).hexdigest()[:16]
+
+        def renderizar(caminho):
+            entrada, resultado = payloads_carregados or _payloads_geracao(db, geracao)
+            if not resultado:
+                raise HTTPException(status_code=404, detail="Geração sem resultado (falhou)")
+
+            alocacao = {str(k): int(v) for k, v in (resultado.get("alocacao") or {}).items()}
+            horarios = {int(k): str(v) for k, v in (resultado.get("horarios") or {}).items()}
+            nome_exib = resultado.get("nome_exibicao") or {k: k for k in alocacao}
+            semestre_por_disc = {
+                d["nome"]: str(d.get("semestre", "") or "").strip()
+                for d in (entrada or {}).get("disciplinas", [])
+            }
+            escrever_xlsx(caminho, montar_grade_visual(alocacao, horarios, nome_exib, semestre_por_disc))
 
-    arquivo_mais_recente = max(arquivos, key=lambda f: f.stat().st_mtime)
+        caminho = CACHE_XLSX_GERACOES.obter(geracao_id, versao, renderizar)
+    finally:
+        db.close()
+
+    st = caminho.stat()
+    headers = {
+        # do conteúdo da geração, não só do id (ids podem ser reaproveitados)
+        "ETag": f'W/"{geracao_id}-{versao}"',
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if _nao_modificado(request, headers["ETag"], st.st_mtime):
+        return Response(status_code=304, headers=headers)
 
     return FileResponse(
-        path=str(arquivo_mais_recente),
-        filename=arquivo_mais_recente.name,
+        path=caminho,
+        filename=f"geracao_{geracao_id}.xlsx",
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=headers,
     )
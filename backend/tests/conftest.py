@@ -0,0 +1,13 @@
+# conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# banco próprio dos testes; precisa estar no ambiente antes de importar
+# database/server (e é herdado pelos workers de jobs, que são spawn)
+_DIR = tempfile.mkdtemp(prefix="grade-testes-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DIR}/testes.db")
+os.environ.setdefault("JOBS_WORKERS", "1")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
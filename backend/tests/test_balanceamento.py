@@ -0,0 +1,21 @@
+# test_balanceamento.py
+import networkx as nx
+
+import grafo
+
+
+def test_ideal_considera_carga_fixa():
+    # 5 nós em 2 blocos com 4 fixos no bloco 0: o bloco 0 tem pelo menos
+    # 4 e o mais leve no máximo 2, então o limite é 2 (a média dá só 1)
+    g = nx.Graph()
+    g.add_nodes_from("abcde")
+    inst = grafo._preparar_instancia(g, 2, dict.fromkeys("abcd", 0), [], {}, False, True)
+
+    assert grafo._desbalanceamento_ideal(inst) == 2
+
+
+def test_ideal_sem_fixos_e_o_arredondamento_da_media():
+    g = nx.Graph()
+    g.add_nodes_from("abcde")
+    assert grafo._desbalanceamento_ideal(grafo._preparar_instancia(g, 2, {}, [], {}, False, True)) == 1
+    assert grafo._desbalanceamento_ideal(grafo._preparar_instancia(g, 5, {}, [], {}, False, True)) == 0
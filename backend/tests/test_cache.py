@@ -0,0 +1,44 @@
+# test_cache.py
+from datetime import datetime, timedelta, timezone
+
+from cache import CacheResultados
+from database import Base, SessionLocal, engine
+from models import CacheResultado
+
+Base.metadata.create_all(bind=engine)
+
+
+def _chaves():
+    db = SessionLocal()
+    try:
+        return {c for (c,) in db.query(CacheResultado.chave)}
+    finally:
+        db.close()
+
+
+def test_disco_limitado_mantem_os_lidos_recentemente():
+    cache = CacheResultados(max_itens=1, max_itens_disco=2, max_idade_s=0)
+    cache.limpar()
+    cache.obter_ou_calcular("a", lambda: {"v": 1})
+    cache.obter_ou_calcular("b", lambda: {"v": 2})
+    # "a" saiu da memória (max_itens=1): o hit vem do banco e renova acessado_em
+    assert cache.obter_ou_calcular("a", lambda: {"v": 0}) == ({"v": 1}, "disco")
+    cache.obter_ou_calcular("c", lambda: {"v": 3})
+
+    assert _chaves() == {"a", "c"}
+    assert cache.estatisticas()["removidos_disco"] == 1
+
+
+def test_disco_remove_o_que_passou_da_idade():
+    cache = CacheResultados(max_itens=1, max_itens_disco=0, max_idade_s=3600)
+    cache.limpar()
+    cache.obter_ou_calcular("velho", lambda: {"v": 1})
+    db = SessionLocal()
+    try:
+        db.get(CacheResultado, "velho").acessado_em = datetime.now(timezone.utc) - timedelta(hours=2)
+        db.commit()
+    finally:
+        db.close()
+    cache.obter_ou_calcular("novo", lambda: {"v": 2})
+
+    assert _chaves() == {"novo"}
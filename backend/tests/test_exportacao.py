@@ -0,0 +1,45 @@
+# test_exportacao.py
+import json
+import os
+import time
+
+from exportacao import CacheExportacoes
+
+
+def _gerar(csv, xlsx):
+    csv.write_text("a;b\n", encoding="utf-8")
+    xlsx.write_bytes(b"xlsx")
+
+
+def test_acesso_nao_regrava_o_indice(tmp_path):
+    cache = CacheExportacoes(tmp_path)
+    arquivos, origem = cache.obter_ou_exportar("k" * 64, "grade", _gerar)
+    assert origem == "gerado"
+    indice = tmp_path / ".exportacoes.json"
+    gravado = indice.stat().st_mtime_ns
+
+    assert cache.obter_ou_exportar("k" * 64, "grade", _gerar) == (arquivos, "cache")
+    cache.tocar(arquivos["csv"])
+    assert indice.stat().st_mtime_ns == gravado
+
+    acessado = cache._itens["k" * 64]["acessado_em"]
+    cache.salvar()
+    assert json.loads(indice.read_text(encoding="utf-8"))["k" * 64]["acessado_em"] == acessado
+
+
+def test_arquivos_fora_do_indice_aparecem_e_nao_somem_na_adocao(tmp_path):
+    antigo = tmp_path / "grade_antiga.xlsx"
+    antigo.write_bytes(b"xlsx")
+    velho = time.time() - 90 * 86400
+    os.utime(antigo, (velho, velho))
+
+    cache = CacheExportacoes(tmp_path, max_idade_s=30 * 86400)
+    assert antigo.exists()
+    assert cache.listar() == ["grade_antiga.xlsx"]
+
+    # a CLI grava direto em out/, depois do índice existir
+    (tmp_path / "alocacaohorario_5x4.csv").write_text("Dia;Hora\n", encoding="utf-8")
+    assert cache.listar() == ["alocacaohorario_5x4.csv", "grade_antiga.xlsx"]
+    assert "legado:alocacaohorario_5x4.csv" in json.loads(
+        (tmp_path / ".exportacoes.json").read_text(encoding="utf-8")
+    )
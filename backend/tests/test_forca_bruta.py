@@ -0,0 +1,116 @@
+# test_forca_bruta.py
+"""Motor contra enumeração de todas as alocações em instâncias minúsculas."""
+import itertools
+import random
+
+import networkx as nx
+
+import grafo
+
+
+def _instancias(n_casos, semente=7):
+    rng = random.Random(semente)
+    for _ in range(n_casos):
+        n = rng.randint(2, 6)
+        nb = rng.randint(2, 3)
+        nos = [f"n{i}" for i in range(n)]
+        g = nx.Graph()
+        g.add_nodes_from(nos)
+        for a, b in itertools.combinations(nos, 2):
+            if rng.random() < 0.45:
+                g.add_edge(a, b)
+        fixos = {no: rng.randrange(nb) for no in rng.sample(nos, rng.randint(0, 2))}
+        pares = [tuple(rng.sample(nos, 2)) for _ in range(rng.randint(0, 1))]
+        dominios = {no: rng.sample(range(nb), rng.randint(1, nb)) for no in rng.sample(nos, rng.randint(0, 2))}
+        yield g, nb, fixos, pares, dominios
+
+
+def _valida(g, nb, fixos, pares, dominios, cores):
+    return (
+        set(cores) == set(g.nodes)
+        and all(0 <= b < nb for b in cores.values())
+        and all(cores[a] != cores[b] for a, b in g.edges)
+        and all(cores[a] == cores[b] for a, b in pares)
+        and all(cores[no] == b for no, b in fixos.items())
+        and all(cores[no] in dom for no, dom in dominios.items())
+    )
+
+
+def _solucoes(g, nb, fixos, pares, dominios):
+    nos = list(g.nodes)
+    for blocos in itertools.product(range(nb), repeat=len(nos)):
+        cores = dict(zip(nos, blocos))
+        if _valida(g, nb, fixos, pares, dominios, cores):
+            yield cores
+
+
+def _instancia(g, nb, fixos, pares, dominios):
+    try:
+        return grafo._preparar_instancia(g, nb, dict(fixos), list(pares), dominios, False, True)
+    except ValueError:  # fixos/grupos que a validação já recusa
+        return None
+
+
+def test_busca_completa_acha_solucao_sse_ela_existe():
+    casos = 0
+    for g, nb, fixos, pares, dominios in _instancias(400):
+        inst = _instancia(g, nb, fixos, pares, dominios)
+        if inst is None:
+            continue
+        casos += 1
+        existe = next(_solucoes(g, nb, fixos, pares, dominios), None) is not None
+        stats = {}
+        estado = grafo._busca_completa(inst, [], {}, 10**6, 0, stats)
+
+        assert stats["busca_resultado"] == ("solucao" if existe else "inviavel")
+        if existe:
+            assert _valida(g, nb, fixos, pares, dominios, estado.cores())
+    assert casos > 200
+
+
+def _desbalanceamento(cores, nb):
+    carga = [0] * nb
+    for b in cores.values():
+        carga[b] += 1
+    return max(carga) - min(carga)
+
+
+def test_balanceamento_fica_entre_o_otimo_e_a_solucao_inicial():
+    casos = otimos = 0
+    for g, nb, fixos, pares, dominios in _instancias(400, semente=11):
+        inst = _instancia(g, nb, fixos, pares, dominios)
+        if inst is None:
+            continue
+        solucoes = list(_solucoes(g, nb, fixos, pares, dominios))
+        if not solucoes:
+            continue
+        casos += 1
+        otimo = min(_desbalanceamento(c, nb) for c in solucoes)
+        stats = {}
+        inicial = grafo._busca_completa(inst, [], {}, 10**6, 0, stats)
+        estado = grafo._balancear_busca_local(inst, inicial, 500, 0, 1, stats)
+        cores = estado.cores()
+
+        assert _valida(g, nb, fixos, pares, dominios, cores)
+        assert stats["desbalanceamento_final"] == _desbalanceamento(cores, nb)
+        assert grafo._desbalanceamento_ideal(inst) <= otimo <= stats["desbalanceamento_final"]
+        assert stats["desbalanceamento_final"] <= stats["desbalanceamento_inicial"]
+        otimos += stats["desbalanceamento_final"] == otimo
+    assert casos > 100
+    assert otimos >= 0.9 * casos
+
+
+def test_analise_de_inviabilidade_so_certifica_o_que_nao_tem_solucao():
+    certificados = 0
+    for g, nb, fixos, pares, dominios in _instancias(600, semente=23):
+        cliques = [({"origem": "clique", "chave": str(i)}, c)
+                   for i, c in enumerate(nx.find_cliques(g)) if len(c) > 1]
+        certs = grafo.analisar_inviabilidade(g, nb, fixos, pares, dominios, cliques)
+        existe = next(_solucoes(g, nb, fixos, pares, dominios), None) is not None
+
+        assert not (certs and existe), certs
+        # o que a validação do motor recusa a análise também aponta
+        if _instancia(g, nb, fixos, pares, dominios) is None:
+            assert certs
+        certificados += bool(certs)
+    assert certificados > 50
@@ -0,0 +1,34 @@
+# test_geracoes.py
+from fastapi.testclient import TestClient
+
+import server
+
+
+def _gerar(c, n):
+    dados = c.get("/dados/engcomp_2025_1").json()
+    entrada = {
+        "config": {"dias_semana": 5, "blocos_por_dia": 4, "usar_cache": False},
+        "disciplinas": dados["disciplinas"],
+        "restricoes": [r for r in dados["restricoes"] if r["tipo"]],
+    }
+    for _ in range(n):
+        assert c.post("/gerar-grade", json=entrada).status_code == 200
+    server.GRAVADOR_GERACOES.esvaziar()
+
+
+def test_paginacao_por_cursor_visivel_no_cors():
+    with TestClient(server.app) as c:
+        _gerar(c, 3)
+        vistos, cursor = [], None
+        while True:
+            params = {"limite": 2, **({"cursor": cursor} if cursor else {})}
+            r = c.get("/admin/geracoes", params=params, headers={"Origin": "http://front"})
+            assert r.status_code == 200
+            vistos += [g["id"] for g in r.json()]
+            cursor = r.headers.get("x-proximo-cursor")
+            if cursor is None:
+                break
+            assert "x-proximo-cursor" in r.headers["access-control-expose-headers"].lower()
+
+    assert len(vistos) >= 3
+    assert vistos == sorted(set(vistos), reverse=True)
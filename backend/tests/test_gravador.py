@@ -0,0 +1,42 @@
+# test_gravador.py
+from concurrent.futures import Future
+
+from database import Base, SessionLocal, engine
+from gravador import GravadorLotes
+from models import GeracaoGrade
+
+Base.metadata.create_all(bind=engine)
+
+
+def _preparar(db, campos):
+    if campos["erro"] == "ruim":
+        raise ValueError("registro inválido")
+    return campos
+
+
+def test_linha_ruim_nao_derruba_o_lote():
+    gravador = GravadorLotes(GeracaoGrade, preparar=_preparar)
+    lote = [({"sucesso": False, "erro": erro}, Future()) for erro in ("a", "ruim", "b", "c")]
+    gravador._gravar(lote)
+
+    ids = [fut.result(timeout=0) for _, fut in lote]
+    assert ids[1] is None and all(ids[i] is not None for i in (0, 2, 3))
+    db = SessionLocal()
+    try:
+        erros = {g.erro for g in db.query(GeracaoGrade).filter(GeracaoGrade.id.in_([ids[0], *ids[2:]]))}
+    finally:
+        db.close()
+    assert erros == {"a", "b", "c"}
+    stats = gravador.estatisticas()
+    assert (stats["gravados"], stats["falhas"], stats["reprocessados"]) == (3, 1, 4)
+
+
+def test_enfileirar_grava_e_devolve_o_id():
+    gravador = GravadorLotes(GeracaoGrade, max_lote=8)
+    futuros = [gravador.enfileirar({"sucesso": True, "erro": None}) for _ in range(20)]
+    gravador.esvaziar()
+    ids = [f.result(timeout=5) for f in futuros]
+    gravador.parar()
+
+    assert None not in ids and len(set(ids)) == 20
+    assert gravador.estatisticas()["gravados"] == 20
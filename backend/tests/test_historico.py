@@ -0,0 +1,65 @@
+# test_historico.py
+import json
+
+import pytest
+
+from historico import LogGeracoes, zstandard
+
+
+def _ids(log, **kw):
+    return [json.loads(linha)["id"] for linha in log.linhas(**kw)]
+
+
+@pytest.mark.parametrize("comprimir", [False, True])
+def test_rotacao_e_poda(tmp_path, comprimir):
+    if comprimir and zstandard is None:
+        pytest.skip("zstandard não instalado")
+    log = LogGeracoes(tmp_path, max_bytes=200, max_segmentos=2, comprimir=comprimir)
+    for i in range(30):
+        assert log.anexar({"n": i, "texto": "x" * 40}) == i + 1
+
+    segs = log._segmentos()
+    assert len(segs) == 2
+    assert len(list(tmp_path.glob("geracoes-*.jsonl*"))) == 2
+    assert log.total() == 30
+    restantes = _ids(log)
+    assert restantes == list(range(segs[0][0], 31))
+    assert [json.loads(linha)["n"] for linha in log.linhas()] == [i - 1 for i in restantes]
+
+
+def test_desde_id_e_limite(tmp_path):
+    log = LogGeracoes(tmp_path, max_bytes=300)
+    for i in range(20):
+        log.anexar({"n": i})
+    assert len(log._segmentos()) > 1
+
+    assert _ids(log, desde_id=7, limite=5) == [7, 8, 9, 10, 11]
+    assert _ids(log, desde_id=18) == [18, 19, 20]
+    assert _ids(log, desde_id=21) == []
+    assert _ids(log, limite=0) == []
+
+
+def test_sobra_sem_indice_e_truncada(tmp_path):
+    log = LogGeracoes(tmp_path)
+    log.anexar({"n": 1})
+    (idx,) = tmp_path.glob("*.idx")
+    dados = idx.with_suffix(".jsonl")
+    with dados.open("ab") as f:
+        f.write(b'{"id": 2, "n": "queda no meio')  # registro sem entrada no índice
+
+    assert log.anexar({"n": 2}) == 2
+    assert [json.loads(linha)["n"] for linha in log.linhas()] == [1, 2]
+    assert dados.read_bytes().count(b"\n") == 2
+
+
+def test_entrada_do_indice_pela_metade_e_truncada(tmp_path):
+    log = LogGeracoes(tmp_path)
+    log.anexar({"n": 1})
+    log.anexar({"n": 2})
+    (idx,) = tmp_path.glob("*.idx")
+    with idx.open("ab") as f:
+        f.write(b"\x01\x02\x03")  # queda no meio da escrita do índice
+
+    assert log.anexar({"n": 3}) == 3
+    assert idx.stat().st_size == 3 * 8
+    assert [json.loads(linha)["n"] for linha in log.linhas()] == [1, 2, 3]
@@ -0,0 +1,25 @@
+# test_inviabilidade.py
+import networkx as nx
+
+import grafo
+
+
+def test_fixo_herdado_pelo_grupo_conflita_com_vizinho():
+    # 'a' herda o bloco 1 de 'b' (mesmo grupo) e é vizinho de 'c', fixo em 1
+    g = nx.Graph()
+    g.add_nodes_from("abc")
+    g.add_edge("a", "c")
+    certs = grafo.analisar_inviabilidade(g, 3, fixos={"b": 1, "c": 1}, pares_mesmo=[("a", "b")])
+
+    assert [c["tipo"] for c in certs] == ["fixos_vizinhos"]
+    assert certs[0]["fixos"] == {"b": 1, "c": 1}
+    assert certs[0]["nos"] == ["a", "b", "c"]
+
+
+def test_fixos_vizinhos_diretos():
+    g = nx.Graph()
+    g.add_edge("a", "b")
+    certs = grafo.analisar_inviabilidade(g, 3, fixos={"a": 1, "b": 1})
+
+    assert [c["tipo"] for c in certs] == ["fixos_vizinhos"]
+    assert grafo.analisar_inviabilidade(g, 3, fixos={"a": 1, "b": 2}) == []
@@ -0,0 +1,40 @@
+# test_jobs.py
+import time
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def _esperar(c, job_id, limite_s=120):
+    fim = time.monotonic() + limite_s
+    while time.monotonic() < fim:
+        job = c.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("concluido", "falhou", "cancelado"):
+            return job
+        time.sleep(0.25)
+    raise AssertionError(f"job {job_id} não terminou em {limite_s}s")
+
+
+def test_job_com_portfolio_abre_pool_no_worker():
+    # o portfólio cria um ProcessPoolExecutor dentro do worker do job;
+    # com workers daemon isso falhava com "daemonic processes are not
+    # allowed to have children"
+    with TestClient(server.app) as c:
+        dados = c.get("/dados/engcomp_2025_1").json()
+        entrada = {
+            "config": {
+                "dias_semana": 5,
+                "blocos_por_dia": 4,
+                "usar_cache": False,
+                "portfolio_tentativas": 3,
+                "portfolio_trabalhadores": 2,
+            },
+            "disciplinas": dados["disciplinas"],
+            "restricoes": [r for r in dados["restricoes"] if r["tipo"]],
+        }
+        job = c.post("/jobs/gerar-grade", json=entrada).json()
+        job = _esperar(c, job["id"])
+
+    assert job["status"] == "concluido", job["erro"]
+    assert job["resultado"]["stats"]["portfolio_tentativas"] == 3
@@ -0,0 +1,42 @@
+# test_xlsx_geracoes.py
+from fastapi.testclient import TestClient
+
+import server
+from database import SessionLocal
+from models import GeracaoGrade
+
+
+def _gerar(c, dias):
+    dados = c.get("/dados/engcomp_2025_1").json()
+    entrada = {
+        "config": {"dias_semana": dias, "blocos_por_dia": 4, "usar_cache": False},
+        "disciplinas": dados["disciplinas"],
+        "restricoes": [r for r in dados["restricoes"] if r["tipo"]],
+    }
+    assert c.post("/gerar-grade", json=entrada).status_code == 200
+    server.GRAVADOR_GERACOES.esvaziar()
+    return c.get("/admin/geracoes", params={"limite": 1}).json()[0]["id"]
+
+
+def test_id_reaproveitado_nao_serve_xlsx_de_outra_geracao():
+    with TestClient(server.app) as c:
+        gid = _gerar(c, 5)
+        outra = _gerar(c, 6)
+        r = c.get(f"/admin/geracoes/{gid}/xlsx")
+        assert r.status_code == 200
+        etag = r.headers["etag"]
+        assert c.get(f"/admin/geracoes/{gid}/xlsx", headers={"If-None-Match": etag}).status_code == 304
+
+        # mesmo id, outro conteúdo (como num banco recriado)
+        db = SessionLocal()
+        try:
+            linha, nova = db.get(GeracaoGrade, gid), db.get(GeracaoGrade, outra)
+            linha.entrada_hash, linha.resultado_hash = nova.entrada_hash, nova.resultado_hash
+            db.commit()
+        finally:
+            db.close()
+
+        r2 = c.get(f"/admin/geracoes/{gid}/xlsx", headers={"If-None-Match": etag})
+        assert r2.status_code == 200
+        assert r2.headers["etag"] != etag
+        assert r2.content != r.content
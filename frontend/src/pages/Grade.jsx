@@ -45,6 +45,9 @@ export default function Grade() {
     }
 
     if (typeof detail === "string") return detail;
+    if (Array.isArray(detail?.certificados) && detail.certificados.length) {
+      return detail.certificados.map((c) => c.mensagem).join(" | ");
+    }
     if (detail && typeof detail === "object") return JSON.stringify(detail);
 
     return e?.message || "Erro ao gerar grade (verifique backend).";